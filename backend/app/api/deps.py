@@ -5,6 +5,7 @@ from jose import jwt, JWTError
 from pydantic import ValidationError
 from app.core.config import settings  # <--- Ensure this is imported
 from app.models.user import User
+from app.services.user_cache import get_active_user
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
@@ -34,9 +35,10 @@ async def get_current_user(token: str = Depends(reusable_oauth2)) -> User:
             detail="Could not validate credentials",
         )
         
-    user = await User.get(token_data)
+    # Cached: most requests don't touch Mongo just to find out who is asking
+    user = await get_active_user(token_data)
     
     if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=404, detail="User not found or inactive")
         
     return user
\ No newline at end of file
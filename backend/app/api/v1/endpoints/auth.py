@@ -1,10 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from app.schemas.user import UserCreate, UserResponse
 from app.models.user import User
-from app.core.security import get_password_hash
 from fastapi.security import OAuth2PasswordRequestForm 
 from app.schemas.user import UserCreate, UserResponse, Token
-from app.core.security import get_password_hash, verify_password, create_access_token
+from app.core.security import aget_password_hash, averify_password, create_access_token
 from typing import Any
 from datetime import timedelta
 from app.core.config import settings
@@ -25,7 +24,7 @@ async def create_user(user_in: UserCreate):
             detail="User with this email already exists"
         )
     
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await aget_password_hash(user_in.password)
     
     new_user = User(
         email=user_in.email,
@@ -48,7 +47,7 @@ async def login_access_token(
     """
     user = await User.find_one(User.email == form_data.username)
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await averify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password",
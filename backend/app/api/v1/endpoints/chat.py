@@ -1,29 +1,61 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from beanie import PydanticObjectId
 from app.api import deps
 from app.models.user import User
 from app.models.chat import Chat, Message
-from app.schemas.chat import ChatCreate, ChatResponse, MessageResponse
+from app.schemas.chat import ChatCreate, ChatResponse, ChatScope, MessageResponse
+from app.services.pagination import CURSOR_HEADER, encode_cursor, seek_filter
 
 router = APIRouter()
 
 # 1. GET ALL CHATS (For the Sidebar)
 @router.get("/", response_model=List[ChatResponse])
 async def get_chats(
+    response: Response,
     current_user: User = Depends(deps.get_current_user),
-    skip: int = 0,
-    limit: int = 50
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0, deprecated=True)
 ):
     """
-    Retrieve all chats for the current user.
-    Sorted by most recently updated.
+    Retrieve the current user's chats, most recently updated first.
+
+    Keyset pagination on (updated_at, _id): `before=<cursor>` returns older
+    chats, `after=<cursor>` newer ones. When more may follow, the
+    X-Next-Cursor header holds the cursor to pass (to the same parameter)
+    for the next page.
+
+    `skip` is still honoured for older clients (offset paging, applied after
+    any cursor), but it makes Mongo walk past every skipped chat: use cursors.
     """
-    chats = await Chat.find(Chat.user_id == current_user.id)\
-        .sort(-Chat.updated_at)\
+    filters = [Chat.user_id == current_user.id]
+    try:
+        if before:
+            filters.append(seek_filter("updated_at", before, "$lt"))
+        if after:
+            filters.append(seek_filter("updated_at", after, "$gt"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Reading towards newer chats walks the index upwards; flip the page afterwards
+    upwards = bool(after) and not before
+    order = (+Chat.updated_at, +Chat.id) if upwards else (-Chat.updated_at, -Chat.id)
+    chats = await Chat.find(*filters)\
+        .sort(*order)\
         .skip(skip)\
         .limit(limit)\
+        .project(ChatResponse)\
         .to_list()
+
+    if len(chats) == limit:
+        edge = chats[-1]
+        response.headers[CURSOR_HEADER] = encode_cursor(edge.updated_at, edge.id)
+    if upwards:
+        chats.reverse()
     return chats
 
 # 2. CREATE NEW CHAT (For the "New Chat" button)
@@ -37,7 +69,8 @@ async def create_chat(
     """
     chat = Chat(
         user_id=current_user.id,
-        title=chat_in.title
+        title=chat_in.title,
+        collections=chat_in.collections
     )
     await chat.insert()
     return chat
@@ -59,30 +92,108 @@ async def get_chat(
         
     return chat
 
+async def _get_owned_chat(chat_id: PydanticObjectId, current_user: User) -> Chat:
+    chat = await Chat.get(chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if chat.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return chat
+
+# 3b. SET DOCUMENT SCOPE (which collections the chat's questions search)
+@router.put("/{chat_id}/scope", response_model=ChatResponse)
+async def set_chat_scope(
+    chat_id: PydanticObjectId,
+    scope: ChatScope,
+    current_user: User = Depends(deps.get_current_user)
+):
+    """
+    Restricts retrieval for this chat to `collections` (null = everything).
+    An open websocket picks the new scope up when it reconnects.
+    """
+    chat = await _get_owned_chat(chat_id, current_user)
+    await chat.set({Chat.collections: scope.collections})
+    return chat
+
 # 4. GET MESSAGES (For the Main Window)
 @router.get("/{chat_id}/messages", response_model=List[MessageResponse])
 async def get_chat_history(
     chat_id: PydanticObjectId,
-    current_user: User = Depends(deps.get_current_user)
+    response: Response,
+    current_user: User = Depends(deps.get_current_user),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500)
 ):
     """
-    Get all messages for a specific chat.
+    Get a page of messages for a specific chat, oldest -> newest.
+
+    Without a cursor this is the latest `limit` messages. `before=<cursor>`
+    pages back through older messages, `after=<cursor>` forward through newer
+    ones; X-Next-Cursor (when present) continues in the same direction.
+    Use /export for the whole conversation.
     """
     # 1. Verify Chat Existence & Ownership first
-    chat = await Chat.get(chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
-    if chat.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-        
-    # 2. Fetch Messages
-    # Sort by timestamp ascending (oldest -> newest) so conversation flows correctly
-    messages = await Message.find(Message.chat_id == chat.id)\
-        .sort(+Message.timestamp)\
+    chat = await _get_owned_chat(chat_id, current_user)
+
+    # 2. Fetch one page via the (chat_id, timestamp, _id) index
+    filters = [Message.chat_id == chat.id]
+    try:
+        if before:
+            filters.append(seek_filter("timestamp", before, "$lt"))
+        if after:
+            filters.append(seek_filter("timestamp", after, "$gt"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    forwards = bool(after) and not before
+    order = (+Message.timestamp, +Message.id) if forwards else (-Message.timestamp, -Message.id)
+    messages = await Message.find(*filters)\
+        .sort(*order)\
+        .limit(limit)\
+        .project(MessageResponse)\
         .to_list()
-        
+
+    if len(messages) == limit:
+        edge = messages[-1]
+        response.headers[CURSOR_HEADER] = encode_cursor(edge.timestamp, edge.id)
+    # Sort by timestamp ascending (oldest -> newest) so conversation flows correctly
+    if not forwards:
+        messages.reverse()
     return messages
 
+# 4b. EXPORT MESSAGES (whole conversation, streamed)
+@router.get("/{chat_id}/export")
+async def export_chat(
+    chat_id: PydanticObjectId,
+    current_user: User = Depends(deps.get_current_user)
+):
+    """
+    Streams every message of a chat as NDJSON (one JSON object per line),
+    straight from a Mongo cursor: memory use doesn't grow with the chat.
+    """
+    chat = await _get_owned_chat(chat_id, current_user)
+
+    async def lines():
+        cursor = Message.get_motor_collection().find(
+            {"chat_id": chat.id},
+            projection={"_id": 1, "role": 1, "content": 1, "timestamp": 1},
+            sort=[("timestamp", 1), ("_id", 1)],
+        )
+        async for raw in cursor:
+            yield json.dumps({
+                "id": str(raw["_id"]),
+                "role": raw["role"],
+                "content": raw["content"],
+                "timestamp": raw["timestamp"].isoformat(),
+            }) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-{chat.id}.ndjson"'}
+    )
+
 # 5. DELETE CHAT
 @router.delete("/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_chat(
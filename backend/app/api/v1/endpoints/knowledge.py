@@ -1,45 +1,156 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+import asyncio
+import os
+import re
+from typing import List, Optional
+from fastapi import APIRouter, Request, Depends, HTTPException, status
+from beanie import PydanticObjectId
+from beanie.operators import In
+from starlette.concurrency import run_in_threadpool
 from app.api import deps
 from app.models.user import User
-from app.models.knowledge import DocumentItem
-from app.services.file_service import extract_text_from_pdf
-# Import the new simplified function
-from app.services.vector_service import add_document_to_knowledge_base 
+from app.models.knowledge import DocumentItem, IngestionJob
+from app.schemas.knowledge import COLLECTION_PATTERN, CollectionResponse, IngestionJobResponse
+from app.core.config import settings
+from app.services.file_service import spool_upload, UploadFormError, UploadTooLargeError
+from app.services.ingestion_service import IN_FLIGHT, fail_stale_jobs, ingestion_queue
+from app.services.segment_store import DEFAULT_COLLECTION
+from app.services.vector_service import get_index
 
 router = APIRouter()
 
-@router.post("/upload")
+# The body is parsed by spool_upload, so describe the form for the OpenAPI docs by hand
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "collection": {"type": "string", "pattern": COLLECTION_PATTERN, "default": DEFAULT_COLLECTION},
+            },
+        }}},
+    }
+}
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, openapi_extra=UPLOAD_FORM_SCHEMA)
 async def upload_document(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(deps.get_current_user)
 ):
-    if file.content_type != "application/pdf":
+    """
+    Queues a PDF (form field `file`) for background ingestion into `collection`
+    (the index shard chats can be scoped to) and returns immediately.
+    Poll GET /knowledge/jobs/{job_id} for progress.
+    """
+    # Stream to disk instead of `await file.read()`-ing the whole PDF into memory
+    try:
+        upload = await spool_upload(request, "file", settings.UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(413, detail=str(e))
+    except UploadFormError as e:
+        raise HTTPException(400, detail=str(e))
+    path, size, content_hash = upload.path, upload.size, upload.content_hash
+    collection = upload.fields.get("collection") or DEFAULT_COLLECTION
+
+    if upload.content_type != "application/pdf":
+        os.unlink(path)
         raise HTTPException(400, detail="Only PDF files are supported.")
+    if not re.fullmatch(COLLECTION_PATTERN, collection):
+        os.unlink(path)
+        raise HTTPException(422, detail=f"Invalid collection name: {collection!r}")
+    if size == 0:
+        os.unlink(path)
+        raise HTTPException(400, detail="Empty PDF")
+
+    # Same bytes already indexed (or on their way): nothing to parse or embed
+    same_file = [
+        DocumentItem.content_hash == content_hash,
+        DocumentItem.collection == collection,
+        In(DocumentItem.status, [*IN_FLIGHT, "indexed"])
+    ]
+    existing = await _find_same_file(same_file, current_user)
+    while existing and existing.status in IN_FLIGHT and await fail_stale_jobs(existing.id):
+        # Its worker died mid-way (the queue is per process): that copy will never finish
+        existing = await _find_same_file(same_file, current_user)
+    if existing:
+        os.unlink(path)
+        if existing.user_id != current_user.id:
+            # Someone else's upload: the chunks are shared, their document and job ids aren't
+            return {
+                "status": "already_indexed",
+                "filename": upload.filename,
+                "collection": collection,
+                "duplicate": True
+            }
+        return {
+            "status": existing.status,
+            "filename": upload.filename,
+            "document_id": str(existing.id),
+            "collection": collection,
+            "duplicate": True
+        }
+
+    # 1. Save Record to Mongo (Just for record-keeping)
+    doc = DocumentItem(
+        user_id=current_user.id,
+        filename=upload.filename,
+        file_type=upload.content_type,
+        file_size=size,
+        content="[Content Indexed in FAISS]", # Save space in Mongo
+        status="pending",
+        content_hash=content_hash,
+        collection=collection
+    )
+    await doc.insert()
+
+    # 2. Enqueue (parsing + embedding happen on the ingestion worker pool)
+    job = IngestionJob(document_id=doc.id, user_id=current_user.id)
+    await job.insert()
 
     try:
-        # 1. Extract Text
-        content = await file.read()
-        text_content = await extract_text_from_pdf(content)
-        
-        if not text_content.strip():
-            raise HTTPException(400, detail="Empty PDF")
-
-        # 2. Add to LangChain/FAISS Index
-        add_document_to_knowledge_base(text_content)
-
-        # 3. Save Record to Mongo (Just for record-keeping)
-        doc = DocumentItem(
-            user_id=current_user.id,
-            filename=file.filename,
-            file_type=file.content_type,
-            file_size=len(content),
-            content="[Content Indexed in FAISS]", # Save space in Mongo
-            status="indexed"
-        )
-        await doc.insert()
-
-        return {"status": "success", "filename": file.filename}
-
-    except Exception as e:
-        print(f"Error: {e}")
-        raise HTTPException(500, detail=str(e))
\ No newline at end of file
+        ingestion_queue.submit(job, path)
+    except asyncio.QueueFull:
+        os.unlink(path)
+        await job.set({IngestionJob.status: "failed", IngestionJob.error: "Ingestion queue is full"})
+        await doc.set({DocumentItem.status: "failed"})
+        raise HTTPException(503, detail="Too many uploads in progress, please retry shortly.")
+
+    return {
+        "status": "pending",
+        "filename": upload.filename,
+        "document_id": str(doc.id),
+        "job_id": str(job.id),
+        "collection": collection,
+        "duplicate": False
+    }
+
+async def _find_same_file(same_file: list, current_user: User) -> Optional[DocumentItem]:
+    """The caller's own copy if there is one, else anyone's."""
+    return await DocumentItem.find_one(*same_file, DocumentItem.user_id == current_user.id) \
+        or await DocumentItem.find_one(*same_file)
+
+@router.get("/collections", response_model=List[CollectionResponse])
+async def list_collections(current_user: User = Depends(deps.get_current_user)):
+    """Collections in the live index, for picking a chat's document scope."""
+    # The first call may load the index from disk: keep that off the event loop
+    counts = (await run_in_threadpool(get_index)).collections()
+    return [CollectionResponse(name=name, chunks=chunks) for name, chunks in sorted(counts.items())]
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_ingestion_job(
+    job_id: PydanticObjectId,
+    current_user: User = Depends(deps.get_current_user)
+):
+    job = await IngestionJob.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # Jobs running in this process have fresher counters than the last flush
+    live = ingestion_queue.live.get(job.id)
+    if live:
+        job = job.model_copy(update=live.as_update())
+
+    return job
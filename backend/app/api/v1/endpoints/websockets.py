@@ -1,3 +1,4 @@
+import time
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
 from typing import Optional
 from beanie import PydanticObjectId
@@ -5,7 +6,13 @@ from beanie import PydanticObjectId
 from app.api import deps
 from app.models.user import User
 from app.models.chat import Chat, Message, RoleEnum
-from app.services.llm_service import generate_response
+from app.services.llm_service import stream_response
+from app.services.llm_scheduler import LLMError
+from app.services.chat_session import ChatSession
+from app.services.user_cache import get_active_user
+from app.services.history_service import estimate_tokens
+from app.core import metrics
+from app.core.metrics import trace
 from app.core.config import settings
 from jose import jwt, JWTError
 
@@ -20,7 +27,7 @@ async def get_user_from_token(token: str) -> Optional[User]:
         token_data = payload.get("sub")
         if token_data is None:
             return None
-        return await User.get(token_data)
+        return await get_active_user(token_data)
     except JWTError:
         return None
 
@@ -46,52 +53,106 @@ async def websocket_endpoint(
 
     # 3. ACCEPT CONNECTION
     await websocket.accept()
-    
+    metrics.active_websockets.inc()
+
+    # Recent history is read once here and then kept in memory for the connection
+    session = ChatSession(chat)
     try:
+        await session.load()
+
         while True:
             # 4. RECEIVE USER MESSAGE
             data = await websocket.receive_text()
+            with trace("chat_turn", chat_id=str(chat.id)):
+                await _answer_turn(websocket, session, data)
             
-            # 5. SAVE USER MESSAGE TO DB
-            user_msg = Message(
-                chat_id=chat.id,
-                role=RoleEnum.user,
-                content=data
-            )
-            await user_msg.insert()
-            
+    except WebSocketDisconnect:
+        print(f"User {user.email} disconnected from chat {chat_id}")
+    finally:
+        metrics.active_websockets.dec()
+        await session.close()
 
-            history = await Message.find(Message.chat_id == chat.id)\
-                .sort(+Message.timestamp)\
-                .limit(10)\
-                .to_list()
 
-            # 6. TRIGGER AI (The "Brain")
-            # In the future, we will fetch history here to pass context
+async def _answer_turn(websocket: WebSocket, session: ChatSession, data: str):
+    chat = session.chat
+    user_msg = Message(
+        chat_id=chat.id,
+        role=RoleEnum.user,
+        content=data
+    )
 
-            previous_history = [m for m in history if m.id != user_msg.id]
+    # 5. RECENT HISTORY (newest messages that fit the token budget, plus the rolling summary)
+    previous_history = session.history()
+    prompt_tokens = {}
+    details = {}
 
-            ai_text = await generate_response(data, previous_history)
-            
-            # 7. SAVE AI MESSAGE TO DB
-            ai_msg = Message(
-                chat_id=chat.id,
-                role=RoleEnum.assistant,
-                content=ai_text
-            )
-            await ai_msg.insert()
-            
-            # 8. UPDATE CHAT "UPDATED_AT"
-            chat.title = data[:30] + "..." if chat.title == "New Chat" else chat.title
-            await chat.save()
+    # 6. TRIGGER AI (The "Brain")
+    # Stream tokens to the browser as they arrive; persist once at the end
+    started = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    try:
+        async for delta in stream_response(data, previous_history, session.summary, prompt_tokens, details,
+                                         chat.collections):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            parts.append(delta)
+            await websocket.send_json({"type": "delta", "content": delta})
+    except LLMError as e:
+        # Rate limited / Groq down: tell the client and keep the connection open
+        metrics.turns_total.inc(outcome="llm_error")
+        print(f"⚠️ Chat {chat.id}: {e}")
+        await session.record_turn(user_msg, None)
+        await websocket.send_json({
+            "type": "error",
+            "code": e.code,
+            "message": str(e),
+            "retry_after": e.retry_after
+        })
+        return
+    except Exception:
+        metrics.turns_total.inc(outcome="error")
+        # Keep the question in the transcript even though there's no answer
+        await session.record_turn(user_msg, None)
+        raise
 
-            # 9. SEND RESPONSE TO FRONTEND
-            # We send a JSON structure so the frontend knows who sent it
-            await websocket.send_json({
-                "role": "assistant",
-                "content": ai_text,
-                "timestamp": ai_msg.timestamp.isoformat()
-            })
-            
-    except WebSocketDisconnect:
-        print(f"User {user.email} disconnected from chat {chat_id}")
\ No newline at end of file
+    ai_text = "".join(parts)
+    latency_ms = (time.perf_counter() - started) * 1000
+    if ttft_ms is None:  # Empty answer: nothing was streamed
+        ttft_ms = latency_ms
+    cached = details.get("cached", False)
+    print(f"⏱️ Chat {chat.id}: first token {ttft_ms:.0f} ms, full answer {latency_ms:.0f} ms"
+          f"{' (cached)' if cached else ''}")
+    # "folded": tokens of old turns the summary stands in for (the saving)
+    prompt_tokens["folded"] = chat.summary_source_tokens
+    print(f"🧮 Chat {chat.id}: prompt tokens ≈ {prompt_tokens}")
+
+    metrics.turns_total.inc(outcome="cached" if cached else "ok")
+    metrics.ttft_seconds.observe(ttft_ms / 1000)
+    metrics.turn_seconds.observe(latency_ms / 1000)
+    if not cached:  # A replayed answer cost no LLM tokens
+        metrics.completion_tokens.inc(estimate_tokens(ai_text))
+    for section, tokens in prompt_tokens.items():
+        if section != "folded":
+            metrics.prompt_tokens.inc(tokens, section=section)
+    
+    # 7. SAVE BOTH MESSAGES (one insert_many) AND BUMP CHAT "UPDATED_AT" ($set, not a full save)
+    ai_msg = Message(
+        chat_id=chat.id,
+        role=RoleEnum.assistant,
+        content=ai_text,
+        prompt_tokens=prompt_tokens
+    )
+    await session.record_turn(user_msg, ai_msg)
+
+    # 8. SEND FINAL FRAME TO FRONTEND
+    # Carries the full text so clients that ignore deltas still work
+    await websocket.send_json({
+        "type": "final",
+        "role": "assistant",
+        "content": ai_text,
+        "cached": cached,
+        "timestamp": ai_msg.timestamp.isoformat(),
+        "ttft_ms": round(ttft_ms),
+        "latency_ms": round(latency_ms)
+    })
@@ -13,9 +13,92 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "CHANGE_THIS_IN_PROD_TO_A_LONG_RANDOM_STRING"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    USER_CACHE_SIZE: int = 10_000      # Active users kept in memory for token -> user lookups
+    USER_CACHE_TTL_SECONDS: int = 60   # Bounds staleness across workers (in-process saves invalidate at once)
+    BCRYPT_THREADS: int = 2            # Concurrent hash/verify calls; the rest queue off the event loop
 
+    # Vector Index
+    INDEX_PATH: str = "faiss_index"
+    INDEX_COMPACTION_MAX_SEGMENTS: int = 8        # Compact once this many small segments pile up
+    INDEX_COMPACTION_MAX_SEGMENT_SIZE: int = 50_000  # Segments with more vectors are left alone
+    INDEX_RETIRED_SEGMENT_GRACE_SECONDS: int = 300   # Keep merged-away segments around for other workers
+    INDEX_MMAP: bool = True            # Memory-map segments so workers share one page-cache copy
+    INDEX_WATCH_INTERVAL_SECONDS: float = 1.0     # How often to look for versions other workers published (0 = never)
+    INDEX_TYPE: str = "flat"           # flat | hnsw | ivfpq (used for compacted/rebuilt segments)
+    INDEX_HNSW_M: int = 32
+    INDEX_HNSW_EF_CONSTRUCTION: int = 80
+    INDEX_HNSW_EF_SEARCH: int = 64     # Higher = better recall, slower queries
+    INDEX_IVF_NLIST: int = 1024        # Upper bound; small segments use fewer lists
+    INDEX_IVF_NPROBE: int = 16         # Lists scanned per query
+    INDEX_PQ_M: int = 48               # Sub-quantizers (must divide the embedding dim; adjusted if not)
+    INDEX_PQ_NBITS: int = 8
+
+    # Embedding Model
+    EMBEDDING_BACKEND: str = "torch"   # torch | onnx (int8, CPU; export with scripts/export_onnx_model.py)
+    EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_ONNX_PATH: str = "models/all-MiniLM-L6-v2-onnx"  # Directory with model.int8.onnx + tokenizer.json
+    EMBEDDING_ONNX_THREADS: int = 0    # ONNX Runtime intra-op threads (0 = one per core)
+    EMBEDDING_MAX_LENGTH: int = 256    # Tokens per text, as in the sentence-transformers config
+    # Run once at startup (after the model and index load) so the first real
+    # question doesn't pay for lazy initialisation (embedded directly, so a
+    # citation here still exercises the model). Empty = skip; /ready waits for it.
+    WARMUP_QUERY: str = "What does Section 22 of the Chartered Accountants Act cover?"
+
+    # Embedding Micro-batching
+    EMBED_MAX_BATCH_SIZE: int = 32     # Texts per model call
+    EMBED_MAX_WAIT_MS: float = 5.0     # How long the first request waits for company
+    EMBED_MAX_QUEUE: int = 1024        # Requests allowed to wait before callers are back-pressured
+
+    # Query Embedding Cache
+    QUERY_CACHE_SIZE: int = 2048
+    QUERY_CACHE_TTL_SECONDS: int = 3600
+    QUERY_CACHE_SHARED_PATH: str | None = None  # SQLite file shared by workers on one host (None = per-process only)
+    QUERY_CACHE_SHARED_MAX_ROWS: int = 50_000
+
+    # Answer Cache (final answers to history-free questions; cleared when the index version changes)
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+
+    # RAG Pipeline
+    HYBRID_CANDIDATES: int = 20        # Hits taken from each of dense / BM25 before rank fusion
+    HYBRID_RRF_K: int = 60             # Reciprocal-rank-fusion damping constant
+    SPECULATIVE_RETRIEVAL_MIN_SIMILARITY: float = 0.9  # Keep raw-input hits if the rewrite embeds this close
+
+    # Chat History
+    HISTORY_TOKEN_BUDGET: int = 1500   # Approx. tokens of past messages sent with each prompt
+    HISTORY_MAX_MESSAGES: int = 50     # Hard cap on messages read per turn, whatever their size
+    SUMMARY_TRIGGER_TOKENS: int = 1200 # Unsummarized history above this is folded into the chat summary
+    SUMMARY_KEEP_TOKENS: int = 500     # Newest history left verbatim after folding
+
+    # Ingestion Queue
+    INGEST_WORKERS: int = 2            # Uploads processed concurrently (threads doing parse + embed)
+    INGEST_QUEUE_MAX: int = 32         # Uploads waiting beyond this are rejected with 503
+    INGEST_PROGRESS_INTERVAL: float = 1.0  # Seconds between progress flushes to Mongo
+    INGEST_STALE_JOB_SECONDS: int = 120    # Pending/processing jobs without a heartbeat this long are failed
+
+    # Uploads
+    UPLOAD_MAX_BYTES: int = 50 * 1024 * 1024  # Larger PDFs get a 413 (from Content-Length, else mid-stream)
+    UPLOAD_SPOOL_DIR: str | None = None       # Temp dir for spooled uploads (None = system default)
+    PDF_EXTRACT_PROCESSES: int = 2            # Processes extracting page text in parallel
+    PDF_PAGES_PER_TASK: int = 8               # Pages handed to a process at a time
+
+    # Observability
+    METRICS_ENABLED: bool = True       # Stage timings, counters and /metrics
+    METRICS_TRACE_LOG: bool = False    # Also log one JSON line of stage timings per chat turn
+
+    # LLM Scheduler (limits are per model; defaults match Groq's free tier for llama-3.1-8b-instant)
+    LLM_MODEL_NAME: str = "llama-3.1-8b-instant"
+    LLM_MAX_CONCURRENCY: int = 4           # Groq calls in flight per worker
+    LLM_REQUESTS_PER_MINUTE: int = 30      # 0 = unlimited
+    LLM_TOKENS_PER_MINUTE: int = 6000      # Prompt + expected completion tokens; 0 = unlimited
+    LLM_MAX_QUEUE: int = 100               # Calls waiting beyond this fail fast with "busy"
+    LLM_MAX_QUEUE_WAIT_SECONDS: float = 30.0
+    LLM_MAX_RETRIES: int = 3               # On 429 / 5xx / connection errors, before the first token
+    LLM_BACKOFF_MAX_SECONDS: float = 20.0
 
     GROQ_API_KEY: str
+    GROQ_API_BASE: str | None = None       # Point at a local fake endpoint (benchmarks.fake_groq)
     GOOGLE_API_KEY: str | None = None
 
     class Config:
@@ -0,0 +1,241 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+
+from app.core.config import settings
+
+# Small, dependency-free metrics layer rendered in the Prometheus text format.
+#
+# - Counter / Gauge / Histogram: labelled, thread-safe (ingestion threads record too).
+# - span("stage"): times a block into the `stage_seconds` histogram and, when
+#   settings.METRICS_TRACE_LOG is on, into the current request's trace.
+# - trace("chat_turn", ...): collects the spans of one request and prints them
+#   as a single JSON line when the request ends.
+# With settings.METRICS_ENABLED off, span() and trace() return a shared no-op
+# and recording calls return immediately.
+
+_NOOP = nullcontext()
+
+# Latency buckets (seconds): 1 ms .. 60 s, enough for both FAISS and Groq
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Collected(_Metric):
+    """Values read at scrape time from an existing stats() dict (batcher, caches...)."""
+
+    def __init__(self, name: str, help: str, kind: str, read: Callable[[], float]):
+        self.kind = kind
+        self.read = read
+        super().__init__(name, help)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name} {_fmt(self.read())}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # A broken collector must not take /metrics down
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def collect_stats(prefix: str, help: str, stats: Callable[[], dict], counters: tuple = (), gauges: tuple = ()):
+    """Exposes selected keys of a `stats()` dict as `<prefix>_<key>` metrics."""
+    for key in counters:
+        Collected(f"{prefix}_{key}", f"{help} ({key})", "counter", lambda key=key: stats()[key])
+    for key in gauges:
+        Collected(f"{prefix}_{key}", f"{help} ({key})", "gauge", lambda key=key: stats()[key])
+
+
+# --- Chat / RAG pipeline metrics ---
+
+stage_seconds = Histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat turn", labelnames=("stage",)
+)
+ttft_seconds = Histogram("chat_ttft_seconds", "Time from receiving a question to the first answer token")
+turn_seconds = Histogram("chat_turn_seconds", "Time from receiving a question to the complete answer")
+prompt_tokens = Counter(
+    "chat_prompt_tokens_total", "Approx. prompt tokens sent to the LLM, by prompt section", labelnames=("section",)
+)
+completion_tokens = Counter("chat_completion_tokens_total", "Approx. answer tokens received from the LLM")
+turns_total = Counter("chat_turns_total", "Chat turns, by outcome", labelnames=("outcome",))
+active_websockets = Gauge("chat_active_websockets", "Open chat websocket connections")
+llm_queue_wait_seconds = Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited in the scheduler for a slot", labelnames=("priority",)
+)
+
+
+# --- Spans and per-request traces ---
+
+_current_trace: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def _span(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        current = _current_trace.get()
+        if current is not None:
+            current["stages"].setdefault(stage, []).append(round(elapsed * 1000, 2))
+
+
+def span(stage: str):
+    """Times a block of a chat turn: `with span("rewrite"): ...` (works inside async code too)."""
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _span(stage)
+
+
+@contextmanager
+def _trace(kind: str, fields: dict) -> Iterator[dict]:
+    current = {"trace": kind, **fields, "stages": {}}
+    token = _current_trace.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        current["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        print(json.dumps(current, default=str))
+
+
+def trace(kind: str, **fields):
+    """
+    Collects the spans of one request and logs them as one JSON line at the end.
+    Only active with settings.METRICS_TRACE_LOG; otherwise a no-op.
+    """
+    if not (settings.METRICS_ENABLED and settings.METRICS_TRACE_LOG):
+        return _NOOP
+    return _trace(kind, fields)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Any, Union
 from jose import jwt
@@ -16,6 +18,18 @@ def get_password_hash(password: str) -> str:
     """Turns a raw password into a secure hash."""
     return pwd_context.hash(password)
 
+# bcrypt is deliberately slow (~100s of ms of CPU). Run it on its own small
+# pool so a burst of logins queues there instead of freezing every chat.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=settings.BCRYPT_THREADS, thread_name_prefix="bcrypt")
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, verify_password, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, get_password_hash, password)
+
 # 2. JWT Token Generation
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     """Creates the digital badge (JWT) the user holds."""
@@ -1,15 +1,21 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from app.core.config import settings
-from app.models.knowledge import DocumentItem, EmbeddingChunk
+from app.models.knowledge import DocumentItem, EmbeddingChunk, IngestionJob
 # Import your models here later so Beanie knows about them
 from app.models.user import User
 from app.models.chat import Chat, Message
 
 
-async def init_db():
+_client: AsyncIOMotorClient | None = None
+
+
+async def init_db(client: AsyncIOMotorClient | None = None):
+    """`client` overrides MONGO_URI (benchmarks pass an in-memory mongomock-motor client)."""
+    global _client
     # 1. Create the Motor Client (Async)
-    client = AsyncIOMotorClient(settings.MONGO_URI)
+    client = _client = client or AsyncIOMotorClient(settings.MONGO_URI)
     
     # 2. Select the Database
     database = client[settings.DB_NAME]
@@ -23,8 +29,20 @@ async def init_db():
             Chat,
             Message,
             DocumentItem,
-            EmbeddingChunk
+            EmbeddingChunk,
+            IngestionJob
         ]
     )
     
-    print(f"✅ Connected to MongoDB: {settings.DB_NAME}")
\ No newline at end of file
+    print(f"✅ Connected to MongoDB: {settings.DB_NAME}")
+
+
+async def ping_db(timeout: float = 2.0) -> bool:
+    """Round trip to Mongo; False if not initialised, unreachable or too slow."""
+    if _client is None:
+        return False
+    try:
+        await asyncio.wait_for(_client.admin.command("ping"), timeout=timeout)
+        return True
+    except Exception:
+        return False
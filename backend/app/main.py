@@ -1,8 +1,16 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from app.db.client import init_db
+from fastapi import FastAPI, Response
+from fastapi.responses import PlainTextResponse
+from app.db.client import init_db, ping_db
 from app.core.config import settings
 from app.api.v1.api import api_router
+from app.services.ingestion_service import fail_stale_jobs, ingestion_queue
+from app.services.file_service import shutdown_page_pool
+from app.services.vector_service import embedding_batcher, query_embedder
+from app.services.llm_service import answer_cache, llm_scheduler
+from app.services.warmup import warmup
+from app.services.user_cache import user_cache
+from app.core import metrics
 from fastapi.middleware.cors import CORSMiddleware
 
 @asynccontextmanager
@@ -10,11 +18,21 @@ async def lifespan(app: FastAPI):
     # --- STARTUP LOGIC ---
     print("🚀 Starting application...")
     await init_db()
+    embedding_batcher.start()
+    # Uploads a crashed worker was holding would otherwise stay pending forever
+    await fail_stale_jobs()
+    ingestion_queue.start()
+    # Model + index load in the background; /ready flips once they're in
+    warmup.start()
     
     yield # The application runs here
     
     # --- SHUTDOWN LOGIC ---
     print("🛑 Shutting down...")
+    await warmup.stop()
+    await ingestion_queue.stop()
+    shutdown_page_pool()
+    await embedding_batcher.stop()
     # Close connections if necessary (Motor handles this well automatically, but good to know)
 
 app = FastAPI(
@@ -28,10 +46,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Keyset pagination cursor (chats, messages)
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Existing stats() counters, read at scrape time
+metrics.collect_stats(
+    "embedding", "Embedding micro-batcher", embedding_batcher.stats,
+    counters=("batches_total", "texts_total", "queue_wait_seconds_total"),
+    gauges=("queue_depth", "last_batch_size"),
+)
+metrics.collect_stats(
+    "query_embedding_cache", "Query embedding cache", query_embedder.stats,
+    counters=("hits", "misses"), gauges=("size",),
+)
+metrics.collect_stats(
+    "llm_scheduler", "LLM call scheduler", llm_scheduler.stats,
+    counters=("calls_total", "coalesced_total", "retries_total", "rate_limited_total", "queue_wait_seconds_total"),
+    gauges=("queue_depth", "active"),
+)
+metrics.collect_stats(
+    "answer_cache", "Answer cache", answer_cache.stats,
+    counters=("hits", "misses", "invalidations"), gauges=("size", "version"),
+)
+metrics.collect_stats(
+    "user_cache", "Token -> user cache", user_cache.stats,
+    counters=("hits", "misses"), gauges=("size",),
+)
+
 @app.get("/")
 async def health_check():
-    return {"status": "ok", "db": "connected"}
\ No newline at end of file
+    # Liveness: the process is up. See /ready for whether it can answer questions.
+    return {
+        "status": "ok",
+        "embedding": embedding_batcher.stats(),
+        "query_cache": query_embedder.stats(),
+        "llm": llm_scheduler.stats(),
+        "answer_cache": answer_cache.stats()
+    }
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness: DB reachable, embedding model and index loaded.
+    503 until then, so a load balancer can keep traffic on warm workers.
+    """
+    db_ok = await ping_db()
+    ready = db_ok and warmup.ready
+    response.status_code = 200 if ready else 503
+    return {
+        "ready": ready,
+        "db": "ok" if db_ok else "unreachable",
+        **warmup.report()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
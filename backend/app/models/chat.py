@@ -1,5 +1,6 @@
 from beanie import Document, PydanticObjectId
-from pydantic import Field
+from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from datetime import datetime
 from typing import Optional
 from enum import Enum
@@ -15,9 +16,19 @@ class Chat(Document):
     title: str = "New Chat"
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Rolling summary of older turns, sent to the LLM instead of those turns
+    summary: Optional[str] = None
+    summary_until: Optional[datetime] = None  # Timestamp of the last message folded into `summary`
+    summary_source_tokens: int = 0            # Approx. tokens of the messages it replaces
+    # Document scope: collections retrieval may search (None = the whole knowledge base)
+    collections: Optional[list[str]] = None
 
     class Settings:
         name = "chats"
+        # Sidebar: a user's chats, most recently updated first (keyset-paginated)
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)])
+        ]
         
     async def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
@@ -29,11 +40,21 @@ class Message(Document):
     role: RoleEnum            # Who said it?
     content: str              # The text (or JSON for complex tool use)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    # Assistant messages: approx. prompt tokens per section (summary/history/context/input)
+    prompt_tokens: Optional[dict[str, int]] = None
 
     class Settings:
         name = "messages"
-        # We index chat_id because we will frequently ask:
-        # "Give me all messages for Chat X sorted by time"
+        # We frequently ask "give me the messages of Chat X sorted by time"
+        # (newest first, for the prompt). The compound index serves both the
+        # filter and the sort, and also covers plain chat_id lookups.
+        # _id breaks ties: a question and its answer can share a millisecond.
         indexes = [
-            "chat_id"
-        ]
\ No newline at end of file
+            IndexModel([("chat_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+        ]
+
+# 3. What the prompt needs from a message (projection, skips _id/chat_id)
+class MessageContent(BaseModel):
+    role: RoleEnum
+    content: str
+    timestamp: datetime
\ No newline at end of file
@@ -1,7 +1,9 @@
 from beanie import Document, PydanticObjectId
+from pymongo import IndexModel, ASCENDING
 from pydantic import Field
 from datetime import datetime
 from typing import Optional, List
+import numpy as np
 
 class DocumentItem(Document):
     user_id: PydanticObjectId
@@ -10,13 +12,68 @@ class DocumentItem(Document):
     content: str            # The extracted text lives here
     file_size: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    status: str = "pending" # pending -> processing -> indexed
+    status: str = "pending" # pending -> processing -> indexed / failed
+    content_hash: Optional[str] = None  # sha256 of the uploaded file, used to skip re-uploads
+    collection: str = "default"         # Index shard the chunks go to (segment_store.DEFAULT_COLLECTION)
+
+    class Settings:
+        indexes = [
+            "content_hash",
+            "collection"
+        ]
 
 class EmbeddingChunk(Document):
+    """
+    Durable copy of every indexed chunk, so the FAISS index can be rebuilt
+    (or switched to another index type) without re-parsing or re-embedding.
+    """
     document_id: PydanticObjectId  # Link to the parent PDF
     chunk_index: int               # Order (0, 1, 2...)
     text: str                      # The actual paragraph content
-    vector: List[float]
+    content_hash: str              # sha256 of the normalized text (see vector_service.chunk_hash)
+    page: Optional[int] = None     # Page the chunk starts on (1-based); None for chunks stored before pages were tracked
+    vector: bytes                  # float32, little-endian: 4 * dim bytes instead of a BSON array of doubles
+    dim: int
+
+    class Settings:
+        name = "embedding_chunks"
+        # (document_id, chunk_index) serves per-document lookups and the rebuild
+        # script's ordered scan without an in-memory sort
+        indexes = [
+            "content_hash",
+            IndexModel([("document_id", ASCENDING), ("chunk_index", ASCENDING)])
+        ]
+
+    @classmethod
+    def from_vector(cls, document_id: PydanticObjectId, chunk_index: int, text: str,
+                    content_hash: str, vector: List[float], page: Optional[int] = None) -> "EmbeddingChunk":
+        packed = np.asarray(vector, dtype="<f4")
+        return cls(document_id=document_id, chunk_index=chunk_index, text=text, content_hash=content_hash,
+                   page=page, vector=packed.tobytes(), dim=packed.shape[0])
+
+    def as_array(self) -> np.ndarray:
+        return np.frombuffer(self.vector, dtype="<f4")
+
+class IngestionJob(Document):
+    """
+    Tracks one upload through the background ingestion queue.
+    Progress counters are flushed periodically by the worker so any
+    API worker can answer GET /knowledge/jobs/{id}.
+    """
+    document_id: PydanticObjectId
+    user_id: PydanticObjectId
+    status: str = "pending"        # pending -> processing -> indexed / failed
+    pages_parsed: int = 0
+    total_pages: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_skipped: int = 0        # Already in the knowledge base (unchanged sections of a revised act)
+    total_chunks: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Touched by the worker process holding the job; a stale one means that process is gone
+    heartbeat_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
-        name = "embedding_chunks"
\ No newline at end of file
+        name = "ingestion_jobs"
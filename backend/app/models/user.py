@@ -1,4 +1,4 @@
-from beanie import Document, Indexed
+from beanie import Document, Indexed, after_event, Save, Replace, Update, SaveChanges, Delete
 from pydantic import Field, EmailStr
 from datetime import datetime
 from typing import Optional
@@ -33,4 +33,12 @@ class User(Document):
     # Optional: Helper method to update timestamp on save
     async def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
-        await super().save(*args, **kwargs)
\ No newline at end of file
+        await super().save(*args, **kwargs)
+
+    # Drop the cached copy used for token lookups whenever the user changes
+    # (e.g. deactivation). Query-level updates (User.find(...).update()) don't
+    # fire events; those rely on the cache TTL.
+    @after_event(Save, Replace, Update, SaveChanges, Delete)
+    def _invalidate_cache(self):
+        from app.services.user_cache import invalidate_user  # Avoids a models -> services import cycle
+        invalidate_user(self.id)
\ No newline at end of file
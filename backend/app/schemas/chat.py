@@ -3,6 +3,7 @@ from typing import List, Optional
 from datetime import datetime
 from beanie import PydanticObjectId
 from app.models.chat import RoleEnum
+from app.schemas.knowledge import CollectionName
 
 # --- MESSAGE SCHEMAS ---
 
@@ -24,11 +25,17 @@ class MessageResponse(BaseModel):
 class ChatCreate(BaseModel):
     # Optional: User might start a chat with a specific title
     title: Optional[str] = "New Chat"
+    # Optional: only search these collections (None = the whole knowledge base)
+    collections: Optional[List[CollectionName]] = None
+
+class ChatScope(BaseModel):
+    collections: Optional[List[CollectionName]] = None
 
 class ChatResponse(BaseModel):
     id: PydanticObjectId = Field(alias="_id")
     title: str
     updated_at: datetime
+    collections: Optional[List[str]] = None
     # We do NOT include the full list of messages here. 
     # That is fetched via a separate API call for performance.
 
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, Optional
+from datetime import datetime
+from beanie import PydanticObjectId
+
+# --- COLLECTION SCHEMAS ---
+
+# Collections name index shards ("ca-act-1949", "icai-guidance"); keep them path- and URL-safe
+COLLECTION_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$"
+CollectionName = Annotated[str, StringConstraints(pattern=COLLECTION_PATTERN)]
+
+class CollectionResponse(BaseModel):
+    name: str
+    chunks: int  # Vectors in the index (what a query scoped to it searches)
+
+# --- INGESTION JOB SCHEMAS ---
+
+class IngestionJobResponse(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    document_id: PydanticObjectId
+    status: str
+    pages_parsed: int
+    total_pages: Optional[int] = None
+    chunks_embedded: int
+    chunks_skipped: int = 0
+    total_chunks: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        populate_by_name = True
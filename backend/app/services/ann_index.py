@@ -0,0 +1,155 @@
+import math
+import uuid
+from dataclasses import dataclass
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """
+    Which FAISS index to build for a segment, and how to search it.
+
+    - flat:  exact search, cost grows linearly with the segment.
+    - hnsw:  graph index, near-exact recall, ~log(n) search, no training.
+    - ivfpq: inverted lists + product quantisation, smallest memory footprint;
+             needs training data (see `ivfpq_min_training`) and is lossy, so
+             smaller segments fall back to flat.
+    """
+    type: str = "flat"
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 80
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 1024
+    ivf_nprobe: int = 16
+    pq_m: int = 48
+    pq_nbits: int = 8
+
+    @classmethod
+    def from_settings(cls, settings) -> "IndexSpec":
+        if settings.INDEX_TYPE not in INDEX_TYPES:
+            raise ValueError(f"INDEX_TYPE must be one of {INDEX_TYPES}, got {settings.INDEX_TYPE!r}")
+        return cls(
+            type=settings.INDEX_TYPE,
+            hnsw_m=settings.INDEX_HNSW_M,
+            hnsw_ef_construction=settings.INDEX_HNSW_EF_CONSTRUCTION,
+            hnsw_ef_search=settings.INDEX_HNSW_EF_SEARCH,
+            ivf_nlist=settings.INDEX_IVF_NLIST,
+            ivf_nprobe=settings.INDEX_IVF_NPROBE,
+            pq_m=settings.INDEX_PQ_M,
+            pq_nbits=settings.INDEX_PQ_NBITS,
+        )
+
+
+FLAT = IndexSpec(type="flat")
+
+
+def build_index(vectors: np.ndarray, spec: IndexSpec) -> faiss.Index:
+    """Builds (and trains, if needed) a FAISS index over `vectors` (n x dim, float32)."""
+    index = create_index(vectors.shape[1], spec, training=vectors)
+    index.add(vectors)
+    return index
+
+
+def create_index(dim: int, spec: IndexSpec, training: np.ndarray | None = None) -> faiss.Index:
+    """
+    Creates an empty, trained index ready for `add` calls. Lets callers stream
+    vectors in batches instead of materialising the whole matrix.
+    `training` is only used by IVF-PQ; without enough of it we fall back to flat.
+    """
+    kind = spec.type
+    if kind == "ivfpq" and (training is None or len(training) < ivfpq_min_training(spec)):
+        kind = "flat"  # Too few points for k-means to place the centroids
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec.hnsw_m)
+        index.hnsw.efConstruction = spec.hnsw_ef_construction
+    elif kind == "ivfpq":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, spec.ivf_nlist, _pq_subquantizers(dim, spec.pq_m), spec.pq_nbits)
+        index.train(training)
+    else:
+        raise ValueError(f"Unknown index type {spec.type!r}")
+
+    configure_search(index, spec)
+    return index
+
+
+def ivfpq_min_training(spec: IndexSpec) -> int:
+    """
+    Training points IVF-PQ needs: FAISS's k-means wants ~39 per centroid, for
+    the `ivf_nlist` coarse lists and for the 2^nbits codes of each sub-quantizer.
+    """
+    return 39 * max(spec.ivf_nlist, 2 ** spec.pq_nbits)
+
+
+def configure_search(index: faiss.Index, spec: IndexSpec):
+    """Applies query-time knobs. Called on load too, so they can be tuned without a rebuild."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = spec.hnsw_ef_search
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = spec.ivf_nprobe
+
+
+def index_type(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivfpq"
+    return "flat"
+
+
+def is_lossless(index: faiss.Index) -> bool:
+    """Whether the original vectors can be read back exactly (PQ codes can't)."""
+    return index_type(index) != "ivfpq"
+
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """Reads the stored vectors back out. Approximate for IVF-PQ."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_store(embedding_function, docs: list[Document], vectors, spec: IndexSpec) -> FAISS:
+    """Wraps a freshly built index in a LangChain FAISS store."""
+    return wrap_store(embedding_function, build_index(np.asarray(vectors, dtype=np.float32), spec), docs)
+
+
+def wrap_store(embedding_function, index: faiss.Index, docs: list[Document]) -> FAISS:
+    """`docs[i]` must be the document for vector `i` of `index`."""
+    ids = [str(uuid.uuid4()) for _ in docs]
+    return FAISS(
+        embedding_function=embedding_function,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def store_documents(store: FAISS) -> list[Document]:
+    """Documents in index order, aligned with `index_vectors(store.index)`."""
+    return [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+
+
+def _pq_subquantizers(dim: int, wanted: int) -> int:
+    """PQ needs `dim % m == 0`; pick the largest divisor of dim not above `wanted`."""
+    for m in range(min(wanted, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def estimate_nlist(n: int) -> int:
+    """Rule of thumb used by the benchmark: ~4 * sqrt(n) inverted lists."""
+    return max(1, int(4 * math.sqrt(n)))
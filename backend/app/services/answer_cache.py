@@ -0,0 +1,62 @@
+import re
+import threading
+from typing import Iterator, Optional
+
+from langchain_core.documents import Document
+
+from app.services.cache import TTLCache
+from app.services.embedding_service import normalize_query
+from app.services.index_manager import chunk_hash
+
+# Replayed answers are cut like streamed ones: a word plus its trailing whitespace
+_REPLAY_CHUNK = re.compile(r"\s*\S+\s*|\s+")
+
+
+class AnswerCache:
+    """
+    Final answers to history-free questions, keyed on the normalized question
+    plus the ids (content hashes) of the chunks retrieved for it. Entries are
+    only valid for the index version they were answered from: the first
+    lookup against a newer version empties the cache, and answers computed
+    against an older version are neither served nor stored.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, enabled: bool = True):
+        self.enabled = enabled
+        self.version = -1  # Index version the entries were answered from
+        self.invalidations = 0
+        self._cache = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def key(self, question: str, docs: list[Document]) -> tuple:
+        chunk_ids = tuple(doc.metadata.get("chunk_hash") or chunk_hash(doc.page_content) for doc in docs)
+        return normalize_query(question), chunk_ids
+
+    def _current(self, version: int) -> bool:
+        """True if `version` is the one the cache holds (moving forward to it if it's newer)."""
+        with self._lock:
+            if version > self.version:
+                if self.version >= 0:
+                    self.invalidations += 1
+                    print(f"🧹 Answer cache cleared: index v{self.version} -> v{version}")
+                self.version = version
+                self._cache.clear()
+            return version == self.version
+
+    def get(self, key: tuple, version: int) -> Optional[str]:
+        if not self.enabled or not self._current(version):
+            return None
+        return self._cache.get(key)
+
+    def set(self, key: tuple, version: int, answer: str):
+        if self.enabled and answer and self._current(version):
+            self._cache.set(key, answer)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "version": self.version, "invalidations": self.invalidations,
+                **self._cache.stats()}
+
+
+def replay_chunks(answer: str) -> Iterator[str]:
+    """Splits a cached answer into stream-sized deltas, so clients render it like a live one."""
+    yield from _REPLAY_CHUNK.findall(answer)
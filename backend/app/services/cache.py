@@ -0,0 +1,131 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl_seconds`.
+    Thread-safe, so it can be shared between the event loop and worker threads.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SharedVectorCache:
+    """
+    Small SQLite-backed vector store that several uvicorn workers on the same
+    host can share. Vectors are stored as raw float32 bytes. Every write also
+    drops expired rows and, past `max_rows`, the ones closest to expiring.
+    It is only a cache: SQLite errors (locked, disk full, ...) count as misses.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_rows: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS vectors_expires_at ON vectors (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[list[float]]:
+        try:
+            row = self._connect().execute(
+                "SELECT vector FROM vectors WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def set(self, key: str, vector: list[float]):
+        """Stores `vector` and prunes. Never raises, so callers may fire and forget it."""
+        now = time.time()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO vectors (key, vector, expires_at) VALUES (?, ?, ?)",
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now + self.ttl_seconds),
+                )
+                conn.execute("DELETE FROM vectors WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM vectors WHERE key IN "
+                    "(SELECT key FROM vectors ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+        except sqlite3.Error as e:
+            self._failed("write", e)
+
+    def _failed(self, action: str, error: sqlite3.Error):
+        self.errors += 1
+        print(f"⚠️ Shared query cache {action} failed, treating it as a miss: {error}")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
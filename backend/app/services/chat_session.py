@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import span
+from app.models.chat import Chat, Message, MessageContent, RoleEnum
+from app.services.history_service import count_tokens, load_recent_history, trim_to_budget
+from app.services.llm_service import summarize_history
+
+
+class ChatSession:
+    """
+    State for one websocket connection to a chat.
+
+    History is read from Mongo once, on connect, and then kept in a ring
+    buffer that each turn appends to, so a turn costs two writes: one
+    insert_many for both messages and one $set on the chat.
+    Assumes one open connection per chat; a second tab on the same chat
+    won't see the other tab's new turns until it reconnects.
+
+    Once the buffered history passes settings.SUMMARY_TRIGGER_TOKENS, the
+    older turns are folded into `chat.summary` in the background and dropped
+    from the buffer, so prompts stay bounded on long chats.
+    """
+
+    def __init__(self, chat: Chat):
+        self.chat = chat
+        self._recent: deque[MessageContent] = deque(maxlen=settings.HISTORY_MAX_MESSAGES)
+        self._summarizing: Optional[asyncio.Task] = None
+
+    async def load(self):
+        with span("history_load"):
+            self._recent.extend(await load_recent_history(self.chat.id, after=self.chat.summary_until))
+
+    async def close(self):
+        """Lets a running summary finish so it isn't lost with the connection."""
+        if self._summarizing:
+            await asyncio.gather(self._summarizing, return_exceptions=True)
+
+    @property
+    def summary(self) -> Optional[str]:
+        return self.chat.summary
+
+    def history(self) -> list[MessageContent]:
+        """Newest messages that fit settings.HISTORY_TOKEN_BUDGET, oldest first."""
+        return trim_to_budget(list(self._recent), settings.HISTORY_TOKEN_BUDGET)
+
+    async def record_turn(self, user_msg: Message, ai_msg: Optional[Message]) -> None:
+        """
+        Persists a finished turn. `ai_msg` is None when answering failed;
+        the question is still saved so the transcript shows it.
+        """
+        messages = [user_msg] if ai_msg is None else [user_msg, ai_msg]
+        with span("persist"):
+            await Message.insert_many(messages)
+        self._recent.extend(
+            MessageContent(role=m.role, content=m.content, timestamp=m.timestamp) for m in messages
+        )
+
+        # Targeted update instead of chat.save(), which rewrites the whole document
+        update = {Chat.updated_at: datetime.utcnow()}
+        if self.chat.title == "New Chat":
+            update[Chat.title] = user_msg.content[:30] + "..."
+        with span("persist"):
+            await self.chat.set(update)
+
+        self._maybe_summarize()
+
+    # --- Rolling summary ---
+
+    def _maybe_summarize(self):
+        if self._summarizing and not self._summarizing.done():
+            return
+        if count_tokens(self._recent) <= settings.SUMMARY_TRIGGER_TOKENS:
+            return
+        self._summarizing = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        messages = list(self._recent)
+        keep = trim_to_budget(messages, settings.SUMMARY_KEEP_TOKENS)
+        fold = messages[:len(messages) - len(keep)]
+        # Fold whole turns: end on an answer so the verbatim part starts with a question
+        while fold and fold[-1].role == RoleEnum.user:
+            fold.pop()
+        if not fold:
+            return
+
+        try:
+            summary = await summarize_history(self.chat.summary, fold)
+        except Exception as e:
+            print(f"⚠️ Summarizing chat {self.chat.id} failed: {e}")
+            return
+
+        folded_tokens = count_tokens(fold)
+        await self.chat.set({
+            Chat.summary: summary,
+            Chat.summary_until: fold[-1].timestamp,
+            Chat.summary_source_tokens: self.chat.summary_source_tokens + folded_tokens,
+        })
+        # Turns may have been appended while we waited on the LLM; drop only what was folded
+        folded = {id(m) for m in fold}
+        self._recent = deque((m for m in self._recent if id(m) not in folded), maxlen=self._recent.maxlen)
+        print(f"📝 Chat {self.chat.id}: folded {len(fold)} messages (~{folded_tokens} tokens) into the summary.")
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+ONNX_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def load_embedding_backend(backend: str, settings) -> Embeddings:
+    """
+    Builds the embedding model selected by EMBEDDING_BACKEND.
+
+    - torch: sentence-transformers via LangChain's HuggingFaceEmbeddings.
+    - onnx:  the same model exported to ONNX with int8 weights
+             (scripts/export_onnx_model.py). No torch at runtime: smaller
+             resident set and faster on CPU-only nodes.
+    Both return L2-normalised vectors of the same dimension, so an index
+    built with one can be queried with the other (see
+    benchmarks/embedding_backends.py for the parity check).
+    """
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        return OnnxEmbeddings(
+            settings.EMBEDDING_ONNX_PATH,
+            max_length=settings.EMBEDDING_MAX_LENGTH,
+            threads=settings.EMBEDDING_ONNX_THREADS,
+        )
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {EMBEDDING_BACKENDS}, got {backend!r}")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings with ONNX Runtime: tokenize -> transformer -> mean
+    pooling over real tokens -> L2 normalisation, which is what
+    sentence-transformers does for all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 256, threads: int = 0, batch_size: int = 32):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx needs `onnxruntime` and `tokenizers` (pip install onnxruntime tokenizers)"
+            ) from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()  # To the longest text in each batch
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: list = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed([texts[i] for i in batch]).tolist()):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text])[0].tolist()
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dim)
+        weights = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
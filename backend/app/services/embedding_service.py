@@ -0,0 +1,275 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.services.cache import TTLCache, SharedVectorCache
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Builds the real embedding model on first use (or an explicit `load()`).
+    Importing sentence-transformers and loading weights takes seconds; with
+    this, workers can serve auth and chat listing while the model loads in
+    the background (see app.services.warmup).
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self._factory = factory
+        self._model: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> Embeddings:
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = self._factory()
+                    self.load_seconds = time.perf_counter() - started
+                    print(f"🧠 Embedding model loaded in {self.load_seconds:.1f}s")
+                model = self._model
+        return model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.load().embed_query(text)
+
+
+class EmbeddingBatcherStopped(RuntimeError):
+    pass
+
+
+@dataclass
+class _EmbedRequest:
+    texts: list[str]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embedding requests into micro-batches.
+
+    Callers `await aembed_query(...)`. A single background task waits up to
+    `max_wait_ms` (or until `max_batch_size` texts are queued), runs the whole
+    batch as one vectorised `embed_documents` call on a dedicated thread and
+    resolves every caller's future. The event loop never runs the model.
+    """
+
+    def __init__(self, embeddings, max_batch_size: int, max_wait_ms: float, max_queue: int):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue[_EmbedRequest]] = None
+        self._task: Optional[asyncio.Task] = None
+        # One thread: model calls are serialised, never interleaved with each other
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+        self.batches_total = 0
+        self.texts_total = 0
+        self.last_batch_size = 0
+        self.queue_wait_seconds_total = 0.0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops batching. Requests still queued (or in the batch being embedded)
+        fail with EmbeddingBatcherStopped instead of leaving their callers,
+        including worker threads blocked in `embed_documents`, waiting forever.
+        Later calls embed directly.
+        """
+        queue = self._queue
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = self._queue = self._loop = None
+        while queue is not None and not queue.empty():
+            _fail([queue.get_nowait()], EmbeddingBatcherStopped("Embedding batcher stopped"))
+
+    # --- Public API ---
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self._queue is None:
+            # Batcher not running (scripts, tests): embed directly off the loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.embeddings.embed_documents, texts)
+
+        queue = self._queue
+        request = _EmbedRequest(texts=texts, future=asyncio.get_running_loop().create_future())
+        # Blocks (back-pressure) when `max_queue` requests are already waiting
+        await queue.put(request)
+        if queue is not self._queue:
+            # stop() drained the queue while we waited for room
+            raise EmbeddingBatcherStopped("Embedding batcher stopped")
+        return await request.future
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        For worker threads (e.g. ingestion): routes through the same batcher and blocks.
+        Called on the batcher's own loop (sync LangChain code in a coroutine),
+        waiting for the batch would deadlock the loop; it runs the model on the
+        embedding thread instead, which blocks the loop but stays serialised.
+        """
+        loop = self._loop
+        if loop is None:
+            return self.embeddings.embed_documents(texts)
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            return self._executor.submit(self.embeddings.embed_documents, texts).result()
+        return asyncio.run_coroutine_threadsafe(self.aembed_documents(texts), loop).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches_total": self.batches_total,
+            "texts_total": self.texts_total,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": self.texts_total / self.batches_total if self.batches_total else 0.0,
+            "queue_wait_seconds_total": self.queue_wait_seconds_total,
+        }
+
+    # --- Batching loop ---
+
+    async def _run(self):
+        batch: list[_EmbedRequest] = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                size = len(batch[0].texts)
+                deadline = time.perf_counter() + self.max_wait
+
+                while size < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    batch.append(request)
+                    size += len(request.texts)
+
+                await self._embed_batch(batch)
+        except asyncio.CancelledError:
+            # stop(): the batch being collected or embedded fails too, not just the queued ones
+            _fail(batch, EmbeddingBatcherStopped("Embedding batcher stopped"))
+            raise
+
+    async def _embed_batch(self, batch: list[_EmbedRequest]):
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        try:
+            vectors = await self._loop.run_in_executor(self._executor, self.embeddings.embed_documents, texts)
+        except Exception as e:
+            _fail(batch, e)
+            return
+
+        self.batches_total += 1
+        self.texts_total += len(texts)
+        self.last_batch_size = len(texts)
+        self.queue_wait_seconds_total += sum(started - r.enqueued_at for r in batch)
+
+        offset = 0
+        for request in batch:
+            n = len(request.texts)
+            if not request.future.done():  # Caller may have been cancelled
+                request.future.set_result(vectors[offset:offset + n])
+            offset += n
+
+
+def _fail(requests: list[_EmbedRequest], error: Exception):
+    for request in requests:
+        if not request.future.done():  # Caller may have been cancelled
+            request.future.set_exception(error)
+
+
+def normalize_query(text: str) -> str:
+    """
+    Cache key for a query. all-MiniLM-L6-v2 is an uncased model, so
+    lower-casing and collapsing whitespace doesn't change the embedding.
+    """
+    return " ".join(text.lower().split())
+
+
+class CachedQueryEmbedder:
+    """
+    Puts an LRU/TTL cache (and optionally a cross-worker SQLite store) in front
+    of the batcher for query embeddings. Document embeddings pass straight through.
+    """
+
+    def __init__(self, batcher: EmbeddingBatcher, cache: TTLCache, shared: Optional[SharedVectorCache] = None):
+        self.batcher = batcher
+        self.cache = cache
+        self.shared = shared
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+
+        loop = asyncio.get_running_loop()
+        if self.shared:
+            vector = await loop.run_in_executor(None, self.shared.get, key)
+        if vector is None:
+            vector = await self.batcher.aembed_query(key)
+            if self.shared:
+                loop.run_in_executor(None, self.shared.set, key, vector)  # Fire and forget: set never raises
+
+        self.cache.set(key, vector)
+        return vector
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None and self.shared:
+            vector = self.shared.get(key)
+        if vector is None:
+            vector = self.batcher.embed_query(key)
+            if self.shared:
+                self.shared.set(key, vector)
+        self.cache.set(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.batcher.aembed_documents(texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.batcher.embed_documents(texts)
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        if self.shared:
+            stats["shared"] = self.shared.stats()
+        return stats
@@ -1,20 +1,210 @@
-import io
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+import python_multipart as multipart
+from fastapi import Request
 from pypdf import PdfReader
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
 
-async def extract_text_from_pdf(file_bytes: bytes) -> str:
+# Multipart framing and small form fields allowed on top of UPLOAD_MAX_BYTES
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+class UploadTooLargeError(Exception):
+    pass
+
+class UploadFormError(Exception):
+    pass
+
+@dataclass
+class SpooledUpload:
+    path: str           # Temp file; the caller owns it and must delete it
+    size: int
+    content_hash: str   # sha256 hex digest
+    filename: Optional[str]
+    content_type: Optional[str]
+    fields: dict[str, str]  # The other (non-file) form fields
+
+class _UploadParser:
+    """
+    python-multipart callbacks: the `file_field` part goes to `out`, other
+    text fields are kept (up to UPLOAD_FORM_OVERHEAD), other file parts are
+    dropped. File bytes are buffered per network chunk so the write can be
+    awaited in the threadpool.
+    """
+
+    def __init__(self, file_field: str, max_bytes: int):
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.fields: dict[str, str] = {}
+        self.pending = bytearray()
+        self.size = 0
+        self.found = False
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._headers: dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._target: Optional[str] = None  # "file", a field name, or None to drop the part
+        self._value = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._value = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._target = name
+        elif name == self.file_field and not self.found:
+            self.found = True
+            self._target = "file"
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        else:
+            self._target = None
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._target == "file":
+            self.size += end - start
+            if self.size > self.max_bytes:
+                raise UploadTooLargeError(f"File exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit.")
+            self.pending += data[start:end]
+        elif self._target is not None:
+            self._value += data[start:end]
+            if len(self._value) > UPLOAD_FORM_OVERHEAD:
+                raise UploadFormError(f"Form field '{self._target}' is too large.")
+
+    def on_part_end(self):
+        if self._target not in (None, "file"):
+            self.fields[self._target] = self._value.decode("utf-8", "replace")
+        self._target = None
+
+async def spool_upload(request: Request, file_field: str, max_bytes: int) -> SpooledUpload:
+    """
+    Parses a multipart upload straight off the request stream. The `file_field`
+    part is written once, to a temp file in UPLOAD_SPOOL_DIR, and hashed on
+    the way; nothing is spooled by Starlette first and copied afterwards.
+    Raises UploadTooLargeError before reading the body if Content-Length is
+    over the limit, and as soon as the streamed file exceeds `max_bytes`
+    otherwise. Raises UploadFormError for a malformed body.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + UPLOAD_FORM_OVERHEAD:
+        raise UploadTooLargeError(f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit.")
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadFormError("Expected a multipart/form-data upload.")
+
+    upload = _UploadParser(file_field, max_bytes)
+    parser = multipart.MultipartParser(params[b"boundary"], upload.callbacks())
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=settings.UPLOAD_SPOOL_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except FormParserError as e:
+                    raise UploadFormError(f"Malformed upload: {e}")
+                if upload.pending:
+                    data, upload.pending = bytes(upload.pending), bytearray()
+                    digest.update(data)
+                    await run_in_threadpool(out.write, data)
+            parser.finalize()
+        if not upload.found:
+            raise UploadFormError(f"Missing file field '{file_field}'.")
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path=path, size=upload.size, content_hash=digest.hexdigest(), filename=upload.filename,
+                         content_type=upload.content_type, fields=upload.fields)
+
+# --- Page-parallel extraction ---
+
+_page_pool: Optional[ProcessPoolExecutor] = None
+# Ingestion threads extract concurrently; without the lock two could each create a pool
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool
+    if _page_pool is None:
+        with _page_pool_lock:
+            if _page_pool is None:
+                # "spawn" so children don't inherit the parent's threads/event loop
+                _page_pool = ProcessPoolExecutor(
+                    max_workers=settings.PDF_EXTRACT_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _page_pool
+
+def shutdown_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+            _page_pool = None
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    """Runs in a worker process: each one opens the file itself, so only text crosses the process boundary."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def iter_pdf_pages(path: str, on_page: Optional[Callable[[int, int], None]] = None) -> Iterator[tuple[int, str]]:
     """
-    Synchronous PDF parsing wrapped in an async function.
+    Yields (page number, text) for each page with text, in order, while later pages are still being
+    extracted by the process pool. At most PDF_EXTRACT_PROCESSES * 2 page ranges
+    are in flight, so memory stays bounded no matter how long the PDF is.
+    `on_page(pages_parsed, total_pages)` is called as pages come back.
+    Page numbers are the PDF's own (1-based), so blank or image-only pages
+    that are skipped don't shift the numbers of the pages after them.
     """
-    # Create a file-like object from bytes
-    pdf_stream = io.BytesIO(file_bytes)
-    
-    reader = PdfReader(pdf_stream)
-    text = ""
-    
-    # Iterate over pages and extract text
-    for page in reader.pages:
-        content = page.extract_text()
-        if content:
-            text += content + "\n"
-            
-    return text
\ No newline at end of file
+    total_pages = len(PdfReader(path).pages)
+    step = settings.PDF_PAGES_PER_TASK
+    ranges = deque((start, min(start + step, total_pages)) for start in range(0, total_pages, step))
+
+    pool = _get_page_pool()
+    in_flight = deque()
+    parsed = 0
+    while ranges or in_flight:
+        while ranges and len(in_flight) < settings.PDF_EXTRACT_PROCESSES * 2:
+            start, stop = ranges.popleft()
+            in_flight.append(pool.submit(_extract_page_range, path, start, stop))
+
+        for text in in_flight.popleft().result():
+            parsed += 1
+            if on_page:
+                on_page(parsed, total_pages)
+            if text:
+                yield parsed, text
@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import PydanticObjectId
+
+from app.core.config import settings
+from app.models.chat import Message, MessageContent
+
+# Rough chars-per-token for English text with Llama-style tokenizers.
+# Good enough for budgeting; we never need an exact count here.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def count_tokens(messages) -> int:
+    return sum(estimate_tokens(m.content) for m in messages)
+
+
+def trim_to_budget(messages: list[MessageContent], token_budget: int) -> list[MessageContent]:
+    """Keeps the newest messages (list is oldest first) whose total fits `token_budget`."""
+    used, start = 0, len(messages)
+    for message in reversed(messages):
+        cost = estimate_tokens(message.content)
+        if used + cost > token_budget:
+            break
+        used += cost
+        start -= 1
+    return messages[start:]
+
+
+async def load_recent_history(
+    chat_id: PydanticObjectId,
+    token_budget: Optional[int] = None,
+    max_messages: Optional[int] = None,
+    after: Optional[datetime] = None,
+) -> list[MessageContent]:
+    """
+    Returns the most recent messages of a chat, oldest first, that fit in
+    `token_budget` (default: settings.HISTORY_TOKEN_BUDGET).
+
+    Reads newest -> oldest on the (chat_id, timestamp) index and stops at the
+    first message that would overflow the budget, so the cost per turn stays
+    constant however long the chat gets. Only `role`, `content` and
+    `timestamp` are fetched. `after` skips messages already folded into the
+    chat summary.
+    """
+    token_budget = settings.HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    max_messages = settings.HISTORY_MAX_MESSAGES if max_messages is None else max_messages
+
+    window, used = [], 0
+    filters = [Message.chat_id == chat_id]
+    if after is not None:
+        filters.append(Message.timestamp > after)
+    query = Message.find(*filters)\
+        .sort(-Message.timestamp, -Message.id)\
+        .limit(max_messages)\
+        .project(MessageContent)
+
+    async for message in query:
+        cost = estimate_tokens(message.content)
+        if used + cost > token_budget:
+            break
+        window.append(message)
+        used += cost
+
+    window.reverse()
+    return window
@@ -0,0 +1,462 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Container, Iterable
+from dataclasses import dataclass
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.metrics import span
+from app.services.ann_index import FLAT, IndexSpec, build_store, configure_search, index_vectors, store_documents
+from app.services.lexical_index import LexicalIndex, bm25_search, citation_terms, reciprocal_rank_fusion
+from app.services.segment_store import SegmentInfo, SegmentStore, RetiredSegment, MANIFEST_FILE, DEFAULT_COLLECTION
+
+
+HitKey = tuple[int, int]  # (segment index within the version, position within the segment)
+
+
+@dataclass(frozen=True)
+class Segment:
+    name: str
+    collection: str
+    store: FAISS
+    lexical: LexicalIndex
+    chunk_hashes: Container[str]  # Fingerprints of every chunk, for ingestion-time dedup
+
+
+@dataclass(frozen=True)
+class IndexVersion:
+    """
+    An immutable snapshot of the knowledge base.
+    Retrievers hold on to the snapshot they were built from, so a query that
+    is already running keeps searching the same version even if a newer one
+    gets published in the meantime.
+
+    Segments are sharded by collection; `scoped` narrows a version down to
+    the collections a chat may search, so a query only touches their segments.
+    """
+    version: int
+    segments: tuple[Segment, ...]
+
+    def scoped(self, collections: Iterable[str] | None) -> "IndexVersion":
+        """The same version restricted to `collections` (None = the whole knowledge base)."""
+        if collections is None:
+            return self
+        wanted = set(collections)
+        return IndexVersion(version=self.version, segments=tuple(s for s in self.segments if s.collection in wanted))
+
+    def collections(self) -> dict[str, int]:
+        """Chunks per collection."""
+        counts = Counter()
+        for segment in self.segments:
+            counts[segment.collection] += segment.store.index.ntotal
+        return dict(counts)
+
+    def has_chunk(self, content_hash: str, collection: str | None = None) -> bool:
+        """Whether the chunk is indexed (in `collection`, if given)."""
+        return any(
+            content_hash in segment.chunk_hashes
+            for segment in self.segments
+            if collection is None or segment.collection == collection
+        )
+
+    def document(self, key: HitKey) -> Document:
+        store = self.segments[key[0]].store
+        return store.docstore.search(store.index_to_docstore_id[key[1]])
+
+    def dense_search(self, vector: list[float], k: int) -> list[tuple[HitKey, float]]:
+        """Searches every segment and merges the hits (lower L2 distance is better)."""
+        query = np.asarray([vector], dtype=np.float32)
+        hits = []
+        for seg_idx, segment in enumerate(self.segments):
+            index = segment.store.index
+            if not index.ntotal:
+                continue
+            distances, positions = index.search(query, min(k, index.ntotal))
+            hits.extend(((seg_idx, int(p)), float(d)) for d, p in zip(distances[0], positions[0]) if p != -1)
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    def search_by_vector(self, vector: list[float], k: int) -> list[tuple[Document, float]]:
+        return [(self.document(key), score) for key, score in self.dense_search(vector, k)]
+
+    def citation_lookup(self, query: str, k: int) -> list[Document]:
+        """
+        Fast path for direct references ("Section 22 of the CA Act"): BM25 over
+        chunks that contain every cited reference. No embedding needed.
+        Returns [] when the query cites nothing or nothing matches.
+        """
+        citations = citation_terms(query)
+        if not citations:
+            return []
+        hits = bm25_search([s.lexical for s in self.segments], query, k, required=citations)
+        return [self.document(key) for key, _ in hits]
+
+    def hybrid_search(self, query: str, vector: list[float], k: int, candidates: int, rrf_k: int) -> list[Document]:
+        """Dense + BM25, fused by reciprocal rank."""
+        dense = [key for key, _ in self.dense_search(vector, candidates)]
+        lexical = [key for key, _ in bm25_search([s.lexical for s in self.segments], query, candidates)]
+        return [self.document(key) for key in reciprocal_rank_fusion(dense, lexical, k=rrf_k)[:k]]
+
+
+class SegmentedRetriever(BaseRetriever):
+    """
+    LangChain retriever over all segments of one `IndexVersion`.
+    `embedder` is anything with `embed_query` / `aembed_query` (normally the
+    shared EmbeddingBatcher, so async queries get micro-batched).
+
+    Citation queries are answered from the inverted index without embedding;
+    everything else goes through hybrid dense + BM25 retrieval.
+    """
+    snapshot: IndexVersion
+    embedder: object
+    k: int = 4
+    candidates: int = 20  # Hits taken from each of dense / BM25 before fusion
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        if not self.snapshot.segments:
+            return []
+        docs = self.snapshot.citation_lookup(query, self.k)
+        if docs:
+            return docs
+        vector = self.embedder.embed_query(query)
+        return self.snapshot.hybrid_search(query, vector, self.k, self.candidates, self.rrf_k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        _, docs = await self.aretrieve(query)
+        return docs
+
+    async def aretrieve(self, query: str) -> tuple[list[float] | None, list[Document]]:
+        """
+        Returns (query_vector, docs). The vector is None when the citation fast
+        path answered the query and the embedding model was never called.
+        """
+        if not self.snapshot.segments:
+            return None, []
+        loop = asyncio.get_running_loop()
+        with span("citation_lookup"):
+            docs = await loop.run_in_executor(None, self.snapshot.citation_lookup, query, self.k)
+        if docs:
+            return None, docs
+        vector = await self.aembed(query)
+        return vector, await self.asearch(query, vector)
+
+    async def aembed(self, query: str) -> list[float]:
+        with span("embed"):
+            return await self.embedder.aembed_query(query)
+
+    async def asearch(self, query: str, vector: list[float]) -> list[Document]:
+        """Hybrid search with a precomputed query vector (lets callers reuse or compare embeddings)."""
+        if not self.snapshot.segments:
+            return []
+        # FAISS/BM25 scoring is CPU work; keep it off the event loop for large indexes
+        with span("search"):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.snapshot.hybrid_search, query, vector, self.k, self.candidates, self.rrf_k
+            )
+
+
+class IndexManager:
+    """
+    Process-wide owner of the FAISS index.
+
+    Segments are memory-mapped (vectors, documents, postings), so every
+    uvicorn worker on a host serves from the same page-cache copy and an
+    extra worker costs little index memory. Each upload writes one small
+    segment and publishes a new version that shares all the existing
+    segments, so an upload costs O(new document), not O(corpus).
+
+    A watcher thread stats manifest.json every `watch_interval` seconds and
+    maps in versions published by other workers (uploads, compaction, rebuilds).
+
+    Every segment belongs to one collection (a shard). Compaction merges
+    segments within a collection, never across, so a scoped query searches
+    only its collections' segments.
+
+    Upload segments are always exact (flat). Compaction and `rebuild` produce
+    segments of the configured `spec` type (flat / HNSW / IVF-PQ).
+    """
+
+    def __init__(self, index_path: str, embeddings, spec: IndexSpec = FLAT, compaction_max_segments: int = 8,
+                 compaction_max_segment_size: int = 50_000, retire_grace_seconds: int = 300,
+                 use_mmap: bool = True, watch_interval: float = 1.0):
+        self.embeddings = embeddings
+        self.spec = spec
+        self.store = SegmentStore(index_path)
+        self.compaction_max_segments = compaction_max_segments
+        self.compaction_max_segment_size = compaction_max_segment_size
+        self.retire_grace_seconds = retire_grace_seconds
+        self.use_mmap = use_mmap
+        self.watch_interval = watch_interval
+
+        self._current: IndexVersion | None = None
+        # Serialises loading and publishing. Readers never take it once loaded.
+        self._write_lock = threading.Lock()
+        self._compaction_requested = threading.Event()
+        self._compactor: threading.Thread | None = None
+        self._manifest_stamp: tuple | None = None
+        self._watcher: threading.Thread | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._current is not None
+
+    def current(self) -> IndexVersion:
+        """Returns the live version, loading it from disk the first time."""
+        snapshot = self._current
+        if snapshot is not None:
+            return snapshot
+
+        with self._write_lock:
+            if self._current is None:
+                self._current = self._build_version(self._read_manifest())
+                self._start_watcher()
+            return self._current
+
+    def add_embeddings(self, texts: list[str], vectors: list[list[float]], metadatas: list[dict] | None = None,
+                       collection: str = DEFAULT_COLLECTION) -> IndexVersion:
+        """
+        Writes already-embedded chunks as a new delta segment of `collection`
+        and publishes it. Writing the segment happens outside any lock; only
+        the manifest update is serialised.
+        """
+        snapshot = self.current()
+        if not texts:
+            return snapshot
+
+        metadatas = metadatas or [{} for _ in texts]
+        docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        delta = build_store(self.embeddings, docs, vectors, FLAT)
+        info, segment = self._write_segment(delta, LexicalIndex.from_texts(texts), collection)
+
+        with self._write_lock, self.store.locked() as manifest:
+            manifest.segments.append(info)
+            manifest.version += 1
+            self.store.write_manifest(manifest)
+            self._current = self._build_version(manifest, known=(segment,))
+
+        self._maybe_schedule_compaction()
+        return self._current
+
+    def _build_version(self, manifest, known: tuple[Segment, ...] = ()) -> IndexVersion:
+        """
+        Turns a manifest into an in-memory version, reusing segments we already hold.
+        Segments written by other workers are mapped in from disk here.
+        """
+        loaded = {s.name: s for s in self._current.segments} if self._current else {}
+        loaded.update((segment.name, segment) for segment in known)
+
+        segments = []
+        for info in manifest.segments:
+            segment = loaded.get(info.name)
+            if segment is None:
+                segment = self._open_segment(info)
+            segments.append(segment)
+        return IndexVersion(version=manifest.version, segments=tuple(segments))
+
+    def _open_segment(self, info: SegmentInfo) -> Segment:
+        store, lexical, hashes = self.store.load_segment(info, self.embeddings, chunk_hash, self.use_mmap)
+        configure_search(store.index, self.spec)
+        return Segment(name=info.name, collection=info.collection, store=store, lexical=lexical, chunk_hashes=hashes)
+
+    def _write_segment(self, store: FAISS, lexical: LexicalIndex, collection: str,
+                       vectors: np.ndarray | None = None) -> tuple[SegmentInfo, Segment]:
+        """
+        Persists a freshly built store. With mmap on, the written files are
+        mapped back in and the in-memory copy is dropped, so the worker that
+        built a segment doesn't hold more than the others do.
+        """
+        hashes = _chunk_hashes(store)
+        info = self.store.write_segment(store, lexical, hashes, collection, vectors)
+        if self.use_mmap:
+            return info, self._open_segment(info)
+        return info, Segment(name=info.name, collection=collection, store=store, lexical=lexical, chunk_hashes=hashes)
+
+    # --- Versions published by other workers ---
+
+    def _read_manifest(self):
+        # Stamp first: a write landing in between just triggers one more (no-op) refresh
+        self._manifest_stamp = self._stat_manifest()
+        return self.store.read_manifest()
+
+    def _stat_manifest(self) -> tuple | None:
+        try:
+            st = os.stat(os.path.join(self.store.root, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def refresh(self) -> bool:
+        """
+        Maps in the newest version on disk if another process published one.
+        Only new segments are opened; ones we already hold are reused.
+        """
+        if self._current is None or self._stat_manifest() == self._manifest_stamp:
+            return False
+        with self._write_lock:
+            manifest = self._read_manifest()
+            if manifest.version <= self._current.version:
+                return False  # Our own write, or an older manifest
+            self._current = self._build_version(manifest)
+        print(f"🔄 Picked up index v{manifest.version} from disk ({len(manifest.segments)} segments).")
+        return True
+
+    def _start_watcher(self):
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch_loop, name="faiss-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Index refresh failed: {e}")
+
+    # --- Background compaction ---
+
+    def _maybe_schedule_compaction(self):
+        # Per collection: a scoped query pays for the segments of its own collections
+        small = Counter(s.collection for s in self.store.read_manifest().segments if self._compactable(s))
+        if not small or max(small.values()) < self.compaction_max_segments:
+            return
+
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self._compaction_loop, name="faiss-compactor", daemon=True)
+            self._compactor.start()
+        self._compaction_requested.set()
+
+    def _compactable(self, info) -> bool:
+        # PQ codes can't give the vectors back exactly: IVF-PQ segments are merged from
+        # the vectors stored next to them, and ones written without those are left to `rebuild`
+        if info.count >= self.compaction_max_segment_size:
+            return False
+        return info.type != "ivfpq" or self.store.has_vectors(info.name)
+
+    def _compaction_loop(self):
+        while True:
+            self._compaction_requested.wait()
+            self._compaction_requested.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️ Index compaction failed: {e}")
+
+    def compact(self):
+        """
+        Merges the small segments of each collection into one segment of the
+        configured index type. The merge runs against an immutable snapshot;
+        segments appended while it runs are left untouched and picked up by
+        the next round.
+        """
+        snapshot = self.current()
+        compactable = {s.name for s in self.store.read_manifest().segments if self._compactable(s)}
+        for collection, victims in _by_collection(s for s in snapshot.segments if s.name in compactable).items():
+            if len(victims) < 2:
+                continue
+            infos = self._replace_segments(victims, self.spec)
+            for info in infos or ():
+                print(f"🧹 Compacted {len(victims)} segments of '{collection}' into {info.name} "
+                      f"({info.count} vectors, {info.type}).")
+
+    def rebuild(self, spec: IndexSpec | None = None) -> list[SegmentInfo] | None:
+        """
+        Rewrites every collection into a single segment of `spec` (default: the
+        configured one). Used to migrate an existing index to a new index type.
+        Vectors are read back out of the current segments, so nothing is re-embedded.
+        """
+        snapshot = self.current()
+        if not snapshot.segments:
+            return None
+        return self._replace_segments(list(snapshot.segments), spec or self.spec)
+
+    def replace_all(self, infos: list[SegmentInfo]) -> list[SegmentInfo] | None:
+        """
+        Swaps every segment of the current version for `infos`: segments the
+        caller already wrote with `store.begin_segment` (e.g. an index rebuilt
+        from Mongo, one per collection). Segments published while the caller
+        was building them are kept.
+        """
+        victims = {s.name for s in self.current().segments}
+        return self._publish(victims, [(info, self._open_segment(info)) for info in infos])
+
+    def _replace_segments(self, victims: list[Segment], spec: IndexSpec) -> list[SegmentInfo] | None:
+        merged = {}
+        for collection, group in _by_collection(victims).items():
+            docs, vectors = [], []
+            for victim in group:
+                docs.extend(store_documents(victim.store))
+                exact = self.store.load_vectors(victim.name)
+                vectors.append(exact if exact is not None else index_vectors(victim.store.index))
+            matrix = np.vstack(vectors).astype(np.float32, copy=False)
+            merged[collection] = (build_store(self.embeddings, docs, matrix, spec), matrix)
+        return self._publish_replacement({v.name for v in victims}, merged)
+
+    def _publish_replacement(self, victim_names: set[str],
+                             stores: dict[str, tuple[FAISS, np.ndarray]]) -> list[SegmentInfo] | None:
+        written = []
+        for collection, (store, vectors) in stores.items():
+            lexical = LexicalIndex.from_texts(doc.page_content for doc in store_documents(store))
+            written.append(self._write_segment(store, lexical, collection, vectors))
+        return self._publish(victim_names, written)
+
+    def _publish(self, victim_names: set[str], written: list[tuple[SegmentInfo, Segment]]) -> list[SegmentInfo] | None:
+        infos = [info for info, _ in written]
+        now = time.time()
+        with self._write_lock, self.store.locked() as manifest:
+            if not victim_names.issubset({s.name for s in manifest.segments}):
+                # Someone else compacted first; drop our result.
+                for info in infos:
+                    self.store.remove_segment(info.name)
+                return None
+
+            live = [s.name for s in manifest.segments]
+            position = min((live.index(n) for n in victim_names), default=len(live))
+            manifest.segments = [s for s in manifest.segments if s.name not in victim_names]
+            manifest.segments[position:position] = infos
+            manifest.retired.extend(RetiredSegment(name=n, retired_at=now) for n in victim_names)
+            manifest.version += 1
+            self._collect_retired(manifest, now)
+            self.store.write_manifest(manifest)
+            self._current = self._build_version(manifest, known=tuple(segment for _, segment in written))
+        return infos
+
+    def _collect_retired(self, manifest, now: float):
+        """Deletes retired segments once other workers have had time to stop reading them."""
+        keep = []
+        for retired in manifest.retired:
+            if now - retired.retired_at >= self.retire_grace_seconds:
+                self.store.remove_segment(retired.name)
+            else:
+                keep.append(retired)
+        manifest.retired = keep
+
+
+def chunk_hash(text: str) -> str:
+    """Fingerprint of a chunk; whitespace differences between editions don't count as changes."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def _by_collection(segments: Iterable[Segment]) -> dict[str, list[Segment]]:
+    groups: dict[str, list[Segment]] = {}
+    for segment in segments:
+        groups.setdefault(segment.collection, []).append(segment)
+    return groups
+
+
+def _chunk_hashes(store: FAISS) -> frozenset[str]:
+    # Chunks indexed before hashing existed have no metadata; hash their text instead
+    return frozenset(
+        doc.metadata.get("chunk_hash") or chunk_hash(doc.page_content)
+        for doc in store_documents(store)
+    )
@@ -0,0 +1,278 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from beanie import PydanticObjectId
+from beanie.operators import In
+
+from app.core.config import settings
+from app.models.knowledge import DocumentItem, IngestionJob, EmbeddingChunk
+from app.services.file_service import iter_pdf_pages
+from app.services.vector_service import add_document_to_knowledge_base, IngestStats
+
+IN_FLIGHT = ["pending", "processing"]
+# How long shutdown waits for a running job's thread to notice it should stop
+SHUTDOWN_GRACE_SECONDS = 10
+
+
+@dataclass
+class JobProgress:
+    """Counters written by the worker thread and read by the event loop."""
+    pages_parsed: int = 0
+    total_pages: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_skipped: int = 0
+    total_chunks: Optional[int] = None
+
+    def as_update(self) -> dict:
+        return {
+            "pages_parsed": self.pages_parsed,
+            "total_pages": self.total_pages,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_skipped": self.chunks_skipped,
+            "total_chunks": self.total_chunks,
+        }
+
+
+@dataclass
+class _QueuedJob:
+    job_id: PydanticObjectId
+    document_id: PydanticObjectId
+    path: str  # Spooled upload; deleted once the job finishes
+
+
+class IngestionInterrupted(Exception):
+    pass
+
+
+class IngestionQueue:
+    """
+    Bounded queue of uploads waiting to be parsed, embedded and indexed.
+
+    The upload endpoint only enqueues. A fixed number of asyncio workers pull
+    jobs off the queue and run the CPU-heavy part on a thread pool of the same
+    size, so the event loop (and every websocket chat on it) stays responsive.
+
+    The queue only lives in this process, so it heartbeats every job it holds
+    (`IngestionJob.heartbeat_at`). A pending/processing job whose heartbeat
+    is older than INGEST_STALE_JOB_SECONDS belongs to a worker that died and
+    is failed by `fail_stale_jobs`.
+    """
+
+    def __init__(self, workers: int, max_queued: int, progress_interval: float):
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self._queue: asyncio.Queue[_QueuedJob] = asyncio.Queue(maxsize=max_queued)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = threading.Event()  # Checked by the ingestion threads between pages and batches
+        self.queued: set[PydanticObjectId] = set()
+        self.live: dict[PydanticObjectId, JobProgress] = {}
+
+    def start(self):
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """
+        Interrupts running jobs (their threads stop at the next page or batch),
+        then fails them and everything still queued, deleting the spooled files.
+        """
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        while not self._queue.empty():
+            queued = self._queue.get_nowait()
+            self.queued.discard(queued.job_id)
+            _remove(queued.path)
+            await _mark_failed(queued.job_id, queued.document_id, "Server shut down before the upload was processed")
+
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, job: IngestionJob, path: str):
+        """
+        Queues the spooled PDF at `path`; the queue takes ownership of the file.
+        Raises asyncio.QueueFull when the backlog is at capacity.
+        """
+        self._queue.put_nowait(_QueuedJob(job_id=job.id, document_id=job.document_id, path=path))
+        self.queued.add(job.id)
+
+    async def _worker(self):
+        while True:
+            queued = await self._queue.get()
+            self.queued.discard(queued.job_id)
+            try:
+                await self._run(queued)
+            except Exception as e:
+                print(f"⚠️ Ingestion job {queued.job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            held = list(self.queued | self.live.keys())
+            if held:
+                try:
+                    await IngestionJob.find(In(IngestionJob.id, held)).update(
+                        {"$set": {"heartbeat_at": datetime.utcnow()}}
+                    )
+                except Exception as e:
+                    print(f"⚠️ Ingestion heartbeat failed: {e}")
+
+    async def _run(self, queued: _QueuedJob):
+        thread = None
+        try:
+            job = await IngestionJob.get(queued.job_id)
+            doc = await DocumentItem.get(queued.document_id)
+            progress = self.live[queued.job_id] = JobProgress()
+
+            await job.set({IngestionJob.status: "processing", IngestionJob.started_at: datetime.utcnow()})
+            await doc.set({DocumentItem.status: "processing"})
+
+            loop = asyncio.get_running_loop()
+            thread = loop.run_in_executor(self._executor, _ingest, queued.path, queued.document_id, doc.collection,
+                                          progress, loop, self._stopping)
+            # The thread's page-extraction processes read the file by path until it's done
+            thread.add_done_callback(lambda _: _remove(queued.path))
+            try:
+                # Flush progress while the worker thread runs so other API workers can report it
+                while True:
+                    done, _ = await asyncio.wait({thread}, timeout=self.progress_interval)
+                    if done:
+                        break
+                    await job.set(progress.as_update())
+                thread.result()
+            except asyncio.CancelledError:
+                # Shutdown: give the thread a moment to stop, so nothing lands after the job is failed
+                await asyncio.wait({thread}, timeout=SHUTDOWN_GRACE_SECONDS)
+                if thread.done() and not thread.cancelled() and thread.exception() is None:
+                    await _mark_indexed(job, doc, progress)  # Finished within the grace period
+                else:
+                    await _mark_failed(job.id, doc.id, "Interrupted by server shutdown", progress)
+                    print(f"❌ Ingestion job {job.id} interrupted by shutdown.")
+                raise
+            except Exception as e:
+                await _mark_failed(job.id, doc.id, str(e), progress)
+                print(f"❌ Ingestion job {job.id} failed: {e}")
+                return
+            await _mark_indexed(job, doc, progress)
+        finally:
+            if thread is None:
+                _remove(queued.path)
+            self.live.pop(queued.job_id, None)
+
+
+async def _mark_indexed(job: IngestionJob, doc: DocumentItem, progress: JobProgress):
+    await job.set({**progress.as_update(), "status": "indexed", "finished_at": datetime.utcnow()})
+    await doc.set({DocumentItem.status: "indexed"})
+    print(f"✅ Ingestion job {job.id} indexed {progress.total_chunks} chunks.")
+
+
+async def _mark_failed(job_id: PydanticObjectId, document_id: PydanticObjectId, error: str,
+                       progress: Optional[JobProgress] = None) -> bool:
+    """
+    Fails a job (and its document) that is still pending/processing and drops
+    whatever vectors it persisted. False if it had already finished.
+    """
+    update = {**(progress.as_update() if progress else {}),
+              "status": "failed", "error": error, "finished_at": datetime.utcnow()}
+    result = await IngestionJob.find(IngestionJob.id == job_id, In(IngestionJob.status, IN_FLIGHT))\
+        .update({"$set": update})
+    if not result.modified_count:
+        return False
+    await EmbeddingChunk.find(EmbeddingChunk.document_id == document_id).delete()
+    await DocumentItem.find(DocumentItem.id == document_id, In(DocumentItem.status, IN_FLIGHT))\
+        .update({"$set": {"status": "failed"}})
+    return True
+
+
+async def fail_stale_jobs(document_id: Optional[PydanticObjectId] = None) -> int:
+    """
+    Fails pending/processing jobs nobody heartbeats any more (the worker
+    holding them crashed or was killed), optionally only those of
+    `document_id`. Run at startup and before trusting an in-flight duplicate.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.INGEST_STALE_JOB_SECONDS)
+    filters = [
+        In(IngestionJob.status, IN_FLIGHT),
+        {"$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": {"$exists": False}}]},
+    ]
+    if document_id is not None:
+        filters.append(IngestionJob.document_id == document_id)
+
+    failed = 0
+    async for job in IngestionJob.find(*filters):
+        if await _mark_failed(job.id, job.document_id, "Interrupted: the server processing it stopped"):
+            failed += 1
+    if failed and document_id is None:
+        print(f"🧹 Failed {failed} ingestion jobs left behind by a stopped worker.")
+    return failed
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _ingest(path: str, document_id: PydanticObjectId, collection: str, progress: JobProgress,
+            loop: asyncio.AbstractEventLoop, stopping: threading.Event):
+    """
+    The blocking part of an upload. Runs on the ingestion thread pool.
+    Pages stream from the extraction process pool straight into the chunker,
+    and every embedded batch is also saved to Mongo (one insert_many per batch)
+    so the index can later be rebuilt without re-embedding.
+    Raises IngestionInterrupted at the next page or batch once `stopping` is set.
+    """
+
+    def check_stopping():
+        if stopping.is_set():
+            raise IngestionInterrupted("Interrupted by server shutdown")
+
+    def on_page(parsed: int, total: int):
+        check_stopping()
+        progress.pages_parsed, progress.total_pages = parsed, total
+
+    def on_progress(stats: IngestStats):
+        progress.chunks_embedded, progress.chunks_skipped = stats.chunks_added, stats.chunks_skipped
+
+    def on_batch(texts: list[str], hashes: list[str], pages: list[int], vectors: list[list[float]], start: int):
+        check_stopping()
+        records = [
+            EmbeddingChunk.from_vector(document_id, start + i, text, h, vector, page)
+            for i, (text, h, page, vector) in enumerate(zip(texts, hashes, pages, vectors))
+        ]
+        # Motor is bound to the event loop; hand the write back to it and wait
+        asyncio.run_coroutine_threadsafe(EmbeddingChunk.insert_many(records), loop).result()
+
+    stats = add_document_to_knowledge_base(
+        iter_pdf_pages(path, on_page=on_page),
+        document_id=str(document_id),
+        collection=collection,
+        on_progress=on_progress,
+        on_batch=on_batch,
+    )
+    on_progress(stats)
+    progress.total_chunks = stats.chunks_added + stats.chunks_skipped
+    if not progress.total_chunks:
+        raise ValueError("Empty PDF")
+
+
+ingestion_queue = IngestionQueue(
+    workers=settings.INGEST_WORKERS,
+    max_queued=settings.INGEST_QUEUE_MAX,
+    progress_interval=settings.INGEST_PROGRESS_INTERVAL,
+)
@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+
+LEXICAL_FILE = "lexical.json"  # Pre-array layout, converted on load
+LEXICAL_TERMS_FILE = "lexical.terms.json"
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# "Section 22", "sec. 22B", "Rule 7(1)", "Clause 7", "Regulation 190A", "Article 14"
+_NUMBERED_RE = re.compile(
+    r"\b(section|sec|rule|clause|regulation|reg|article|art|para|paragraph)\.?\s*(\d+[a-z]?)\b", re.IGNORECASE
+)
+# "Part I", "Chapter IV", "Schedule II", "Part 2"
+_PART_RE = re.compile(r"\b(part|chapter|schedule)\s+([ivxlc]+|\d+)\b", re.IGNORECASE)
+# "First Schedule", "Second Schedule"
+_ORDINAL_SCHEDULE_RE = re.compile(r"\b(first|second|third|fourth|fifth|sixth)\s+schedule\b", re.IGNORECASE)
+
+_ALIASES = {"sec": "section", "reg": "regulation", "art": "article", "para": "paragraph"}
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it of on or the this that to under was what when "
+    "where which who why will with does do can me my about tell explain".split()
+)
+
+
+def citation_terms(text: str) -> list[str]:
+    """Normalised statute references, e.g. "Section 22 of the CA Act" -> ["section:22"]."""
+    terms = [f"{_ALIASES.get(kind.lower(), kind.lower())}:{ref.lower()}" for kind, ref in _NUMBERED_RE.findall(text)]
+    terms += [f"{kind.lower()}:{ref.lower()}" for kind, ref in _PART_RE.findall(text)]
+    terms += [f"schedule:{ordinal.lower()}" for ordinal in _ORDINAL_SCHEDULE_RE.findall(text)]
+    return terms
+
+
+def tokenize(text: str) -> list[str]:
+    """Plain word terms plus citation terms, so "Section 22" is matched as a unit."""
+    words = [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+    return words + citation_terms(text)
+
+
+class LexicalIndex:
+    """
+    Inverted index over the chunks of one segment.
+    Positions match the segment's FAISS positions, so hits from both
+    indexes can be fused. Immutable once built, like the segment itself.
+
+    Postings are stored CSR-style: term -> row, and row -> a slice of the
+    `positions` / `tfs` arrays. On disk these are .npy files that are
+    memory-mapped on load, so every worker shares one page-cache copy.
+    """
+
+    def __init__(self, terms: dict[str, int], offsets: np.ndarray, positions: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.positions = positions
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.total_length = int(doc_lengths.sum()) if len(doc_lengths) else 0
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "LexicalIndex":
+        postings: dict[str, dict[int, int]] = {}
+        doc_lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, {})[position] = tf
+        return cls.from_postings(postings, doc_lengths)
+
+    @classmethod
+    def from_postings(cls, postings: dict[str, dict[int, int]], doc_lengths: list[int]) -> "LexicalIndex":
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        positions, tfs = [], []
+        for row, term in enumerate(terms):
+            docs = sorted(postings[term].items())  # Ascending positions, for intersections
+            positions.extend(pos for pos, _ in docs)
+            tfs.extend(tf for _, tf in docs)
+            offsets[row + 1] = len(positions)
+        return cls(
+            {term: row for row, term in enumerate(terms)},
+            offsets,
+            np.asarray(positions, dtype=np.int32),
+            np.asarray(tfs, dtype=np.int32),
+            np.asarray(doc_lengths, dtype=np.int32),
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.doc_lengths)
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """(positions, term frequencies) of the chunks containing `term`."""
+        row = self.terms.get(term)
+        if row is None:
+            return _EMPTY, _EMPTY
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        return self.positions[start:stop], self.tfs[start:stop]
+
+    def document_frequency(self, term: str) -> int:
+        row = self.terms.get(term)
+        return 0 if row is None else int(self.offsets[row + 1] - self.offsets[row])
+
+    # --- Persistence (lives next to index.faiss inside the segment directory) ---
+
+    def save(self, directory: str):
+        with open(os.path.join(directory, LEXICAL_TERMS_FILE), "w", encoding="utf-8") as f:
+            json.dump(sorted(self.terms, key=self.terms.get), f, separators=(",", ":"))
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f"lexical.{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "LexicalIndex | None":
+        path = os.path.join(directory, LEXICAL_TERMS_FILE)
+        if not os.path.exists(path):
+            return cls._load_json(directory)
+        with open(path, "r", encoding="utf-8") as f:
+            terms = {term: row for row, term in enumerate(json.load(f))}
+        arrays = {name: load_array(os.path.join(directory, f"lexical.{name}.npy"), mmap) for name in _ARRAYS}
+        return cls(terms, **arrays)
+
+    @classmethod
+    def _load_json(cls, directory: str) -> "LexicalIndex | None":
+        """Segments written before the array layout kept postings in lexical.json."""
+        path = os.path.join(directory, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: {int(pos): tf for pos, tf in docs} for term, docs in data["postings"].items()}
+        return cls.from_postings(postings, data["doc_lengths"])
+
+
+_ARRAYS = ("offsets", "positions", "tfs", "doc_lengths")
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def load_array(path: str, mmap: bool = True) -> np.ndarray:
+    """np.load, memory-mapped when asked (empty arrays can't be mapped and are read instead)."""
+    if mmap:
+        try:
+            return np.load(path, mmap_mode="r")
+        except ValueError:
+            pass
+    return np.load(path)
+
+
+def bm25_search(indexes: list[LexicalIndex], query: str, k: int,
+                required: Iterable[str] = ()) -> list[tuple[tuple[int, int], float]]:
+    """
+    BM25 across several segment indexes, using corpus-wide statistics so scores
+    are comparable between segments. Returns ((segment_idx, position), score),
+    best first. Only documents containing every `required` term are considered.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    required = list(required)
+    total_docs = sum(ix.size for ix in indexes)
+    if not terms or not total_docs:
+        return []
+
+    avg_len = sum(ix.total_length for ix in indexes) / total_docs
+    idf = {}
+    for term in terms:
+        df = sum(ix.document_frequency(term) for ix in indexes)
+        if df:
+            idf[term] = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+    hits = []
+    for seg_idx, ix in enumerate(indexes):
+        allowed = None
+        if required:
+            allowed = ix.postings(required[0])[0]
+            for term in required[1:]:
+                allowed = np.intersect1d(allowed, ix.postings(term)[0], assume_unique=True)
+            if not len(allowed):
+                continue
+
+        matched, contributions = [], []
+        for term, weight in idf.items():
+            positions, tfs = ix.postings(term)
+            if allowed is not None:
+                keep = np.isin(positions, allowed, assume_unique=True)
+                positions, tfs = positions[keep], tfs[keep]
+            if not len(positions):
+                continue
+            tfs = tfs.astype(np.float64)
+            norm = tfs + BM25_K1 * (1 - BM25_B + BM25_B * ix.doc_lengths[positions] / avg_len)
+            matched.append(positions)
+            contributions.append(weight * tfs * (BM25_K1 + 1) / norm)
+        if not matched:
+            continue
+
+        # Sum each chunk's per-term contributions, then keep this segment's best k
+        positions, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        best = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else range(len(scores))
+        hits.extend(((seg_idx, int(positions[i])), float(scores[i])) for i in best)
+
+    return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(*rankings: list, k: int = 60) -> list:
+    """Merges ranked lists of keys; robust to BM25 and L2 scores living on different scales."""
+    fused: dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import time
+from enum import IntEnum
+from typing import AsyncIterator, Optional
+
+import groq
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+from app.core import metrics
+from app.core.metrics import span
+from app.services.history_service import count_tokens
+
+# HTTP statuses worth retrying: rate limited, or Groq having a bad moment
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    """Lower goes first. The answer is what the user is waiting on."""
+    ANSWER = 0
+    REWRITE = 1
+    SUMMARY = 2  # Background folding of old turns; can always wait
+
+
+class LLMError(Exception):
+    """Base for failures the websocket reports to the client instead of dropping the connection."""
+    code = "llm_error"
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMOverloadedError(LLMError):
+    """Too many calls queued, or waited too long for a slot."""
+    code = "llm_busy"
+
+
+class LLMUnavailableError(LLMError):
+    """The provider kept failing (or rate limiting) after all retries."""
+    code = "llm_unavailable"
+
+
+class TokenBucket:
+    """`per_minute` units, refilled continuously. 0 disables the limit."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (a request larger than the bucket waits for a full one)."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.capacity:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+
+class _Flight:
+    """
+    One in-flight LLM call, shared by every caller that sent the same prompt.
+    Chunks are buffered so late joiners replay from the start; the call is
+    cancelled if every subscriber goes away.
+    """
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def push(self, chunk: str):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self.task:
+                self.task.cancel()
+
+
+class LLMScheduler:
+    """
+    Front door for every call to one model (Groq limits are per model):
+
+    - Token buckets for requests/min and tokens/min, sized to the account's limits,
+      so bursts queue here instead of bouncing off Groq with 429s.
+    - At most `max_concurrency` calls in flight; waiting calls are admitted by
+      priority (answers before rewrites before summaries), FIFO within one.
+    - Identical prompts already in flight are coalesced into one call.
+    - Retryable failures back off with full jitter, honouring Retry-After; a 429
+      pauses the whole scheduler, not just the caller that hit it.
+    """
+
+    def __init__(self, model: BaseChatModel, model_name: str, max_concurrency: int = 4,
+                 requests_per_minute: int = 0, tokens_per_minute: int = 0, max_queue: int = 100,
+                 max_queue_wait: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 20.0):
+        self.model = model
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cooldown_until = 0.0  # Set from Retry-After on a 429
+        self._waiting: list[tuple[int, int]] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._flights: dict[str, _Flight] = {}
+
+        self._calls_total = 0
+        self._coalesced_total = 0
+        self._retries_total = 0
+        self._rate_limited_total = 0
+        self._queue_wait_seconds_total = 0.0
+
+    # --- Public API ---
+
+    async def ainvoke(self, messages: list[BaseMessage], priority: Priority, output_tokens: int = 256) -> str:
+        return "".join([chunk async for chunk in self._subscribe(messages, priority, output_tokens, stream=False)])
+
+    def astream(self, messages: list[BaseMessage], priority: Priority, output_tokens: int = 256) -> AsyncIterator[str]:
+        return self._subscribe(messages, priority, output_tokens, stream=True)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._waiting),
+            "active": self._active,
+            "calls_total": self._calls_total,
+            "coalesced_total": self._coalesced_total,
+            "retries_total": self._retries_total,
+            "rate_limited_total": self._rate_limited_total,
+            "queue_wait_seconds_total": round(self._queue_wait_seconds_total, 3),
+        }
+
+    # --- Coalescing ---
+
+    def _key(self, messages: list[BaseMessage], stream: bool) -> str:
+        payload = json.dumps([self.model_name, stream, [(m.type, m.content) for m in messages]], default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    async def _subscribe(self, messages, priority, output_tokens, stream) -> AsyncIterator[str]:
+        key = self._key(messages, stream)
+        flight = self._flights.get(key)
+        if flight is None:
+            if len(self._waiting) >= self.max_queue:
+                raise LLMOverloadedError("The assistant is busy, please retry shortly.", retry_after=5)
+            flight = self._flights[key] = _Flight()
+            tokens = count_tokens(messages) + output_tokens
+            flight.task = asyncio.create_task(self._run(key, flight, messages, priority, tokens, stream))
+        else:
+            self._coalesced_total += 1
+        async for chunk in flight.follow():
+            yield chunk
+
+    async def _run(self, key: str, flight: _Flight, messages, priority: Priority, tokens: int, stream: bool):
+        try:
+            await self._call_with_retries(flight, messages, priority, tokens, stream)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(LLMUnavailableError("The request was cancelled."))
+            raise
+        except BaseException as e:
+            flight.finish(e)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    # --- Retries ---
+
+    async def _call_with_retries(self, flight: _Flight, messages, priority: Priority, tokens: int, stream: bool):
+        for attempt in range(self.max_retries + 1):
+            await self._admit(priority, tokens)
+            try:
+                self._calls_total += 1
+                if stream:
+                    async for chunk in self.model.astream(messages):
+                        if chunk.content:
+                            flight.push(chunk.content)
+                else:
+                    flight.push((await self.model.ainvoke(messages)).content)
+                return
+            except (groq.APIStatusError, groq.APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                retry_after = _retry_after(e)
+                if status == 429:
+                    self._rate_limited_total += 1
+                    # Everyone waits, not just us: the limit is per account + model
+                    self._cooldown_until = max(self._cooldown_until, time.monotonic() + (retry_after or 1.0))
+                retryable = status is None or status in RETRYABLE_STATUS
+                # Half an answer already went to the client: can't restart it invisibly
+                if not retryable or flight.chunks or attempt == self.max_retries:
+                    raise LLMUnavailableError(
+                        f"The language model is unavailable ({status or type(e).__name__}).",
+                        retry_after=retry_after,
+                    ) from e
+            finally:
+                await self._release()
+
+            delay = self._backoff(attempt, retry_after)
+            self._retries_total += 1
+            print(f"🔁 {self.model_name}: retry {attempt + 1}/{self.max_retries} in {delay:.1f}s ({status or 'connection error'})")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter keeps a burst of failed calls from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = min(self.backoff_max, retry_after) + random.uniform(0, self.backoff_base)
+        return delay
+
+    # --- Admission (priority queue + buckets + concurrency) ---
+
+    async def _admit(self, priority: Priority, tokens: int):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        entry = (int(priority), next(self._seq))
+        started = time.monotonic()
+        deadline = started + self.max_queue_wait
+        with span("llm_queue"):
+            async with self._cond:
+                heapq.heappush(self._waiting, entry)
+                try:
+                    while True:
+                        now = time.monotonic()
+                        delay = self._admission_delay(entry, tokens, now)
+                        if delay == 0:
+                            break
+                        if now >= deadline:
+                            raise LLMOverloadedError("The assistant is busy, please retry shortly.",
+                                                     retry_after=max(1.0, delay or 0.0))
+                        timeout = deadline - now if delay is None else min(delay, deadline - now)
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), timeout)
+                        except asyncio.TimeoutError:
+                            pass
+                except BaseException:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise
+
+                heapq.heappop(self._waiting)
+                self._active += 1
+                now = time.monotonic()
+                self._requests.take(1, now)
+                self._tokens.take(tokens, now)
+                self._cond.notify_all()  # The next in line may be admissible too
+
+        waited = time.monotonic() - started
+        self._queue_wait_seconds_total += waited
+        metrics.llm_queue_wait_seconds.observe(waited, priority=priority.name.lower())
+
+    def _admission_delay(self, entry: tuple, tokens: int, now: float) -> Optional[float]:
+        """0 = go now; seconds = wait for the buckets; None = wait to be notified (not our turn / no slot)."""
+        if self._waiting[0] != entry or self._active >= self.max_concurrency:
+            return None
+        delay = max(
+            self._cooldown_until - now,
+            self._requests.wait_time(1, now),
+            self._tokens.wait_time(tokens, now),
+        )
+        return delay if delay > 0 else 0
+
+    async def _release(self):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After (or retry-after-ms) header, if the provider sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to our own backoff
+    return None
@@ -1,12 +1,24 @@
+import asyncio
 import os
+from typing import AsyncIterator, Iterable, Optional
 from dotenv import load_dotenv
 
+import numpy as np
 from langchain_groq import ChatGroq
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from starlette.concurrency import run_in_threadpool
 
-from langchain_core.runnables import RunnablePassthrough
+from app.core.config import settings
+from app.core.metrics import span
 from app.models.chat import RoleEnum
+from app.services.answer_cache import AnswerCache, replay_chunks
+from app.services.embedding_service import normalize_query
+from app.services.history_service import count_tokens, estimate_tokens
+from app.services.index_manager import SegmentedRetriever
+from app.services.lexical_index import citation_terms
+from app.services.llm_scheduler import LLMScheduler, Priority
 from app.services.vector_service import get_retriever
 
 load_dotenv()
@@ -14,7 +26,29 @@ load_dotenv()
 # Groq LLM
 llm = ChatGroq(
     groq_api_key=os.getenv("GROQ_API_KEY"),
-    model_name="llama-3.1-8b-instant"   # free-tier friendly
+    model_name=settings.LLM_MODEL_NAME,   # free-tier friendly
+    base_url=settings.GROQ_API_BASE,
+    max_retries=0                         # The scheduler retries (and knows about every other caller)
+)
+
+# Every call goes through the scheduler: rate limits, priorities, coalescing, backoff
+llm_scheduler = LLMScheduler(
+    llm,
+    model_name=settings.LLM_MODEL_NAME,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    max_queue=settings.LLM_MAX_QUEUE,
+    max_queue_wait=settings.LLM_MAX_QUEUE_WAIT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_max=settings.LLM_BACKOFF_MAX_SECONDS,
+)
+
+# Same standalone question + same retrieved chunks + same index version = same answer
+answer_cache = AnswerCache(
+    max_size=settings.ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    enabled=settings.ANSWER_CACHE_ENABLED,
 )
 
 # --- 1. History-Aware Query Rewriter Prompt ---
@@ -22,6 +56,7 @@ contextualize_prompt = ChatPromptTemplate.from_messages([
     ("system",
      "Rewrite the user's message into a standalone question using the chat history. "
      "Do NOT answer. Only rewrite."),
+    MessagesPlaceholder("summary", optional=True),
     MessagesPlaceholder("chat_history"),
     ("human", "{input}")
 ])
@@ -33,12 +68,29 @@ qa_prompt = ChatPromptTemplate.from_messages([
      "If answer is not in the context, say: "
      "'I cannot answer this based on the provided Chartered Accountant Law documents.'\n\n"
      "--- CONTEXT START ---\n{context}\n--- CONTEXT END ---"),
+    MessagesPlaceholder("summary", optional=True),
     MessagesPlaceholder("chat_history"),
     ("human", "{input}")
 ])
 
+# --- 3. Rolling Summary Prompt (folds old turns so prompts stop growing) ---
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of a conversation about Chartered Accountant law. "
+     "Merge the existing summary with the new messages into one concise summary. Keep the "
+     "questions asked, sections/rules cited and conclusions reached; drop pleasantries.\n\n"
+     "Existing summary:\n{summary}"),
+    MessagesPlaceholder("messages"),
+    ("human", "Write the updated summary.")
+])
+
+# --- 4. Completion tokens reserved against the tokens/min budget, per call ---
+REWRITE_OUTPUT_TOKENS = 60
+ANSWER_OUTPUT_TOKENS = 400
+SUMMARY_OUTPUT_TOKENS = 250
 
-async def generate_response(user_message: str, chat_history: list):
+
+def _to_lang_history(chat_history: list) -> list:
     # Convert DB history → LangChain Messages
     lang_history = []
     for msg in chat_history:
@@ -46,30 +98,158 @@ async def generate_response(user_message: str, chat_history: list):
             lang_history.append(HumanMessage(content=msg.content))
         else:
             lang_history.append(AIMessage(content=msg.content))
+    return lang_history
 
-    # Retriever
-    retriever = get_retriever()
-
-    # --- Build RAG Pipeline ---
-    # Step 1: Rewrite query
-    rewrite_chain = contextualize_prompt | llm | (lambda x: x.content)
-
-    # Step 2: Retrieve using rewritten question
-    rag_retriever_chain = {
-    "context": lambda x: retriever.invoke(rewrite_chain.invoke({
-        "input": x["input"],
-        "chat_history": x["chat_history"]
-    })),
-    "input": lambda x: x["input"],
-    "chat_history": lambda x: x["chat_history"],   # <-- FIX HERE
-    }
 
-    rag_chain = rag_retriever_chain | qa_prompt | llm
+def _summary_messages(summary: Optional[str]) -> list:
+    if not summary:
+        return []
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
+
+
+def _format_docs(docs: list[Document]) -> str:
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    a, b = np.asarray(a), np.asarray(b)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom else 0.0
+
+
+async def retrieve_context(user_message: str, lang_history: list, summary_messages: list = (),
+                           retriever: Optional[SegmentedRetriever] = None) -> list[Document]:
+    """
+    Step 1 + 2 of the pipeline: rewrite (if needed) and retrieve.
+
+    - No history (and no summary): nothing to rewrite, so skip the Groq round trip entirely.
+    - With history: search on the raw message *while* the rewrite runs. If the
+      rewritten question embeds close enough to the raw one, keep the
+      speculative hits; otherwise search again with the rewritten question.
+    - Citation lookups ("Section 22 ...") are served by the inverted index
+      without embedding at all.
+    """
+    # One snapshot for the whole turn, so both searches see the same index version
+    retriever = retriever or await run_in_threadpool(get_retriever)
+
+    if not lang_history and not summary_messages:
+        return await retriever.ainvoke(user_message)
+
+    speculative = asyncio.create_task(retriever.aretrieve(user_message))
+    try:
+        with span("rewrite"):
+            question = await llm_scheduler.ainvoke(contextualize_prompt.format_messages(
+                input=user_message,
+                summary=list(summary_messages),
+                chat_history=lang_history
+            ), Priority.REWRITE, REWRITE_OUTPUT_TOKENS)
+        raw_vector, raw_docs = await speculative
+    finally:
+        speculative.cancel()
 
-    # --- Run the RAG pipeline ---
-    result = await rag_chain.ainvoke({
+    if normalize_query(question) == normalize_query(user_message):
+        return raw_docs
+    if raw_vector is None or citation_terms(question):
+        # Citation lookup on either side: let the retriever pick its fast path for the rewrite
+        return await retriever.ainvoke(question)
+
+    question_vector = await retriever.aembed(question)
+    if _cosine(raw_vector, question_vector) >= settings.SPECULATIVE_RETRIEVAL_MIN_SIMILARITY:
+        return raw_docs
+    return await retriever.asearch(question, question_vector)
+
+
+async def _prepare_inputs(user_message: str, chat_history: list, summary: Optional[str],
+                          collections: Optional[Iterable[str]] = None) -> tuple[dict, Optional[tuple], int]:
+    """
+    Returns (prompt inputs, answer cache key, index version). The key is None
+    when the turn has history or a summary: the answer prompt includes them,
+    so the same question can legitimately get a different answer.
+    `collections` limits retrieval to those shards (None = everything).
+    """
+    lang_history = _to_lang_history(chat_history)
+    summary_messages = _summary_messages(summary)
+    # Off the loop: until warm-up has mapped the index in, this waits on the index manager's lock
+    retriever = await run_in_threadpool(get_retriever, collections)
+    with span("retrieve"):
+        docs = await retrieve_context(user_message, lang_history, summary_messages, retriever)
+    inputs = {
+        "context": _format_docs(docs),
         "input": user_message,
+        "summary": summary_messages,
         "chat_history": lang_history
-    })
+    }
+    cache_key = None if lang_history or summary_messages else answer_cache.key(user_message, docs)
+    return inputs, cache_key, retriever.snapshot.version
+
+
+def prompt_token_counts(inputs: dict) -> dict[str, int]:
+    """Approx. tokens per prompt section. The rewrite prompt sends all but `context`."""
+    return {
+        "summary": count_tokens(inputs["summary"]),
+        "history": count_tokens(inputs["chat_history"]),
+        "context": estimate_tokens(inputs["context"]),
+        "input": estimate_tokens(inputs["input"]),
+    }
+
+
+def _cached_answer(cache_key: Optional[tuple], version: int) -> Optional[str]:
+    if cache_key is None:
+        return None
+    return answer_cache.get(cache_key, version)
+
+
+async def generate_response(user_message: str, chat_history: list, summary: Optional[str] = None,
+                            collections: Optional[Iterable[str]] = None):
+    inputs, cache_key, version = await _prepare_inputs(user_message, chat_history, summary, collections)
+    cached = _cached_answer(cache_key, version)
+    if cached is not None:
+        return cached
+
+    # --- Step 3: Answer ---
+    with span("answer"):
+        answer = await llm_scheduler.ainvoke(qa_prompt.format_messages(**inputs), Priority.ANSWER, ANSWER_OUTPUT_TOKENS)
+    if cache_key is not None:
+        answer_cache.set(cache_key, version, answer)
+    return answer
+
+
+async def stream_response(user_message: str, chat_history: list, summary: Optional[str] = None,
+                          token_counts: Optional[dict] = None, details: Optional[dict] = None,
+                          collections: Optional[Iterable[str]] = None) -> AsyncIterator[str]:
+    """
+    Same pipeline as `generate_response`, but yields the answer token by token
+    as Groq produces it (the rewrite + retrieval steps still run first).
+    If given, `token_counts` is filled with `prompt_token_counts` before the first token
+    (left empty when the answer comes from the cache), and `details["cached"]` says which it was.
+    `collections` is the chat's document scope.
+    """
+    inputs, cache_key, version = await _prepare_inputs(user_message, chat_history, summary, collections)
+    cached = _cached_answer(cache_key, version)
+    if details is not None:
+        details["cached"] = cached is not None
+    if cached is not None:
+        for delta in replay_chunks(cached):
+            yield delta
+        return
+
+    if token_counts is not None:
+        token_counts.update(prompt_token_counts(inputs))
+
+    parts = []
+    with span("answer"):
+        async for delta in llm_scheduler.astream(qa_prompt.format_messages(**inputs), Priority.ANSWER, ANSWER_OUTPUT_TOKENS):
+            parts.append(delta)
+            yield delta
+    # Only reached when the whole answer streamed (errors and disconnects skip it)
+    if cache_key is not None:
+        answer_cache.set(cache_key, version, "".join(parts))
+
 
-    return result.content
+async def summarize_history(summary: Optional[str], chat_history: list) -> str:
+    """Folds `chat_history` into the existing rolling summary."""
+    with span("summarize"):
+        return await llm_scheduler.ainvoke(summary_prompt.format_messages(
+            summary=summary or "(none yet)",
+            messages=_to_lang_history(chat_history)
+        ), Priority.SUMMARY, SUMMARY_OUTPUT_TOKENS)
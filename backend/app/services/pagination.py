@@ -0,0 +1,37 @@
+import base64
+from datetime import datetime
+
+from beanie import PydanticObjectId
+
+# Keyset ("seek") pagination: a page boundary is the (sort value, _id) of the
+# last item seen, so Mongo jumps straight to it on the compound index instead
+# of walking and discarding `skip` documents.
+
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(value: datetime, id: PydanticObjectId) -> str:
+    raw = f"{value.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, PydanticObjectId]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        value, id = raw.split("|")
+        return datetime.fromisoformat(value), PydanticObjectId(id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def seek_filter(field: str, cursor: str, op: str) -> dict:
+    """
+    Raw Mongo filter for documents strictly after (`op="$gt"`) or before
+    (`op="$lt"`) the cursor position in (field, _id) order.
+    """
+    value, id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "_id": {op: id}},
+    ]}
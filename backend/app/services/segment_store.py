@@ -0,0 +1,475 @@
+import fcntl
+import json
+import mmap
+import os
+import pickle
+import shutil
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Iterable
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.ann_index import index_type, store_documents
+from app.services.lexical_index import LexicalIndex, load_array
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "manifest.lock"
+SEGMENTS_DIR = "segments"
+
+# Segment files. Everything but the term list is memory-mapped on load, so
+# N workers on one host share a single page-cache copy of the index.
+FAISS_FILE = "index.faiss"
+DOCS_FILE = "docs.bin"             # Concatenated JSON documents
+DOC_OFFSETS_FILE = "docs.offsets.npy"
+HASHES_FILE = "hashes.npy"         # Sorted chunk hashes, for dedup lookups
+VECTORS_FILE = "vectors.npy"       # Exact float32 vectors, IVF-PQ segments only (its codes are lossy)
+LEGACY_DOCSTORE_FILE = "index.pkl" # Pickled LangChain docstore (pre-mmap segments)
+LEGACY_PLACEHOLDER_TEXT = "Start of index"  # Seeded into empty indexes by the old single-file layout
+
+# Shard for uploads that don't name a collection (and for segments written before collections)
+DEFAULT_COLLECTION = "default"
+
+
+@dataclass
+class SegmentInfo:
+    name: str
+    count: int  # Number of vectors, used by the compactor to pick small segments
+    type: str = "flat"  # FAISS index type (see ann_index.INDEX_TYPES)
+    collection: str = DEFAULT_COLLECTION  # Shard: a segment only ever holds chunks of one collection
+
+
+@dataclass
+class RetiredSegment:
+    name: str
+    retired_at: float
+
+
+@dataclass
+class Manifest:
+    """
+    The single source of truth for which segments make up the index.
+    Segments themselves are immutable once written; only this file changes.
+    """
+    version: int = 0
+    segments: list[SegmentInfo] = field(default_factory=list)
+    retired: list[RetiredSegment] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Manifest":
+        return cls(
+            version=data.get("version", 0),
+            segments=[SegmentInfo(**s) for s in data.get("segments", [])],
+            retired=[RetiredSegment(**r) for r in data.get("retired", [])],
+        )
+
+
+class SegmentStore:
+    """
+    Append-only on-disk layout for the FAISS index:
+
+        faiss_index/
+            manifest.json          <- list of live segments and the collection each
+                                      belongs to (replaced atomically)
+            manifest.lock          <- cross-process writer lock
+            segments/seg-.../      <- one directory per ingestion: index.faiss, docs.bin
+                                      (+ offsets), hashes.npy and the BM25 postings
+                                      (lexical.*), all memory-mappable
+
+    A crash can leave an orphaned segment directory behind, but never a
+    manifest that points at a half-written segment.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.segments_dir = os.path.join(root, SEGMENTS_DIR)
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self._migrate_legacy_layout()
+
+    # --- Manifest ---
+
+    def read_manifest(self) -> Manifest:
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return Manifest()
+        with open(path, "r", encoding="utf-8") as f:
+            return Manifest.from_dict(json.load(f))
+
+    def write_manifest(self, manifest: Manifest):
+        """Write-to-temp + fsync + rename, so readers see the old or the new file, never half of one."""
+        path = os.path.join(self.root, MANIFEST_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def locked(self):
+        """
+        Exclusive lock around read-modify-write of the manifest.
+        Uses flock so that several uvicorn workers can't overwrite each other.
+        """
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self.read_manifest()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- Segments ---
+
+    def write_segment(self, store: FAISS, lexical: LexicalIndex, chunk_hashes: Iterable[str],
+                      collection: str = DEFAULT_COLLECTION, vectors: np.ndarray | None = None) -> SegmentInfo:
+        """
+        Persists a store (and its inverted index) as a new immutable segment and
+        returns its manifest entry. `vectors` are the exact vectors behind the
+        index; they are kept next to IVF-PQ indexes so the segment can be merged again.
+        """
+        name = _segment_name()
+        tmp_dir = os.path.join(self.segments_dir, f".tmp-{name}")
+        os.makedirs(tmp_dir)
+        faiss.write_index(store.index, os.path.join(tmp_dir, FAISS_FILE))
+        if vectors is not None and index_type(store.index) == "ivfpq":
+            np.save(os.path.join(tmp_dir, VECTORS_FILE), np.asarray(vectors, dtype=np.float32))
+        _write_documents(tmp_dir, store_documents(store))
+        _write_hashes(tmp_dir, chunk_hashes)
+        lexical.save(tmp_dir)
+        os.rename(tmp_dir, os.path.join(self.segments_dir, name))
+        return SegmentInfo(name=name, count=store.index.ntotal, type=index_type(store.index), collection=collection)
+
+    def begin_segment(self, collection: str = DEFAULT_COLLECTION) -> "SegmentWriter":
+        """A segment written document by document, for indexes too big to build in memory."""
+        return SegmentWriter(self, collection)
+
+    def load_segment(self, info: SegmentInfo, embeddings, hash_fn,
+                     use_mmap: bool = True) -> tuple[FAISS, LexicalIndex, "ChunkHashes"]:
+        """
+        Opens a segment. With `use_mmap`, vectors, documents, hashes and postings
+        are mapped rather than read, so they live in the shared page cache.
+        Older segments (pickled docstore, JSON postings) are converted in place
+        the first time; `hash_fn` fingerprints chunks that predate stored hashes.
+        """
+        path = self.segment_path(info.name)
+        if not os.path.exists(os.path.join(path, HASHES_FILE)):
+            self._upgrade_segment(path, embeddings, hash_fn)
+
+        index = read_index(os.path.join(path, FAISS_FILE), info.type, use_mmap)
+        docstore = MappedDocstore(path, use_mmap)
+        store = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=PositionIds(len(docstore)),
+        )
+        return store, LexicalIndex.load(path, mmap=use_mmap), ChunkHashes.load(path, use_mmap)
+
+    def load_vectors(self, name: str) -> np.ndarray | None:
+        """The exact vectors kept with an IVF-PQ segment (mapped), or None if it has none."""
+        path = os.path.join(self.segment_path(name), VECTORS_FILE)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    def has_vectors(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.segment_path(name), VECTORS_FILE))
+
+    def _upgrade_segment(self, path: str, embeddings, hash_fn):
+        """
+        Rewrites the docstore, postings and hashes of a pre-mmap segment in the
+        mapped layout (index.faiss is already mappable). Other workers may do
+        the same at the same time; every file is replaced atomically with
+        identical content, so that's harmless. hashes.npy goes last: it marks
+        the segment as converted.
+        """
+        # Allow dangerous deserialization because we created the file ourselves
+        store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        docs = store_documents(store)
+        staging = os.path.join(path, f".upgrade-{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        try:
+            _write_documents(staging, docs)
+            lexical = LexicalIndex.load(path, mmap=False)
+            if lexical is None:
+                # Segments from before the lexical index existed: build it once and keep it
+                lexical = LexicalIndex.from_texts(doc.page_content for doc in docs)
+            lexical.save(staging)
+            _write_hashes(staging, (doc.metadata.get("chunk_hash") or hash_fn(doc.page_content) for doc in docs))
+            files = sorted(os.listdir(staging), key=lambda f: f == HASHES_FILE)
+            for filename in files:
+                os.replace(os.path.join(staging, filename), os.path.join(path, filename))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        print(f"📦 Converted segment {os.path.basename(path)} to the memory-mapped layout.")
+
+    def segment_path(self, name: str) -> str:
+        return os.path.join(self.segments_dir, name)
+
+    def remove_segment(self, name: str):
+        shutil.rmtree(self.segment_path(name), ignore_errors=True)
+
+    def _migrate_legacy_layout(self):
+        """
+        Older deployments saved a single `index.faiss`/`index.pkl` pair in the root.
+        Move it into the first segment so nothing has to be re-embedded, minus
+        the "Start of index" placeholder the old code seeded empty indexes with.
+        """
+        legacy_index = os.path.join(self.root, "index.faiss")
+        legacy_docstore = os.path.join(self.root, "index.pkl")
+        if not os.path.exists(legacy_index) and not os.path.exists(legacy_docstore):
+            return
+
+        with self.locked() as manifest:
+            if not (os.path.exists(legacy_index) and os.path.exists(legacy_docstore)):
+                if os.path.exists(legacy_index) or os.path.exists(legacy_docstore):
+                    print(f"⚠️ Incomplete legacy FAISS index in {self.root} (needs index.faiss and index.pkl); leaving it alone.")
+                return  # Or another worker migrated it while we waited for the lock
+
+            name = "seg-0000000000000-legacy"
+            count = None  # Already in the manifest: a crash hit between the two steps below
+            if all(info.name != name for info in manifest.segments):
+                count = self._write_legacy_segment(name, legacy_index, legacy_docstore)
+                if count:
+                    manifest.segments.insert(0, SegmentInfo(name=name, count=count))
+                    manifest.version += 1
+                    self.write_manifest(manifest)
+            # Only dropped once the manifest has the segment, so a crash just repeats the migration
+            os.remove(legacy_index)
+            os.remove(legacy_docstore)
+            if count == 0:
+                print("📦 Removed legacy FAISS index: it only held the placeholder.")
+            elif count:
+                print(f"📦 Migrated legacy FAISS index into segment {name} ({count} vectors).")
+
+    def _write_legacy_segment(self, name: str, index_path: str, docstore_path: str) -> int:
+        """
+        Copies a `save_local` pair into segment `name` without the placeholder
+        chunk and returns the number of vectors kept (0: nothing to migrate).
+        The pair is converted to the mapped layout on first load.
+        """
+        index = faiss.read_index(index_path)
+        with open(docstore_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        placeholder = [
+            position for position, doc_id in index_to_docstore_id.items()
+            if getattr(docstore.search(doc_id), "page_content", None) == LEGACY_PLACEHOLDER_TEXT
+        ]
+        if placeholder:
+            # Flat indexes renumber on removal, so the docstore ids are renumbered the same way
+            index.remove_ids(np.array(placeholder, dtype=np.int64))
+            docstore.delete([index_to_docstore_id[position] for position in placeholder])
+            dropped = set(placeholder)
+            index_to_docstore_id = dict(enumerate(
+                doc_id for position, doc_id in sorted(index_to_docstore_id.items()) if position not in dropped
+            ))
+        if index.ntotal == 0:
+            return 0
+
+        target = self.segment_path(name)
+        tmp_dir = os.path.join(self.segments_dir, f".tmp-{name}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        faiss.write_index(index, os.path.join(tmp_dir, FAISS_FILE))
+        with open(os.path.join(tmp_dir, LEGACY_DOCSTORE_FILE), "wb") as f:
+            pickle.dump((docstore, index_to_docstore_id), f)
+        os.rename(tmp_dir, target)
+        return index.ntotal
+
+
+def read_index(path: str, kind: str, use_mmap: bool = True) -> faiss.Index:
+    """
+    Reads a FAISS index, memory-mapping its vectors where this FAISS build
+    supports it (flat / HNSW storage; IVF inverted lists). Falls back to a
+    normal read otherwise. Mapped indexes are read-only, which segments are.
+    """
+    if use_mmap:
+        # IVF lists and flat codes need different flags, and FAISS rejects the two combined
+        flag = faiss.IO_FLAG_MMAP if kind == "ivfpq" else getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        if flag:
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass
+    return faiss.read_index(path)
+
+
+def _segment_name() -> str:
+    return f"seg-{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+
+
+def _encode_document(doc: Document) -> bytes:
+    return json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, default=str).encode()
+
+
+def _write_documents(directory: str, docs: list[Document]):
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    with open(os.path.join(directory, DOCS_FILE), "wb") as f:
+        for i, doc in enumerate(docs):
+            data = _encode_document(doc)
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(directory, DOC_OFFSETS_FILE), offsets)
+
+
+def _write_hashes(directory: str, hashes: Iterable[str]):
+    np.save(os.path.join(directory, HASHES_FILE), np.sort(np.asarray(list(hashes), dtype="S64")))
+
+
+class SegmentWriter:
+    """
+    Builds a segment on disk as documents arrive: each one is appended to
+    docs.bin (its offset and hash to raw side files) straight away, so the
+    caller only keeps the FAISS index and its current vector batch in memory.
+    Batches passed to `add_vectors` are appended to a raw file the same way
+    and kept as vectors.npy if the index turns out to be IVF-PQ.
+    `finish` writes the index, sorts the hashes in a mapped file, builds the
+    postings by reading docs.bin back, and renames the directory into place.
+    """
+
+    def __init__(self, store: SegmentStore, collection: str):
+        self.store = store
+        self.collection = collection
+        self.name = _segment_name()
+        self.tmp_dir = os.path.join(store.segments_dir, f".tmp-{self.name}")
+        os.makedirs(self.tmp_dir)
+        self.count = 0
+        self._end = 0
+        self._docs = open(os.path.join(self.tmp_dir, DOCS_FILE), "wb")
+        self._offsets = open(os.path.join(self.tmp_dir, "offsets.raw"), "wb")
+        self._hashes = open(os.path.join(self.tmp_dir, "hashes.raw"), "wb")
+        self._vectors = open(os.path.join(self.tmp_dir, "vectors.raw"), "wb")
+        self._offsets.write(np.int64(0).tobytes())
+        self._dim = None
+        self._vector_count = 0
+
+    def add(self, doc: Document, content_hash: str):
+        data = _encode_document(doc)
+        self._docs.write(data)
+        self._end += len(data)
+        self._offsets.write(np.int64(self._end).tobytes())
+        self._hashes.write(np.asarray([content_hash], dtype="S64").tobytes())
+        self.count += 1
+
+    def add_vectors(self, vectors: np.ndarray):
+        """The exact vectors of the documents added so far, in the same order as `index.add`."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._dim = vectors.shape[1]
+        self._vectors.write(vectors.tobytes())
+        self._vector_count += len(vectors)
+
+    def finish(self, index: faiss.Index) -> SegmentInfo:
+        if index.ntotal != self.count:
+            raise ValueError(f"Index has {index.ntotal} vectors for {self.count} documents")
+        for f in (self._docs, self._offsets, self._hashes, self._vectors):
+            f.close()
+        self._copy_raw("offsets.raw", DOC_OFFSETS_FILE, np.int64, self.count + 1)
+        self._copy_raw("hashes.raw", HASHES_FILE, "S64", self.count)
+        if index_type(index) == "ivfpq" and self.count and self._vector_count == self.count:
+            self._copy_raw("vectors.raw", VECTORS_FILE, np.float32, (self.count, self._dim))
+        else:
+            os.unlink(os.path.join(self.tmp_dir, "vectors.raw"))
+        if self.count:
+            hashes = np.load(os.path.join(self.tmp_dir, HASHES_FILE), mmap_mode="r+")
+            hashes.sort()  # In place, on the mapped file
+            hashes.flush()
+            del hashes
+
+        docstore = MappedDocstore(self.tmp_dir)
+        texts = (docstore.search(str(i)).page_content for i in range(len(docstore)))
+        LexicalIndex.from_texts(texts).save(self.tmp_dir)
+        del docstore
+        faiss.write_index(index, os.path.join(self.tmp_dir, FAISS_FILE))
+
+        os.rename(self.tmp_dir, self.store.segment_path(self.name))
+        return SegmentInfo(name=self.name, count=self.count, type=index_type(index), collection=self.collection)
+
+    def abort(self):
+        for f in (self._docs, self._offsets, self._hashes, self._vectors):
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _copy_raw(self, raw_name: str, npy_name: str, dtype, length: int | tuple[int, int]):
+        """Turns a raw side file into a .npy without reading it into memory."""
+        raw_path, npy_path = os.path.join(self.tmp_dir, raw_name), os.path.join(self.tmp_dir, npy_name)
+        shape = length if isinstance(length, tuple) else (length,)
+        if shape[0]:
+            target = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=shape)
+            target[:] = np.memmap(raw_path, dtype=dtype, mode="r", shape=shape)
+            target.flush()
+            del target
+        else:
+            np.save(npy_path, np.zeros(0, dtype=dtype))
+        os.unlink(raw_path)
+
+
+class MappedDocstore(Docstore):
+    """Read-only docstore over a segment's docs.bin; documents are decoded on demand."""
+
+    def __init__(self, directory: str, use_mmap: bool = True):
+        self.offsets = load_array(os.path.join(directory, DOC_OFFSETS_FILE), use_mmap)
+        with open(os.path.join(directory, DOCS_FILE), "rb") as f:
+            # mmap can't map an empty file
+            if use_mmap and os.fstat(f.fileno()).st_size:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = f.read()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def search(self, search: str) -> Document | str:
+        position = int(search)
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        data = json.loads(self._data[self.offsets[position]:self.offsets[position + 1]])
+        return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+    def add(self, texts: dict[str, Document]) -> None:
+        raise NotImplementedError("Segments are immutable")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("Segments are immutable")
+
+
+class PositionIds(Mapping):
+    """`index_to_docstore_id` for a MappedDocstore: FAISS position i -> "i", without a dict per worker."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return str(position)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ChunkHashes:
+    """Sorted, memory-mapped chunk fingerprints; supports `hash in hashes`."""
+
+    def __init__(self, hashes: np.ndarray):
+        self.hashes = hashes
+
+    @classmethod
+    def load(cls, directory: str, use_mmap: bool = True) -> "ChunkHashes":
+        return cls(load_array(os.path.join(directory, HASHES_FILE), use_mmap))
+
+    def __contains__(self, content_hash: str) -> bool:
+        key = content_hash.encode()
+        i = int(np.searchsorted(self.hashes, key))
+        return i < len(self.hashes) and self.hashes[i] == key
+
+    def __len__(self) -> int:
+        return len(self.hashes)
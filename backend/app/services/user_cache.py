@@ -0,0 +1,28 @@
+from typing import Optional
+
+from app.core.config import settings
+from app.models.user import User
+from app.services.cache import TTLCache
+
+# Token -> user lookups happen on every request and websocket connect.
+# Only active users are cached; saves/updates/deletes of a User evict it
+# (see the event hook on the model), and the TTL bounds how long another
+# worker can keep serving a stale copy.
+user_cache = TTLCache(max_size=settings.USER_CACHE_SIZE, ttl_seconds=settings.USER_CACHE_TTL_SECONDS)
+
+
+async def get_active_user(user_id: str) -> Optional[User]:
+    """Returns the user if they exist and are active, else None. Treat the result as read-only."""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = await User.get(user_id)
+    if user is None or not user.is_active:
+        return None
+    user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id) -> None:
+    user_cache.pop(str(user_id))
@@ -1,51 +1,206 @@
-import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import bisect
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.core.config import settings
+from app.services.index_manager import IndexManager, IndexVersion, SegmentedRetriever, chunk_hash
+from app.services.segment_store import DEFAULT_COLLECTION
+from app.services.ann_index import IndexSpec
+from app.services.embedding_service import EmbeddingBatcher, CachedQueryEmbedder, LazyEmbeddings
+from app.services.embedding_backends import load_embedding_backend
+from app.services.cache import TTLCache, SharedVectorCache
 
 # 1. Setup Embeddings (The "Translator" that turns text to numbers)
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+#    Backend picked by settings.EMBEDDING_BACKEND (torch | onnx). Loaded lazily:
+#    importing this module must not pull in torch or onnxruntime.
+embeddings = LazyEmbeddings(lambda: load_embedding_backend(settings.EMBEDDING_BACKEND, settings))
 
-# 2. Define Index Path (Where we save the "Brain" on disk)
-INDEX_PATH = "faiss_index"
+# 2. Concurrent embed requests (chat queries + ingestion chunks) share micro-batches
+embedding_batcher = EmbeddingBatcher(
+    embeddings,
+    max_batch_size=settings.EMBED_MAX_BATCH_SIZE,
+    max_wait_ms=settings.EMBED_MAX_WAIT_MS,
+    max_queue=settings.EMBED_MAX_QUEUE,
+)
 
-def get_vector_store():
+# 3. Users keep asking the same questions: cache query embeddings by normalized text
+query_embedder = CachedQueryEmbedder(
+    embedding_batcher,
+    cache=TTLCache(max_size=settings.QUERY_CACHE_SIZE, ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS),
+    shared=SharedVectorCache(
+        settings.QUERY_CACHE_SHARED_PATH,
+        ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+        max_rows=settings.QUERY_CACHE_SHARED_MAX_ROWS,
+    ) if settings.QUERY_CACHE_SHARED_PATH else None,
+)
+
+# 4. One index per process, stored on disk as append-only segments
+#    (settings.INDEX_PATH/manifest.json + one directory per upload) and
+#    memory-mapped, so the workers on a host share it through the page cache.
+#    Built on first use, like the embeddings: constructing it creates the
+#    index directory and may migrate a legacy index, which importing must not do.
+_index_manager: Optional[IndexManager] = None
+_index_manager_lock = threading.Lock()
+
+def get_index_manager() -> IndexManager:
+    global _index_manager
+    if _index_manager is None:
+        with _index_manager_lock:
+            if _index_manager is None:
+                _index_manager = IndexManager(
+                    settings.INDEX_PATH,
+                    embeddings,
+                    spec=IndexSpec.from_settings(settings),
+                    compaction_max_segments=settings.INDEX_COMPACTION_MAX_SEGMENTS,
+                    compaction_max_segment_size=settings.INDEX_COMPACTION_MAX_SEGMENT_SIZE,
+                    retire_grace_seconds=settings.INDEX_RETIRED_SEGMENT_GRACE_SECONDS,
+                    use_mmap=settings.INDEX_MMAP,
+                    watch_interval=settings.INDEX_WATCH_INTERVAL_SECONDS,
+                )
+    return _index_manager
+
+# Chunks are embedded in batches of this size so ingestion can report progress
+EMBED_BATCH_SIZE = 64
+
+# Intelligent Splitting (Respects sentences/paragraphs)
+splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+
+# How much page text the streaming splitter buffers before cutting chunks
+SPLIT_WINDOW_CHARS = 20_000
+
+def get_index() -> IndexVersion:
+    """
+    Returns the current index version (mapped from disk once per process, then
+    refreshed when another worker publishes a new version).
+    """
+    return get_index_manager().current()
+
+def split_pages(pages: Iterable[tuple[int, str]]) -> Iterator[tuple[str, int]]:
     """
-    Loads the Vector DB from disk if it exists, otherwise creates a new one.
+    Streaming version of `splitter.split_text` over a sequence of
+    (page number, text) pages, yielding (chunk, number of the page the chunk
+    starts on). Numbers come from the caller, so pages it skipped don't shift them.
+    Only a window of ~SPLIT_WINDOW_CHARS is held at a time; the last chunk of
+    each window is carried over so chunks can still span page boundaries.
     """
-    if os.path.exists(INDEX_PATH):
-        # Allow dangerous deserialization because we created the file ourselves
-        return FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    else:
-        # Create an empty index to start
-        return FAISS.from_texts(["Start of index"], embeddings)
+    buffer = ""
+    starts, numbers = [], []  # Offset in `buffer` where each page begins, and its number
+    for number, page in pages:
+        if buffer:
+            buffer += "\n"
+        starts.append(len(buffer))
+        numbers.append(number)
+        buffer += page
+        if len(buffer) < SPLIT_WINDOW_CHARS:
+            continue
+        located = _locate_chunks(buffer, splitter.split_text(buffer), starts, numbers)
+        yield from ((chunk, page_no) for chunk, _, page_no in located[:-1])
+        if not located:
+            buffer, starts, numbers = "", [], []
+            continue
+        # Carry the last chunk, keeping the page boundaries that fall inside it
+        chunk, offset, page_no = located[-1]
+        inside = [(o - offset, n) for o, n in zip(starts, numbers) if offset < o < offset + len(chunk)]
+        buffer = chunk
+        starts = [0] + [o for o, _ in inside]
+        numbers = [page_no] + [n for _, n in inside]
 
-def add_document_to_knowledge_base(text: str):
+    if buffer.strip():
+        located = _locate_chunks(buffer, splitter.split_text(buffer), starts, numbers)
+        yield from ((chunk, page_no) for chunk, _, page_no in located)
+
+def _locate_chunks(buffer: str, chunks: list[str], starts: list[int], numbers: list[int]) -> list[tuple[str, int, int]]:
+    """(chunk, offset in `buffer`, page number) for chunks cut from `buffer` in order."""
+    located, cursor = [], 0
+    for chunk in chunks:
+        offset = buffer.find(chunk, cursor)
+        if offset == -1:  # The splitter normalised something; keep the previous position
+            offset = cursor
+        located.append((chunk, offset, numbers[max(0, bisect.bisect_right(starts, offset) - 1)]))
+        cursor = offset + 1  # Chunks overlap, so the next one may start before this one ends
+    return located
+
+@dataclass
+class IngestStats:
+    chunks_added: int = 0
+    chunks_skipped: int = 0  # Already indexed (or repeated within this document)
+
+# on_batch(texts, content_hashes, pages, vectors, first_chunk_index): called after each embedded batch
+BatchCallback = Callable[[list[str], list[str], list[int], list[list[float]], int], None]
+
+def add_document_to_knowledge_base(pages: Iterable[tuple[int, str]], document_id: Optional[str] = None,
+                                   collection: str = DEFAULT_COLLECTION,
+                                   on_progress: Optional[Callable[[IngestStats], None]] = None,
+                                   on_batch: Optional[BatchCallback] = None) -> IngestStats:
     """
-    1. Splits text intelligently.
-    2. Embeds it.
-    3. Adds to FAISS index.
-    4. Saves to disk.faiss_index
+    1. Splits the pages intelligently, as they arrive.
+    2. Skips chunks whose content hash is already in `collection`, so a
+       revised edition of an act only pays for the sections that changed.
+    3. Embeds the remaining chunks batch by batch, reporting progress and
+       handing each batch to `on_batch` (used to persist vectors in Mongo).
+    4. Writes them (tagged with document, collection and page) as a new delta
+       segment of `collection` and publishes a new index version (background
+       compaction merges segments later).
+
+    Blocking: call it from a worker thread, not the event loop.
     """
-    # Intelligent Splitting (Respects sentences/paragraphs)
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = splitter.split_text(text)
-    
-    # Load current index
-    vector_store = get_vector_store()
-    
-    # Add new chunks
-    vector_store.add_texts(chunks)
-    
-    # Save to disk immediately
-    vector_store.save_local(INDEX_PATH)
-    print(f"✅ Added {len(chunks)} chunks to knowledge base.")
+    snapshot = get_index()
+    stats = IngestStats()
+    seen = set()
+    chunks, hashes, page_numbers, vectors, batch = [], [], [], [], []
+
+    def flush():
+        texts = [text for text, _, _ in batch]
+        batch_hashes = [h for _, h, _ in batch]
+        batch_pages = [p for _, _, p in batch]
+        batch_vectors = embedding_batcher.embed_documents(texts)
+        if on_batch:
+            on_batch(texts, batch_hashes, batch_pages, batch_vectors, len(vectors))
+        vectors.extend(batch_vectors)
+        chunks.extend(texts)
+        hashes.extend(batch_hashes)
+        page_numbers.extend(batch_pages)
+        batch.clear()
+        stats.chunks_added = len(vectors)
+        if on_progress:
+            on_progress(stats)
+
+    for chunk, page in split_pages(pages):
+        fingerprint = chunk_hash(chunk)
+        if fingerprint in seen or snapshot.has_chunk(fingerprint, collection):
+            stats.chunks_skipped += 1
+            continue
+        seen.add(fingerprint)
+        batch.append((chunk, fingerprint, page))
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    # Copy-on-write: in-flight queries keep the version they started with
+    metadatas = [
+        chunk_metadata(h, document_id, collection, page)
+        for h, page in zip(hashes, page_numbers)
+    ]
+    version = get_index_manager().add_embeddings(chunks, vectors, metadatas, collection=collection)
+    print(f"✅ Added {stats.chunks_added} chunks to '{collection}', skipped {stats.chunks_skipped} known (index v{version.version}).")
+    return stats
+
+def chunk_metadata(content_hash: str, document_id: Optional[str], collection: str, page: Optional[int]) -> dict:
+    """What every indexed chunk carries (and retrieved documents expose)."""
+    return {"chunk_hash": content_hash, "document_id": document_id, "collection": collection, "page": page}
 
-def get_retriever():
+def get_retriever(collections: Optional[Iterable[str]] = None):
     """
     Returns a 'Retriever' object that LangChain can use directly in chains.
+    With `collections`, only the segments of those collections are searched.
     """
-    vector_store = get_vector_store()
-    # Search top 4 most relevant chunks
-    return vector_store.as_retriever(search_kwargs={"k": 4})
\ No newline at end of file
+    # Search top 4 most relevant chunks across the scoped segments (citation fast path, else dense + BM25)
+    return SegmentedRetriever(
+        snapshot=get_index().scoped(collections),
+        embedder=query_embedder,
+        k=4,
+        candidates=settings.HYBRID_CANDIDATES,
+        rrf_k=settings.HYBRID_RRF_K,
+    )
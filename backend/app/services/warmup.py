@@ -0,0 +1,93 @@
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Optional
+
+from app.core.config import settings
+from app.services.vector_service import embeddings, get_index_manager, get_retriever, query_embedder
+
+
+@dataclass
+class ComponentState:
+    status: str = "pending"  # pending -> loading -> ready / failed (or skipped)
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Warmup:
+    """
+    Loads the embedding model and the FAISS index in the background after
+    startup, then runs an optional warm-up query. Requests don't wait for it:
+    anything that needs the model before it's ready just loads it on demand.
+    `/ready` reports the state so load balancers can hold traffic until then.
+    """
+
+    def __init__(self):
+        self.model = ComponentState()
+        self.index = ComponentState()
+        self.query = ComponentState()
+        self.started_at: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.model.status == "ready" and self.index.status == "ready"
+
+    @property
+    def ready(self) -> bool:
+        # The warm-up query is what pays for the model's first (slow) inference
+        return self.loaded and self.query.status not in ("pending", "loading")
+
+    def report(self) -> dict:
+        return {
+            "model": asdict(self.model),
+            "index": asdict(self.index),
+            "warmup_query": asdict(self.query),
+            "startup_seconds": self.total_seconds,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Independent: loading segments only stores a reference to the embeddings
+        await asyncio.gather(
+            self._step(self.model, loop.run_in_executor(None, embeddings.load)),
+            self._step(self.index, loop.run_in_executor(None, lambda: get_index_manager().current())),
+        )
+        if settings.WARMUP_QUERY and self.loaded:
+            await self._step(self.query, self._warm_query(settings.WARMUP_QUERY))
+        else:
+            self.query.status = "skipped"
+        self.total_seconds = time.perf_counter() - self.started_at
+        print(f"🔥 Warm-up finished in {self.total_seconds:.1f}s (ready={self.ready})")
+
+    async def _warm_query(self, query: str):
+        # Embed directly: a query that cites a section would take the citation
+        # fast path (and an empty index returns early) without touching the model
+        vector = await query_embedder.aembed_query(query)
+        await get_retriever().asearch(query, vector)
+
+    async def _step(self, state: ComponentState, work: Awaitable):
+        state.status = "loading"
+        started = time.perf_counter()
+        try:
+            await work
+            state.status = "ready"
+        except Exception as e:
+            state.status, state.error = "failed", str(e)
+            print(f"❌ Warm-up step failed: {e}")
+        finally:
+            state.seconds = time.perf_counter() - started
+
+
+warmup = Warmup()
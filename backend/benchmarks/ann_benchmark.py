@@ -0,0 +1,109 @@
+"""
+Recall vs. latency vs. memory for the index types in `app.services.ann_index`.
+
+    python -m benchmarks.ann_benchmark --sizes 10000 100000 --queries 500
+    python -m benchmarks.ann_benchmark --sizes 1000000 --types hnsw ivfpq --json out.json
+
+The corpus is synthetic: clustered, L2-normalised float32 vectors with the
+same dimension as all-MiniLM-L6-v2 (384), so no model or PDFs are needed.
+Recall@k is measured against exact (flat) search on the same corpus.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app.services.ann_index import INDEX_TYPES, IndexSpec, build_index, estimate_nlist
+
+
+def synthetic_corpus(n: int, centers: np.ndarray, projection: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Sentence embeddings live near a low-dimensional manifold, not uniformly in
+    384-d space. Mimic that: clustered points in a small latent space, projected
+    up to `dim` with a little isotropic noise.
+    """
+    latent_dim, dim = projection.shape
+    labels = rng.integers(0, len(centers), size=n)
+    latent = centers[labels] + 0.5 * rng.standard_normal((n, latent_dim)).astype(np.float32)
+    vectors = latent @ projection + 0.05 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def bench(index: faiss.Index, queries: np.ndarray, k: int) -> tuple[np.ndarray, list[float]]:
+    """One query at a time, like the chat path, so the latencies are per-request."""
+    results, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(ids[0])
+    return np.array(results), latencies
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--types", choices=INDEX_TYPES, nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 = per-request latency)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    rng = np.random.default_rng(args.seed)
+    rows = []
+
+    projection = rng.standard_normal((32, args.dim)).astype(np.float32) / np.sqrt(32)
+
+    for n in args.sizes:
+        # Queries come from the same topics as the corpus, like real questions do
+        centers = rng.standard_normal((max(16, n // 1000), projection.shape[0])).astype(np.float32)
+        corpus = synthetic_corpus(n, centers, projection, rng)
+        queries = synthetic_corpus(args.queries, centers, projection, rng)
+
+        truth_index = build_index(corpus, IndexSpec(type="flat"))
+        truth, _ = bench(truth_index, queries, args.k)
+
+        for kind in args.types:
+            spec = IndexSpec(type=kind, hnsw_ef_search=args.ef_search, ivf_nlist=estimate_nlist(n), ivf_nprobe=args.nprobe)
+            started = time.perf_counter()
+            index = build_index(corpus, spec)
+            build_s = time.perf_counter() - started
+
+            found, latencies = bench(index, queries, args.k)
+            row = {
+                "n": n,
+                "type": kind,
+                f"recall@{args.k}": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                "build_s": round(build_s, 2),
+                "index_mb": round(index_bytes(index) / 2 ** 20, 1),
+            }
+            rows.append(row)
+            print("  ".join(f"{key}={value}" for key, value in row.items()), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
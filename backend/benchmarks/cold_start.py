@@ -0,0 +1,90 @@
+"""
+Cold-start cost of a worker, measured in fresh interpreters.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --runs 5 --json cold_start.json
+
+Each run spawns a new Python process (so nothing is cached in-process, but
+the OS page cache is warm, as it is for a restarted uvicorn worker) that times:
+
+- import_app:   `import app.main` -- what a worker pays before it can serve /auth/login
+- model_load:   building the embedding model (LazyEmbeddings.load)
+- index_load:   reading the FAISS segments from INDEX_PATH
+- first_query:  first query embedding after the model is loaded
+- warm_query:   a second, different query
+
+Run it from the `backend/` directory with the usual .env (MONGO_URI and
+GROQ_API_KEY must be set but no database or Groq call is made).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+STEPS = ("import_app", "model_load", "index_load", "first_query", "warm_query")
+
+
+def probe():
+    """Runs inside the child process; prints one JSON line of timings (seconds)."""
+    timings = {}
+
+    started = time.perf_counter()
+    import app.main  # noqa: F401  (the import is what we're timing)
+    from app.services.vector_service import embeddings, get_index_manager
+    timings["import_app"] = time.perf_counter() - started
+
+    for step, work in (
+        ("model_load", embeddings.load),
+        ("index_load", lambda: get_index_manager().current()),
+        ("first_query", lambda: embeddings.embed_query("What does Section 22 cover?")),
+        ("warm_query", lambda: embeddings.embed_query("Who can be removed from the register of members?")),
+    ):
+        started = time.perf_counter()
+        work()
+        timings[step] = time.perf_counter() - started
+
+    print(json.dumps(timings))
+
+
+def run_once() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--probe"],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    # The app prints its own log lines; the timings are the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write raw results to this file")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe()
+        return
+
+    runs = []
+    for i in range(args.runs):
+        runs.append(run_once())
+        print(f"run {i + 1}/{args.runs}: " + ", ".join(f"{s} {runs[-1][s] * 1000:.0f} ms" for s in STEPS))
+
+    print(f"\n{'step':<12} {'median ms':>10} {'max ms':>10}")
+    summary = {}
+    for step in STEPS:
+        values = [r[step] * 1000 for r in runs]
+        summary[step] = {"median_ms": statistics.median(values), "max_ms": max(values)}
+        print(f"{step:<12} {summary[step]['median_ms']:>10.0f} {summary[step]['max_ms']:>10.0f}")
+    print("\nTime to serve non-RAG routes ≈ import_app; to answer questions ≈ sum of the first four steps.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": runs, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Parity and throughput of the embedding backends in `app.services.embedding_backends`.
+
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --corpus sample.txt --min-cosine 0.99 --json out.json
+
+Parity: embeds the same sentences with the torch (reference) and onnx backends
+and reports the cosine similarity between the two vectors of each sentence,
+plus how often the top-k neighbours of each sentence agree. Exits non-zero
+if the worst cosine is below --min-cosine, so it can gate a deploy.
+
+Throughput: sentences/sec for each backend, one text at a time (chat queries)
+and in batches (ingestion).
+
+--corpus takes a text file with one sentence per line; the default is a small
+built-in set of CA-law style sentences.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_backends import load_embedding_backend
+
+SAMPLE_CORPUS = [
+    "Section 22 of the Chartered Accountants Act defines professional misconduct.",
+    "A member shall be deemed to be in practice when he engages in the practice of accountancy.",
+    "The Council may remove the name of a member from the Register of Members.",
+    "What is the penalty for falsely claiming to be a member of the Institute?",
+    "Rule 7 deals with the qualifications required for registration of a firm.",
+    "The First Schedule lists acts of professional misconduct in relation to members in practice.",
+    "Every member shall pay the annual membership fee as prescribed by the Council.",
+    "Regulation 190A restricts the number of tax audit assignments a member may accept.",
+    "The Disciplinary Committee shall consist of the Presiding Officer and two other members.",
+    "A chartered accountant must not disclose information acquired in the course of professional engagement.",
+    "Can a CA advertise his professional services on social media?",
+    "Explain the procedure for filing a complaint against a member.",
+    "The Quality Review Board reviews the quality of services provided by members.",
+    "Part II of the Second Schedule covers misconduct by members generally.",
+    "How many years of practical training are required before enrolment?",
+    "The Institute may conduct examinations and grant certificates of practice.",
+]
+
+
+def load_corpus(path: str | None) -> list[str]:
+    if not path:
+        return SAMPLE_CORPUS
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray, k: int) -> dict:
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = (ref * cand).sum(axis=1)
+
+    # Neighbour agreement: overlap of each sentence's top-k (excluding itself) under both backends
+    k = min(k, len(ref) - 1)
+    overlap = []
+    if k > 0:
+        ref_sim, cand_sim = ref @ ref.T, cand @ cand.T
+        np.fill_diagonal(ref_sim, -np.inf)
+        np.fill_diagonal(cand_sim, -np.inf)
+        for row_ref, row_cand in zip(ref_sim, cand_sim):
+            top_ref = set(np.argsort(-row_ref)[:k])
+            top_cand = set(np.argsort(-row_cand)[:k])
+            overlap.append(len(top_ref & top_cand) / k)
+
+    return {
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+        f"top{k}_overlap": float(np.mean(overlap)) if overlap else None,
+    }
+
+
+def throughput(backend, corpus: list[str], total: int, batch_size: int) -> float:
+    texts = (corpus * (total // len(corpus) + 1))[:total]
+    backend.embed_documents(texts[:batch_size])  # Warm-up
+    started = time.perf_counter()
+    if batch_size == 1:
+        for text in texts:
+            backend.embed_query(text)
+    else:
+        for start in range(0, total, batch_size):
+            backend.embed_documents(texts[start:start + batch_size])
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], help="first one is the reference")
+    parser.add_argument("--corpus")
+    parser.add_argument("--sentences", type=int, default=512, help="texts embedded per throughput run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    results = {"backends": {}, "parity": {}}
+    vectors = {}
+
+    for name in args.backends:
+        started = time.perf_counter()
+        backend = load_embedding_backend(name, settings)
+        load_s = time.perf_counter() - started
+        vectors[name] = np.asarray(backend.embed_documents(corpus), dtype=np.float32)
+        rates = {f"batch_{b}": throughput(backend, corpus, args.sentences, b) for b in args.batch_sizes}
+        results["backends"][name] = {"load_s": load_s, "sentences_per_s": rates}
+        print(f"{name:<6} load {load_s:5.1f}s  " + "  ".join(f"{k}: {v:8.1f}/s" for k, v in rates.items()))
+
+    reference = args.backends[0]
+    failed = False
+    for name in args.backends[1:]:
+        report = parity(vectors[reference], vectors[name], args.k)
+        results["parity"][name] = report
+        print(f"{name} vs {reference}: " + ", ".join(f"{k} {v:.4f}" for k, v in report.items() if v is not None))
+        if report["min_cosine"] < args.min_cosine:
+            print(f"❌ {name}: worst cosine {report['min_cosine']:.4f} < {args.min_cosine}")
+            failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Local stand-in for Groq's OpenAI-compatible chat API, rate limits included.
+
+    python -m benchmarks.fake_groq --port 9100 --rpm 30 --tpm 6000
+    GROQ_API_BASE=http://127.0.0.1:9100 uvicorn app.main:app
+
+Serves POST /openai/v1/chat/completions (plain and streamed) with the same
+replies as benchmarks.offline.FakeChatModel, and answers 429 with a
+Retry-After header once more than --rpm requests (or --tpm tokens) arrive
+within a minute, like Groq does. --error-rate adds random 503s. The real
+ChatGroq client and the LLM scheduler's limits, backoff and websocket error
+frames can be exercised end to end without a Groq account; the load test
+runs it in-process with --fake-groq. GET /stats returns what it served.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.offline import fake_reply
+
+
+def create_app(latency_ms: float = 300, tokens_per_second: float = 250, answer_tokens: int = 120,
+               rpm: int = 0, tpm: int = 0, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    window: deque = deque()  # (timestamp, tokens) of accepted requests in the last minute
+    stats = {"requests": 0, "rate_limited": 0, "errors": 0, "streamed": 0}
+
+    def rate_limited(tokens: int) -> float | None:
+        """Seconds until the request would fit, or None if it fits now."""
+        now = time.monotonic()
+        while window and now - window[0][0] >= 60:
+            window.popleft()
+        over_rpm = rpm and len(window) >= rpm
+        over_tpm = tpm and sum(t for _, t in window) + tokens > tpm
+        if not (over_rpm or over_tpm):
+            window.append((now, tokens))
+            return None
+        return round(60 - (now - window[0][0]), 2) if window else 1.0
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        tokens = fake_reply(system, question, answer_tokens)
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 1 for m in messages)
+
+        wait = rate_limited(prompt_tokens + len(tokens))
+        if wait is not None:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": f"Rate limit reached for model `{body.get('model')}`. "
+                                      f"Please try again in {wait}s.",
+                           "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after": str(wait)},
+            )
+        if error_rate and random.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "Service unavailable", "type": "internal_server_error"}},
+                                status_code=503)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        base = {"id": completion_id, "created": int(time.time()), "model": body.get("model")}
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + len(tokens) / tokens_per_second)
+            return {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+            }
+
+        stats["streamed"] += 1
+
+        async def events():
+            await asyncio.sleep(latency_ms / 1000)
+            for i, token in enumerate(tokens):
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / tokens_per_second)
+            last = {**base, "object": "chat.completion.chunk", "x_groq": {"usage": usage},
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(last)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=250)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--rpm", type=int, default=30, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=6000, help="tokens per minute before 429s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.latency_ms, args.tokens_per_sec, args.answer_tokens,
+                           args.rpm, args.tpm, args.error_rate), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Offline load test: concurrent chat websockets plus bulk PDF uploads against
+the real app, with Groq and MongoDB replaced by local stand-ins.
+
+    python -m benchmarks.load_test --sessions 50 --turns 5
+    python -m benchmarks.load_test --sessions 20 --uploads 10 --json run.json
+    python -m benchmarks.load_test --json new.json --baseline run.json --max-regression 0.15
+
+What runs for real: uvicorn (in-process, on its own thread and event loop),
+the FastAPI routes, auth, the ingestion queue, PDF parsing, FAISS, BM25 and
+the whole retrieval pipeline. What is faked (see benchmarks.offline):
+
+- LLM:        FakeChatModel, --llm-latency-ms to first token, then --llm-tokens-per-sec;
+              or --fake-groq: the real ChatGroq client against benchmarks.fake_groq over
+              HTTP, with Groq-style 429s past --groq-rpm / --groq-tpm
+- MongoDB:    mongomock-motor in memory, or --mongo-uri to a throwaway local mongod
+- Embeddings: hash-based by default; --real-embeddings uses EMBEDDING_BACKEND (needs the model locally)
+
+The index lives in a temporary directory unless --index-path is given, so the
+real one is never touched.
+
+Reported: turns/sec; per-turn latency and time-to-first-byte (first delta
+frame) p50/p95/p99; upload accept latency and time until the job finished;
+and the server event loop's lag (how late a 10 ms timer fires), which is what
+every other request on the worker would feel. --json writes everything for
+later comparison; --baseline compares against such a file and exits non-zero
+if p95 latency, p95 TTFB or turns/sec regressed by more than --max-regression.
+
+Run it from the `backend/` directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks import offline
+
+QUESTIONS = [
+    "What does Section 22 of the Chartered Accountants Act cover?",
+    "Who can be removed from the register of members?",
+    "What is the penalty for falsely claiming to be a member of the Institute?",
+    "How many tax audit assignments may a member accept?",
+    "Explain the procedure for filing a complaint against a member.",
+    "Can a CA advertise professional services on social media?",
+    "What are the qualifications for registering a firm?",
+    "What does the Disciplinary Committee consist of?",
+]
+
+# Event-loop lag probe interval
+LAG_INTERVAL = 0.01
+
+
+def summarize(values: list[float]) -> dict:
+    """p50/p95/p99/max in milliseconds (values are seconds)."""
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread(threading.Thread):
+    """uvicorn on its own thread and loop, so client work doesn't show up as server loop lag."""
+
+    def __init__(self, app, port: int):
+        super().__init__(daemon=True)
+        import uvicorn
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.lag: list[float] = []
+        self.measure_lag = False
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        probe = asyncio.create_task(self._probe_lag())
+        try:
+            await self.server.serve()
+        finally:
+            probe.cancel()
+
+    async def _probe_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            if self.measure_lag:
+                self.lag.append(max(0.0, time.perf_counter() - started - LAG_INTERVAL))
+
+    async def call(self, coro):
+        """Runs `coro` on the server loop (Beanie/motor are bound to it)."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def stop(self):
+        self.server.should_exit = True
+        self.join(timeout=30)
+
+
+async def create_users(count: int) -> list[tuple[str, str]]:
+    """(token, chat_id) per session. Inserted directly: bcrypt-ing N registrations isn't what we measure."""
+    from app.core.security import create_access_token
+    from app.models.chat import Chat
+    from app.models.user import User
+
+    sessions = []
+    for i in range(count):
+        user = User(email=f"load{i}@example.com", hashed_password="!")
+        await user.insert()
+        chat = Chat(user_id=user.id, title=f"Load test {i}")
+        await chat.insert()
+        sessions.append((create_access_token(user.id), str(chat.id)))
+    return sessions
+
+
+async def wait_ready(client, timeout: float = 120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get("/ready")
+        if response.status_code == 200:
+            return
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Server not ready after {timeout:.0f}s: {response.text}")
+
+
+async def chat_session(base_ws: str, token: str, chat_id: str, index: int, turns: int,
+                       think_seconds: float, results: dict):
+    import websockets
+
+    async with websockets.connect(f"{base_ws}/api/v1/ws/{chat_id}?token={token}", max_size=None) as ws:
+        for turn in range(turns):
+            question = QUESTIONS[(index + turn) % len(QUESTIONS)]
+            started = time.perf_counter()
+            first_byte = None
+            try:
+                await ws.send(question)
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    if frame["type"] in ("final", "error"):
+                        break
+            except Exception as e:
+                results["errors"].append(f"session {index} turn {turn}: {type(e).__name__}: {e}")
+                return
+            if frame["type"] == "error":  # Connection stays open; on to the next question
+                results["errors"].append(f"session {index} turn {turn}: {frame['code']}: {frame['message']}")
+                continue
+            results["latency"].append(time.perf_counter() - started)
+            results["ttfb"].append(first_byte)
+            if think_seconds:
+                await asyncio.sleep(think_seconds)
+
+
+async def upload(client, token: str, doc_no: int, pages: int, results: dict, poll: float = 0.2):
+    body = offline.make_pdf(offline.document_pages(doc_no, pages))
+    headers = {"Authorization": f"Bearer {token}"}
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/v1/knowledge/upload", headers=headers,
+        files={"file": (f"load-{doc_no}.pdf", body, "application/pdf")},
+    )
+    results["accept"].append(time.perf_counter() - started)
+    if response.status_code != 202 or "job_id" not in response.json():
+        results["errors"].append(f"upload {doc_no}: HTTP {response.status_code} {response.text[:200]}")
+        return
+
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/v1/knowledge/jobs/{job_id}", headers=headers)).json()
+        if job["status"] in ("indexed", "failed"):
+            break
+        await asyncio.sleep(poll)
+    if job["status"] == "failed":
+        results["errors"].append(f"upload {doc_no}: {job.get('error')}")
+        return
+    results["done"].append(time.perf_counter() - started)
+    results["pages"] += pages
+
+
+async def bounded(limit: int, coros):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            await coro
+
+    await asyncio.gather(*(run(c) for c in coros))
+
+
+async def run_load(args, server: ServerThread, port: int) -> dict:
+    import httpx
+
+    base = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+        await wait_ready(client)
+        tokens = await server.call(create_users(max(args.sessions, 1)))
+
+        # Seed corpus (not measured), so retrieval has something to search
+        seed = {"accept": [], "done": [], "pages": 0, "errors": []}
+        await upload(client, tokens[0][0], 0, args.seed_pages, seed)
+        if seed["errors"]:
+            raise SystemExit(f"Seeding failed: {seed['errors'][0]}")
+        print(f"🌱 Seeded {args.seed_pages} pages in {seed['done'][0]:.1f}s")
+
+        chat = {"latency": [], "ttfb": [], "errors": []}
+        uploads = {"accept": [], "done": [], "pages": 0, "errors": []}
+        server.measure_lag = True
+        started = time.perf_counter()
+        await asyncio.gather(
+            bounded(args.sessions or 1, [
+                chat_session(base.replace("http", "ws", 1), token, chat_id, i, args.turns, args.think_ms / 1000, chat)
+                for i, (token, chat_id) in enumerate(tokens[:args.sessions])
+            ]),
+            bounded(args.upload_concurrency, [
+                upload(client, tokens[0][0], doc_no, args.pages_per_upload, uploads)
+                for doc_no in range(1, args.uploads + 1)
+            ]),
+        )
+        duration = time.perf_counter() - started
+        server.measure_lag = False
+        health = (await client.get("/")).json()
+
+    return {
+        "duration_seconds": round(duration, 3),
+        "chat": {
+            "turns": len(chat["latency"]),
+            "errors": len(chat["errors"]),
+            "turns_per_second": round(len(chat["latency"]) / duration, 2),
+            "latency_ms": summarize(chat["latency"]),
+            "ttfb_ms": summarize(chat["ttfb"]),
+        },
+        "uploads": {
+            "completed": len(uploads["done"]),
+            "errors": len(uploads["errors"]),
+            "pages_per_second": round(uploads["pages"] / duration, 2),
+            "accept_ms": summarize(uploads["accept"]),
+            "ingest_ms": summarize(uploads["done"]),
+        },
+        "event_loop_lag_ms": summarize(server.lag),
+        "llm_scheduler": health["llm"],
+        "answer_cache": health["answer_cache"],
+        "error_samples": (chat["errors"] + uploads["errors"])[:10],
+    }
+
+
+# (path into the results, True if bigger is better)
+REGRESSION_CHECKS = [
+    (("chat", "turns_per_second"), True),
+    (("chat", "latency_ms", "p95"), False),
+    (("chat", "ttfb_ms", "p95"), False),
+    (("event_loop_lag_ms", "p99"), False),
+]
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    """Prints old -> new for the headline numbers; False if any regressed beyond the threshold."""
+    ok = True
+    print(f"\n{'metric':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for path, higher_is_better in REGRESSION_CHECKS:
+        old, new = baseline, results
+        for key in path:
+            old, new = (old or {}).get(key), (new or {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = (-change if higher_is_better else change) > max_regression
+        ok = ok and not regressed
+        print(f"{'.'.join(path):<28} {old:>10.2f} {new:>10.2f} {change:>+7.0%}{'  ❌' if regressed else ''}")
+    return ok
+
+
+def print_report(results: dict):
+    chat, uploads, lag = results["chat"], results["uploads"], results["event_loop_lag_ms"]
+    print(f"\n⏱️ {results['duration_seconds']:.1f}s measured")
+    print(f"💬 {chat['turns']} turns ({chat['errors']} errors), {chat['turns_per_second']} turns/s")
+    for name in ("latency_ms", "ttfb_ms"):
+        s = chat[name]
+        if s["count"]:
+            print(f"   {name:<11} p50 {s['p50']:>8.0f}  p95 {s['p95']:>8.0f}  p99 {s['p99']:>8.0f}  max {s['max']:>8.0f}")
+    if uploads["completed"] or uploads["errors"]:
+        print(f"📄 {uploads['completed']} uploads ({uploads['errors']} errors), {uploads['pages_per_second']} pages/s")
+        for name in ("accept_ms", "ingest_ms"):
+            s = uploads[name]
+            if s["count"]:
+                print(f"   {name:<11} p50 {s['p50']:>8.0f}  p95 {s['p95']:>8.0f}  max {s['max']:>8.0f}")
+    llm = results["llm_scheduler"]
+    print(f"🤖 LLM calls {llm['calls_total']}, coalesced {llm['coalesced_total']}, "
+          f"retries {llm['retries_total']}, rate limited {llm['rate_limited_total']}, "
+          f"queued {llm['queue_wait_seconds_total']:.1f}s in total")
+    cache = results.get("answer_cache") or {}
+    if cache.get("enabled"):
+        print(f"🗃️ answer cache hits {cache['hits']}, misses {cache['misses']}, "
+              f"invalidations {cache['invalidations']}")
+    if lag["count"]:
+        print(f"🐢 event loop lag   p50 {lag['p50']:.1f}  p99 {lag['p99']:.1f}  max {lag['max']:.1f} ms")
+    for error in results["error_samples"]:
+        print(f"   ⚠️ {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent websocket sessions")
+    parser.add_argument("--turns", type=int, default=5, help="questions per session")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a session's turns")
+    parser.add_argument("--uploads", type=int, default=0, help="PDFs uploaded while the chats run")
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--pages-per-upload", type=int, default=20)
+    parser.add_argument("--seed-pages", type=int, default=40, help="pages indexed before measuring")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=250)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--scheduler-rpm", type=int, default=0,
+                        help="LLM_REQUESTS_PER_MINUTE for the app (default 0: measure the app, not the Groq tier)")
+    parser.add_argument("--scheduler-tpm", type=int, default=0, help="LLM_TOKENS_PER_MINUTE for the app")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="ANSWER_CACHE_ENABLED for the app (hits need history-free turns, e.g. --turns 1)")
+    parser.add_argument("--fake-groq", action="store_true", help="real ChatGroq client against a local fake endpoint")
+    parser.add_argument("--groq-rpm", type=int, default=0, help="with --fake-groq: requests/min before 429s")
+    parser.add_argument("--groq-tpm", type=int, default=0, help="with --fake-groq: tokens/min before 429s")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0, help="with --fake-groq: fraction of 503s")
+    parser.add_argument("--real-embeddings", action="store_true", help="use EMBEDDING_BACKEND instead of fake vectors")
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of mongomock-motor")
+    parser.add_argument("--index-path", help="defaults to a temporary directory")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    args = parser.parse_args()
+
+    fake_groq = None
+    if args.fake_groq:
+        from benchmarks.fake_groq import create_app
+        fake_groq = ServerThread(create_app(
+            args.llm_latency_ms, args.llm_tokens_per_sec, args.answer_tokens,
+            args.groq_rpm, args.groq_tpm, args.groq_error_rate,
+        ), free_port())
+        fake_groq.start()
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as scratch:
+        groq_api_base = f"http://127.0.0.1:{fake_groq.port}" if fake_groq else None
+        offline.configure_environment(args.index_path or scratch, args.mongo_uri, groq_api_base)
+        os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.scheduler_rpm)
+        os.environ["LLM_TOKENS_PER_MINUTE"] = str(args.scheduler_tpm)
+        os.environ["ANSWER_CACHE_ENABLED"] = str(args.answer_cache).lower()
+
+        # Only now may app modules be imported (Settings reads the environment once)
+        import app.main
+        from app.db.client import init_db
+        if not fake_groq:
+            offline.install_fake_llm(offline.FakeChatModel(
+                latency_ms=args.llm_latency_ms,
+                tokens_per_second=args.llm_tokens_per_sec,
+                answer_tokens=args.answer_tokens,
+            ))
+        if not args.real_embeddings:
+            offline.install_fake_embeddings()
+        client = offline.mongo_client(args.mongo_uri)
+        app.main.init_db = lambda: init_db(client)
+
+        port = free_port()
+        server = ServerThread(app.main.app, port)
+        server.start()
+        try:
+            results = asyncio.run(run_load(args, server, port))
+        finally:
+            server.stop()
+            if fake_groq:
+                fake_groq.stop()
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        **results,
+    }
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
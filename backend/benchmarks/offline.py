@@ -0,0 +1,158 @@
+"""
+Offline stand-ins used by the load test: a fake Groq model, an in-memory
+Mongo, deterministic embeddings and a tiny PDF writer (benchmarks.fake_groq
+serves the same fake replies over HTTP).
+
+Nothing here is imported by the app. Call `configure_environment` before
+anything under `app.` is imported, since Settings is read at import time.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Vocabulary for generated answers and documents
+WORDS = (
+    "member council institute register practice misconduct schedule section rule regulation "
+    "committee complaint auditor certificate firm partner disciplinary penalty fee examination "
+    "chartered accountant act clause provision notice inquiry tribunal appeal order board"
+).split()
+
+
+def configure_environment(index_path: str, mongo_uri: Optional[str] = None, groq_api_base: Optional[str] = None):
+    """Points the app at a scratch index and fills in the settings it refuses to start without."""
+    os.environ["INDEX_PATH"] = index_path
+    if groq_api_base:
+        os.environ["GROQ_API_BASE"] = groq_api_base
+    os.environ.setdefault("GROQ_API_KEY", "offline")
+    os.environ["MONGO_URI"] = mongo_uri or os.environ.get("MONGO_URI", "mongodb://offline")
+
+
+def fake_reply(system: str, question: str, answer_tokens: int) -> list[str]:
+    """Reply tokens for a prompt built by app.services.llm_service, picked by its system message."""
+    if system.startswith("Rewrite"):
+        return [question]
+    if system.startswith("You maintain a running summary"):
+        return ["The user asked about CA law provisions."]
+    rng = random.Random(hashlib.sha1(question.encode()).digest())
+    return [f"{rng.choice(WORDS)} " for _ in range(answer_tokens)]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatGroq with Groq-like timing: `latency_ms`
+    before the first token (queueing + prefill), then `tokens_per_second`.
+    Rewrites echo the question, summaries are short, answers are
+    `answer_tokens` words derived from the question.
+    """
+
+    latency_ms: float = 300.0
+    tokens_per_second: float = 250.0
+    answer_tokens: int = 120
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _tokens(self, messages: list[BaseMessage]) -> list[str]:
+        system = str(messages[0].content) if messages else ""
+        question = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        return fake_reply(system, question, self.answer_tokens)
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep((self.latency_ms / 1000) + len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep((self.latency_ms / 1000) + len(tokens) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000)
+        for token in self._tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: list[BaseMessage], stop=None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        for token in self._tokens(messages):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def install_fake_llm(model: BaseChatModel):
+    """Routes the LLM scheduler's calls to `model` instead of ChatGroq."""
+    from app.services.llm_service import llm_scheduler
+
+    llm_scheduler.model = model
+
+
+def install_fake_embeddings(size: int = 384):
+    """Hash-based embeddings (no model download, ~free to compute). Must run before the model loads."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.services.vector_service import embeddings
+
+    embeddings._factory = lambda: DeterministicFakeEmbedding(size=size)
+
+
+def mongo_client(mongo_uri: Optional[str]):
+    """A real client for `mongo_uri` (e.g. a throwaway local mongod), else in-memory mongomock-motor."""
+    if mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(mongo_uri)
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("Install mongomock-motor for in-memory runs, or pass --mongo-uri to a local mongod.")
+    return AsyncMongoMockClient()
+
+
+def document_pages(doc_no: int, pages: int, words_per_page: int = 350) -> list[str]:
+    """Unique text per document and page, so content-hash dedup doesn't skip it."""
+    rng = random.Random(doc_no)
+    return [
+        f"Document {doc_no} page {page}. Section {rng.randint(1, 300)}. "
+        + " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        for page in range(pages)
+    ]
+
+
+def make_pdf(pages: list[str], line_chars: int = 90) -> bytes:
+    """Minimal uncompressed PDF (Helvetica, one text object per page) that pypdf can read."""
+    offsets, out = [], [b"%PDF-1.4\n"]
+
+    def add(obj: bytes):
+        offsets.append(sum(len(part) for part in out))
+        out.append(obj)
+
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    add(b"1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n")
+    add(f"2 0 obj<</Type/Pages/Kids[{kids}]/Count {len(pages)}>>endobj\n".encode())
+    add(b"3 0 obj<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>endobj\n")
+    for i, text in enumerate(pages):
+        lines = [_pdf_escape(text[j:j + line_chars]) for j in range(0, len(text), line_chars)]
+        stream = ("BT /F1 10 Tf 12 TL 40 760 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode()
+        add(f"{4 + 2 * i} 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]"
+            f"/Resources<</Font<</F1 3 0 R>>>>/Contents {5 + 2 * i} 0 R>>endobj\n".encode())
+        add(f"{5 + 2 * i} 0 obj<</Length {len(stream)}>>stream\n".encode() + stream + b"\nendstream endobj\n")
+
+    xref = sum(len(part) for part in out)
+    table = "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out.append(
+        f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n{table}"
+        f"trailer<</Size {len(offsets) + 1}/Root 1 0 R>>\nstartxref\n{xref}\n%%EOF".encode()
+    )
+    return b"".join(out)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
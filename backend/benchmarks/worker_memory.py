@@ -0,0 +1,120 @@
+"""
+Index memory per uvicorn worker, with and without memory-mapped segments.
+
+    python -m benchmarks.worker_memory --workers 4
+    python -m benchmarks.worker_memory --vectors 200000 --workers 1 2 4 --json memory.json
+    python -m benchmarks.worker_memory --index-path faiss_index --workers 4
+
+Starts N fresh processes that each open the same index (like N workers),
+run a few hybrid searches so the pages are actually touched, and then, while
+all N are alive, read their RSS and PSS from /proc/self/smaps_rollup. PSS
+splits shared pages between the processes mapping them, so the sum of PSS is
+what the host really spends. Mode "imports" opens no index and is the
+per-process floor (Python, numpy, FAISS, LangChain).
+
+Without --index-path a synthetic index (--vectors random vectors with
+generated text) is built in a temporary directory first. Linux only.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import offline
+
+MODES = ("imports", "mmap", "no-mmap")
+
+
+def memory_mb() -> dict:
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower()] = int(rest.split()[0]) / 1024
+    return values
+
+
+def worker(index_path: str, mode: str, dim: int, barrier, results):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.services.index_manager import IndexManager
+
+    manager = None
+    if mode != "imports":
+        manager = IndexManager(index_path, DeterministicFakeEmbedding(size=dim), use_mmap=mode == "mmap", watch_interval=0)
+        snapshot = manager.current()
+        rng = np.random.default_rng(os.getpid())
+        for _ in range(5):
+            snapshot.hybrid_search("member council misconduct", rng.random(dim, dtype=np.float32), 4, 20, 60)
+
+    barrier.wait()  # Everyone is loaded: PSS now reflects the sharing
+    results.put(memory_mb())
+    barrier.wait()
+
+
+def measure(index_path: str, mode: str, workers: int, dim: int) -> dict:
+    ctx = mp.get_context("spawn")  # Fresh interpreters: nothing inherited from this process
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(index_path, mode, dim, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    samples = [results.get(timeout=600) for _ in procs]
+    for p in procs:
+        p.join()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "rss_mb_per_worker": round(sum(s["rss"] for s in samples) / workers, 1),
+        "pss_mb_per_worker": round(sum(s["pss"] for s in samples) / workers, 1),
+        "pss_mb_total": round(sum(s["pss"] for s in samples), 1),
+    }
+
+
+def build_synthetic(index_path: str, vectors: int, dim: int):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.services.index_manager import IndexManager, chunk_hash
+
+    started = time.perf_counter()
+    texts = [page[:1000] for page in offline.document_pages(1, vectors, words_per_page=150)]
+    manager = IndexManager(index_path, DeterministicFakeEmbedding(size=dim), watch_interval=0)
+    manager.add_embeddings(
+        texts,
+        np.random.default_rng(0).random((vectors, dim), dtype=np.float32),
+        [{"chunk_hash": chunk_hash(t)} for t in texts],
+    )
+    print(f"🏗️ Built a {vectors}-vector index in {time.perf_counter() - started:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index-path", help="measure an existing index instead of a synthetic one")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="worker-memory-") as scratch:
+        index_path = args.index_path or scratch
+        offline.configure_environment(index_path)
+        if not args.index_path:
+            build_synthetic(index_path, args.vectors, args.dim)
+
+        rows = [measure(index_path, mode, n, args.dim) for n in args.workers for mode in MODES]
+
+    print(f"\n{'mode':<9} {'workers':>7} {'RSS/worker':>11} {'PSS/worker':>11} {'PSS total':>10}")
+    for row in rows:
+        print(f"{row['mode']:<9} {row['workers']:>7} {row['rss_mb_per_worker']:>9.0f}MB "
+              f"{row['pss_mb_per_worker']:>9.0f}MB {row['pss_mb_total']:>8.0f}MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Exports the embedding model to ONNX and quantizes its weights to int8,
+for EMBEDDING_BACKEND=onnx.
+
+    python -m scripts.export_onnx_model
+    python -m scripts.export_onnx_model --out models/all-MiniLM-L6-v2-onnx
+
+Needs torch, transformers, onnx and onnxruntime, so run it once on a build
+machine; the CPU nodes that serve traffic then only need onnxruntime and
+tokenizers. Check the result with `python -m benchmarks.embedding_backends`.
+"""
+import argparse
+import os
+import time
+
+from app.core.config import settings
+from app.services.embedding_backends import ONNX_MODEL_FILE, TOKENIZER_FILE
+
+FP32_MODEL_FILE = "model.fp32.onnx"
+PREPROCESSED_MODEL_FILE = "model.fp32.prep.onnx"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--out", default=settings.EMBEDDING_ONNX_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(args.out, exist_ok=True)
+    started = time.perf_counter()
+
+    # 1. Export the transformer; pooling + normalisation happen in OnnxEmbeddings
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModel.from_pretrained(args.model).eval()
+    sample = tokenizer(["Section 22 defines professional misconduct."], return_tensors="pt")
+    inputs = ("input_ids", "attention_mask", "token_type_ids")
+    dynamic = {"batch": 0, "tokens": 1}
+    fp32_path = os.path.join(args.out, FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in inputs),
+            fp32_path,
+            input_names=list(inputs),
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {v: k for k, v in dynamic.items()} for name in (*inputs, "last_hidden_state")},
+            opset_version=args.opset,
+        )
+
+    # 2. Dynamic int8 quantization of the weights (activations stay float).
+    #    Shape inference + graph fusion first, as ONNX Runtime recommends.
+    prep_path = os.path.join(args.out, PREPROCESSED_MODEL_FILE)
+    int8_path = os.path.join(args.out, ONNX_MODEL_FILE)
+    quant_pre_process(fp32_path, prep_path)
+    quantize_dynamic(prep_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    os.remove(prep_path)
+
+    # 3. The fast tokenizer, readable by the `tokenizers` package alone
+    tokenizer.save_pretrained(args.out)
+    if not os.path.exists(os.path.join(args.out, TOKENIZER_FILE)):
+        raise SystemExit(f"❌ {args.model} has no fast tokenizer ({TOKENIZER_FILE}); can't use the ONNX backend.")
+
+    size_mb = os.path.getsize(int8_path) / 1e6
+    print(f"✅ Wrote {int8_path} ({size_mb:.1f} MB) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
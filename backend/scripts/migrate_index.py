@@ -0,0 +1,57 @@
+"""
+Rebuilds the on-disk FAISS index with a different index type.
+
+    python -m scripts.migrate_index --type hnsw
+    python -m scripts.migrate_index --type ivfpq --nlist 4096 --nprobe 32
+
+Vectors are read back out of the existing segments, so nothing is re-embedded;
+each collection becomes one segment of the new type. Run it from the `backend/` directory. Remember to set INDEX_TYPE (and the
+matching INDEX_* knobs) in `.env` afterwards so compaction keeps using it.
+"""
+import argparse
+import dataclasses
+import time
+
+from app.services.ann_index import INDEX_TYPES
+from app.services.vector_service import get_index_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", choices=INDEX_TYPES, required=True)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--pq-m", type=int)
+    args = parser.parse_args()
+
+    overrides = {
+        "type": args.type,
+        "hnsw_m": args.hnsw_m,
+        "hnsw_ef_construction": args.ef_construction,
+        "hnsw_ef_search": args.ef_search,
+        "ivf_nlist": args.nlist,
+        "ivf_nprobe": args.nprobe,
+        "pq_m": args.pq_m,
+    }
+    index_manager = get_index_manager()
+    spec = dataclasses.replace(index_manager.spec, **{k: v for k, v in overrides.items() if v is not None})
+
+    before = index_manager.current()
+    total = sum(s.store.index.ntotal for s in before.segments)
+    print(f"🔁 Rebuilding {len(before.segments)} segments ({total} vectors) as {spec}")
+
+    started = time.perf_counter()
+    infos = index_manager.rebuild(spec)
+    if infos is None:
+        print("Nothing to migrate (empty index, or another process changed it mid-way).")
+        return
+    for info in infos:
+        print(f"✅ Wrote {info.name} for '{info.collection}' ({info.count} vectors, {info.type})")
+    print(f"⏱️ Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
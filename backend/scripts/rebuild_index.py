@@ -0,0 +1,191 @@
+"""
+Rebuilds the FAISS index from the chunk vectors stored in Mongo.
+
+    python -m scripts.rebuild_index
+    python -m scripts.rebuild_index --type ivfpq --nlist 4096
+
+Unlike `migrate_index`, this doesn't need the old index at all: it streams
+`embedding_chunks` through a cursor (in (document_id, chunk_index) order,
+served by the compound index) and adds the vectors to a fresh index in
+batches, so nothing is re-parsed or re-embedded. Chunk texts go straight to
+the new segment's files on disk and duplicate detection uses a temporary
+SQLite table, so besides the FAISS index itself only one vector batch is in
+memory. Only documents with status "indexed" are included, and each
+collection is built as its own index (one segment per collection). Run it
+from the `backend/` directory.
+"""
+import argparse
+import asyncio
+import dataclasses
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from beanie.operators import In
+from langchain_core.documents import Document
+
+from app.db.client import init_db
+from app.models.knowledge import DocumentItem, EmbeddingChunk, IngestionJob
+from app.services.ann_index import INDEX_TYPES, create_index, ivfpq_min_training
+from app.services.vector_service import chunk_metadata, get_index_manager
+
+# Vectors handed to `index.add` at a time
+ADD_BATCH_SIZE = 4096
+
+
+async def load_training_sample(document_ids: list, spec) -> np.ndarray | None:
+    if spec.type != "ivfpq":
+        return None
+    # Exactly what training needs: with fewer points create_index falls back to flat
+    size = ivfpq_min_training(spec)
+    pipeline = [{"$match": {"document_id": {"$in": document_ids}}}, {"$sample": {"size": size}}, {"$project": {"vector": 1}}]
+    rows = await EmbeddingChunk.get_motor_collection().aggregate(pipeline).to_list(length=None)
+    if not rows:
+        return None
+    return np.vstack([np.frombuffer(row["vector"], dtype="<f4") for row in rows])
+
+
+@contextmanager
+def seen_hashes():
+    """Content hashes already written, kept on disk: `add` returns False for a repeat."""
+    with tempfile.TemporaryDirectory(prefix="rebuild-") as scratch:
+        db = sqlite3.connect(os.path.join(scratch, "seen.db"))
+        db.execute("CREATE TABLE seen (hash TEXT PRIMARY KEY)")
+
+        class Seen:
+            @staticmethod
+            def add(content_hash: str) -> bool:
+                return db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (content_hash,)).rowcount == 1
+
+        try:
+            yield Seen
+        finally:
+            db.close()
+
+
+def add_batch(index, writer, pending: list):
+    batch = np.vstack(pending)
+    index.add(batch)
+    writer.add_vectors(batch)  # Kept for IVF-PQ, so compaction can merge the segment again
+    pending.clear()
+
+
+async def build_collection(collection: str, document_ids: list, spec):
+    """Streams one collection's chunks into a new segment on disk; None if it has no stored vectors."""
+    # Train (IVF-PQ only) on a random sample, then stream everything in
+    first = await EmbeddingChunk.find_one(In(EmbeddingChunk.document_id, document_ids))
+    if first is None:
+        return None
+    index = create_index(first.dim, spec, training=await load_training_sample(document_ids, spec))
+
+    writer = get_index_manager().store.begin_segment(collection)
+    pending, duplicates = [], 0
+    try:
+        with seen_hashes() as seen:
+            cursor = EmbeddingChunk.find(In(EmbeddingChunk.document_id, document_ids)).sort(
+                +EmbeddingChunk.document_id, +EmbeddingChunk.chunk_index
+            )
+            async for chunk in cursor:
+                if not seen.add(chunk.content_hash):
+                    duplicates += 1
+                    continue
+                writer.add(
+                    Document(
+                        page_content=chunk.text,
+                        metadata=chunk_metadata(chunk.content_hash, str(chunk.document_id), collection, chunk.page),
+                    ),
+                    chunk.content_hash,
+                )
+                pending.append(chunk.as_array())
+                if len(pending) >= ADD_BATCH_SIZE:
+                    add_batch(index, writer, pending)
+            if pending:
+                add_batch(index, writer, pending)
+        info = writer.finish(index)
+    except BaseException:
+        writer.abort()
+        raise
+
+    print(f"📥 '{collection}': streamed {info.count} chunks from Mongo ({duplicates} duplicates dropped).")
+    return info
+
+
+async def find_missing(documents: list) -> list:
+    """
+    Indexed documents with no stored vectors. A document whose chunks were all
+    already in the knowledge base embedded nothing and legitimately has none.
+    """
+    persisted = set(await EmbeddingChunk.distinct("document_id"))
+    without = [doc.id for doc in documents if doc.id not in persisted]
+    if not without:
+        return []
+    jobs = IngestionJob.find(In(IngestionJob.document_id, without), IngestionJob.status == "indexed")
+    all_skipped = {job.document_id async for job in jobs if job.chunks_embedded == 0}
+    return [id for id in without if id not in all_skipped]
+
+
+async def rebuild(spec, allow_missing: bool):
+    # 1. Which documents should be in the index, and do we have vectors for all of them?
+    documents = [doc async for doc in DocumentItem.find(DocumentItem.status == "indexed")]
+    missing = await find_missing(documents)
+    if missing and not allow_missing:
+        print(f"❌ {len(missing)} indexed documents have no stored vectors (uploaded before vectors were persisted).")
+        print("   Re-upload them, or pass --allow-missing to rebuild without them.")
+        return
+
+    # 2. One index per collection (the shards chats are scoped to)
+    by_collection = {}
+    for doc in documents:
+        by_collection.setdefault(doc.collection, []).append(doc.id)
+    index_manager = get_index_manager()
+    written = []
+    try:
+        for collection, document_ids in sorted(by_collection.items()):
+            info = await build_collection(collection, document_ids, spec)
+            if info is not None:
+                written.append(info)
+    except BaseException:
+        for info in written:  # Unpublished: nothing else knows about them
+            index_manager.store.remove_segment(info.name)
+        raise
+    if not written:
+        print("Nothing to rebuild (no stored vectors).")
+        return
+
+    # 3. Publish them in place of everything currently on disk
+    infos = index_manager.replace_all(written)
+    if infos is None:
+        for info in written:
+            index_manager.store.remove_segment(info.name)
+        print("Another process changed the index mid-way; run again.")
+        return
+    for info in infos:
+        print(f"✅ Wrote {info.name} for '{info.collection}' ({info.count} vectors, {info.type})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", choices=INDEX_TYPES, help="defaults to INDEX_TYPE")
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="rebuild even if some indexed documents have no stored vectors")
+    args = parser.parse_args()
+
+    overrides = {"type": args.type, "ivf_nlist": args.nlist, "pq_m": args.pq_m}
+    spec = dataclasses.replace(get_index_manager().spec, **{k: v for k, v in overrides.items() if v is not None})
+
+    async def run():
+        await init_db()
+        await rebuild(spec, args.allow_missing)
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    print(f"⏱️ Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+Settings are read once, at import time, and refuse to load without a Mongo
+URI and a Groq key: point them at throwaway values before anything under
+`app.` is imported. Nothing here talks to Mongo or Groq.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("INDEX_PATH", tempfile.mkdtemp(prefix="test-index-"))
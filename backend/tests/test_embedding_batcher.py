@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from typing import Any
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.embedding_service import EmbeddingBatcher, EmbeddingBatcherStopped
+
+
+class GatedEmbedding(DeterministicFakeEmbedding):
+    """Records batch sizes; blocks in the model call while `gate` is clear."""
+    batches: list = []
+    gate: Any = None
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        self.gate.wait(timeout=5)
+        return super().embed_documents(texts)
+
+
+def make_batcher(**kwargs):
+    embeddings = GatedEmbedding(size=8, batches=[], gate=threading.Event())
+    options = dict(max_batch_size=32, max_wait_ms=20, max_queue=100)
+    options.update(kwargs)
+    return EmbeddingBatcher(embeddings, **options), embeddings
+
+
+def test_concurrent_queries_share_a_batch():
+    async def run():
+        batcher, embeddings = make_batcher()
+        embeddings.gate.set()
+        batcher.start()
+        vectors = await asyncio.gather(*(batcher.aembed_query(f"q{i}") for i in range(5)))
+        await batcher.stop()
+        return vectors, embeddings.batches
+
+    vectors, batches = asyncio.run(run())
+    assert batches == [5]
+    assert vectors[0] == DeterministicFakeEmbedding(size=8).embed_query("q0")
+
+
+def test_sync_call_on_the_batcher_loop_does_not_deadlock():
+    async def run():
+        batcher, embeddings = make_batcher()
+        embeddings.gate.set()
+        batcher.start()
+        try:
+            # e.g. sync LangChain code calling embed_query inside a coroutine
+            return batcher.embed_query("on the loop")
+        finally:
+            await batcher.stop()
+
+    assert len(asyncio.run(run())) == 8
+
+
+def test_stop_fails_queued_and_in_flight_requests():
+    async def run():
+        batcher, embeddings = make_batcher(max_batch_size=1)
+        batcher.start()
+        loop = asyncio.get_running_loop()
+        # A worker thread blocks on the batcher: its batch is embedding when stop() comes
+        in_flight = loop.run_in_executor(None, batcher.embed_documents, ["in flight"])
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(batcher.aembed_query("queued"))
+        await asyncio.sleep(0.05)
+
+        await batcher.stop()
+        embeddings.gate.set()
+        return await asyncio.gather(in_flight, queued, return_exceptions=True)
+
+    in_flight, queued = asyncio.run(run())
+    assert isinstance(in_flight, EmbeddingBatcherStopped)
+    assert isinstance(queued, EmbeddingBatcherStopped)
@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.ann_index import IndexSpec, create_index, ivfpq_min_training
+from app.services.index_manager import IndexManager
+from app.services.segment_store import LEGACY_PLACEHOLDER_TEXT
+
+DIM = 16
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=DIM)
+
+
+def make_manager(path, embeddings) -> IndexManager:
+    # Compaction only when a test asks for it
+    return IndexManager(str(path), embeddings, compaction_max_segments=1000, watch_interval=3600)
+
+
+def add(manager: IndexManager, embeddings, texts: list[str], collection: str = "default"):
+    vectors = embeddings.embed_documents(texts)
+    return manager.add_embeddings(texts, vectors, [{"source": t} for t in texts], collection=collection)
+
+
+def contents(version, embeddings) -> set[str]:
+    return {doc.page_content for doc, _ in version.search_by_vector(embeddings.embed_query("x"), k=100)}
+
+
+def test_add_compact_and_reload_from_another_manager(tmp_path, embeddings):
+    writer = make_manager(tmp_path, embeddings)
+    for batch in (["alpha", "beta"], ["gamma"], ["delta", "epsilon"]):
+        add(writer, embeddings, batch)
+    add(writer, embeddings, ["zeta"], collection="tax")
+    assert len(writer.current().segments) == 4
+
+    writer.compact()
+    compacted = writer.current()
+    # The three default segments become one; the lone "tax" segment is left alone
+    assert sorted(s.collection for s in compacted.segments) == ["default", "tax"]
+    assert compacted.collections() == {"default": 5, "tax": 1}
+
+    reader = make_manager(tmp_path, embeddings)
+    reloaded = reader.current()
+    assert reloaded.version == compacted.version
+    assert [s.name for s in reloaded.segments] == [s.name for s in compacted.segments]
+    assert contents(reloaded, embeddings) == {"alpha", "beta", "gamma", "delta", "epsilon", "zeta"}
+
+    # Hits carry the stored metadata and the exact vectors survive the merge
+    top, score = reloaded.search_by_vector(embeddings.embed_query("gamma"), k=1)[0]
+    assert top.page_content == "gamma" and top.metadata["source"] == "gamma"
+    assert score == pytest.approx(0.0, abs=1e-5)
+
+
+def test_second_manager_picks_up_new_versions(tmp_path, embeddings):
+    writer = make_manager(tmp_path, embeddings)
+    reader = make_manager(tmp_path, embeddings)
+    add(writer, embeddings, ["alpha"])
+    assert reader.current().collections() == {"default": 1}
+
+    add(writer, embeddings, ["beta"])
+    assert reader.refresh()
+    assert contents(reader.current(), embeddings) == {"alpha", "beta"}
+    assert not reader.refresh()
+
+
+def test_migrates_save_local_layout_without_the_placeholder(tmp_path, embeddings):
+    legacy = FAISS.from_texts([LEGACY_PLACEHOLDER_TEXT], embeddings)
+    legacy.add_texts(["Section 1: scope", "Section 2: definitions"], metadatas=[{"page": 1}, {"page": 2}])
+    legacy.save_local(str(tmp_path))
+
+    version = make_manager(tmp_path, embeddings).current()
+    assert not os.path.exists(tmp_path / "index.faiss")
+    assert not os.path.exists(tmp_path / "index.pkl")
+    assert [s.name for s in version.segments] == ["seg-0000000000000-legacy"]
+    assert contents(version, embeddings) == {"Section 1: scope", "Section 2: definitions"}
+
+    top, _ = version.search_by_vector(embeddings.embed_query("Section 2: definitions"), k=1)[0]
+    assert top.metadata["page"] == 2
+
+    # A second worker starting later sees the migrated segment, not a second migration
+    again = make_manager(tmp_path, embeddings).current()
+    assert [s.name for s in again.segments] == ["seg-0000000000000-legacy"]
+    assert again.version == version.version
+
+
+def test_placeholder_only_legacy_index_is_dropped(tmp_path, embeddings):
+    FAISS.from_texts([LEGACY_PLACEHOLDER_TEXT], embeddings).save_local(str(tmp_path))
+
+    version = make_manager(tmp_path, embeddings).current()
+    assert version.segments == ()
+    assert not os.path.exists(tmp_path / "index.faiss")
+
+
+def test_incomplete_legacy_index_does_not_break_startup(tmp_path, embeddings):
+    FAISS.from_texts(["orphan"], embeddings).save_local(str(tmp_path))
+    os.remove(tmp_path / "index.pkl")
+
+    manager = make_manager(tmp_path, embeddings)
+    assert manager.current().segments == ()
+    assert os.path.exists(tmp_path / "index.faiss")  # Left for an operator to look at
+
+    add(manager, embeddings, ["alpha"])
+    assert manager.current().collections() == {"default": 1}
+
+
+# Small enough to train on a few hundred points: 39 * max(4 lists, 2^4 codes) = 624
+IVFPQ = IndexSpec(type="ivfpq", ivf_nlist=4, pq_m=4, pq_nbits=4)
+
+
+def test_ivfpq_needs_enough_training_points():
+    training = np.random.default_rng(0).random((ivfpq_min_training(IVFPQ), DIM), dtype=np.float32)
+    assert ivfpq_min_training(IVFPQ) == 624
+    assert type(create_index(DIM, IVFPQ, training=training[:-1])).__name__ == "IndexFlatL2"
+    assert type(create_index(DIM, IVFPQ, training=training)).__name__ == "IndexIVFPQ"
+
+
+def test_ivfpq_segments_are_compacted_again(tmp_path, embeddings):
+    manager = IndexManager(str(tmp_path), embeddings, spec=IVFPQ, compaction_max_segments=1000, watch_interval=3600)
+    for batch in range(3):
+        add(manager, embeddings, [f"chunk {batch}-{i}" for i in range(250)])
+    manager.compact()
+    [first] = manager.store.read_manifest().segments
+    assert (first.type, first.count) == ("ivfpq", 750)
+
+    # New small segments get merged into the IVF-PQ one from its exact vectors
+    add(manager, embeddings, ["late 1", "late 2"])
+    add(manager, embeddings, ["late 3"])
+    manager.compact()
+    [merged] = manager.store.read_manifest().segments
+    assert (merged.type, merged.count) == ("ivfpq", 753)
+    vectors = manager.store.load_vectors(merged.name)
+    assert np.array_equal(vectors[0], np.float32(embeddings.embed_query("chunk 0-0")))
+    assert np.array_equal(vectors[-1], np.float32(embeddings.embed_query("late 3")))
+
+
+def test_small_compaction_with_ivfpq_configured_stays_flat(tmp_path, embeddings):
+    manager = IndexManager(str(tmp_path), embeddings, spec=IVFPQ, compaction_max_segments=1000, watch_interval=3600)
+    add(manager, embeddings, ["alpha", "beta"])
+    add(manager, embeddings, ["gamma"])
+    manager.compact()
+    [segment] = manager.store.read_manifest().segments
+    assert (segment.type, segment.count) == ("flat", 3)
+    assert manager.store.load_vectors(segment.name) is None
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import ingestion_service
+from app.services.ingestion_service import IngestionInterrupted, IngestionQueue, fail_stale_jobs
+
+
+@pytest.fixture
+def mongo():
+    """Runs `test()` with Beanie on an in-memory Mongo."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from beanie import init_beanie
+    from app.models.knowledge import DocumentItem, EmbeddingChunk, IngestionJob
+
+    def run(test):
+        async def main():
+            await init_beanie(database=mongomock_motor.AsyncMongoMockClient()["test"],
+                              document_models=[DocumentItem, EmbeddingChunk, IngestionJob])
+            return await test()
+        return asyncio.run(main())
+
+    return run
+
+
+async def new_job(tmp_path, name: str, **job_fields):
+    from beanie import PydanticObjectId
+    from app.models.knowledge import DocumentItem, IngestionJob
+
+    user_id = PydanticObjectId()
+    doc = DocumentItem(user_id=user_id, filename=name, file_type="application/pdf", content="", file_size=1)
+    await doc.insert()
+    job = IngestionJob(document_id=doc.id, user_id=user_id, **job_fields)
+    await job.insert()
+    path = tmp_path / name
+    path.write_bytes(b"%PDF-1.4")
+    return job, str(path)
+
+
+async def statuses(job) -> tuple[str, str]:
+    from app.models.knowledge import DocumentItem, IngestionJob
+    job = await IngestionJob.get(job.id)
+    return job.status, (await DocumentItem.get(job.document_id)).status
+
+
+def test_finished_job_is_indexed_and_its_file_removed(mongo, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion_service, "_ingest", lambda *args: None)
+
+    async def test():
+        queue = IngestionQueue(workers=1, max_queued=4, progress_interval=0.05)
+        queue.start()
+        job, path = await new_job(tmp_path, "a.pdf")
+        queue.submit(job, path)
+        await asyncio.wait_for(queue._queue.join(), timeout=5)
+        await asyncio.sleep(0.01)  # The file goes in the thread's done callback
+        await queue.stop()
+        return await statuses(job), os.path.exists(path)
+
+    assert mongo(test) == (("indexed", "indexed"), False)
+
+
+def test_stop_fails_running_and_queued_jobs(mongo, tmp_path, monkeypatch):
+    seen_file = []
+
+    def slow_ingest(path, document_id, collection, progress, loop, stopping):
+        while not stopping.wait(0.01):
+            pass
+        seen_file.append(os.path.exists(path))  # Still there while the thread runs
+        raise IngestionInterrupted("Interrupted by server shutdown")
+
+    monkeypatch.setattr(ingestion_service, "_ingest", slow_ingest)
+
+    async def test():
+        queue = IngestionQueue(workers=1, max_queued=4, progress_interval=0.05)
+        queue.start()
+        jobs = [await new_job(tmp_path, f"{i}.pdf") for i in range(3)]
+        for job, path in jobs:
+            queue.submit(job, path)
+        await asyncio.sleep(0.1)  # First job running, the others queued
+        await queue.stop()
+        await asyncio.sleep(0.01)
+        return [await statuses(job) for job, _ in jobs], [os.path.exists(path) for _, path in jobs]
+
+    job_statuses, files = mongo(test)
+    assert job_statuses == [("failed", "failed")] * 3
+    assert files == [False] * 3
+    assert seen_file == [True]
+
+
+def test_stale_jobs_are_failed_and_live_ones_left_alone(mongo, tmp_path):
+    async def test():
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        stale, _ = await new_job(tmp_path, "stale.pdf", status="processing", heartbeat_at=long_ago)
+        orphan, _ = await new_job(tmp_path, "orphan.pdf", status="pending", heartbeat_at=long_ago)
+        live, _ = await new_job(tmp_path, "live.pdf", status="processing")
+        done, _ = await new_job(tmp_path, "done.pdf", status="indexed", heartbeat_at=long_ago)
+
+        failed = await fail_stale_jobs()
+        return failed, [(await statuses(job))[0] for job in (stale, orphan, live, done)]
+
+    failed, job_statuses = mongo(test)
+    assert failed == 2
+    assert job_statuses == ["failed", "failed", "processing", "indexed"]
+
+
+def test_queue_heartbeats_the_jobs_it_holds(mongo, tmp_path, monkeypatch):
+    def blocked_ingest(path, document_id, collection, progress, loop, stopping):
+        stopping.wait(5)
+
+    monkeypatch.setattr(ingestion_service, "_ingest", blocked_ingest)
+
+    async def test():
+        from app.models.knowledge import IngestionJob
+        queue = IngestionQueue(workers=1, max_queued=4, progress_interval=0.05)
+        queue.start()
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        jobs = [(await new_job(tmp_path, f"{i}.pdf", heartbeat_at=long_ago))[0] for i in range(2)]
+        for i, job in enumerate(jobs):
+            queue.submit(job, str(tmp_path / f"{i}.pdf"))
+        await asyncio.sleep(0.2)
+        beats = [(await IngestionJob.get(job.id)).heartbeat_at for job in jobs]
+        stale = await fail_stale_jobs()
+        await queue.stop()
+        return beats, stale
+
+    beats, stale = mongo(test)
+    assert all(beat > datetime.utcnow() - timedelta(seconds=5) for beat in beats)  # Running and queued
+    assert stale == 0
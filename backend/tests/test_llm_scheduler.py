@@ -0,0 +1,333 @@
+import asyncio
+import time
+from typing import Any
+
+import groq
+import httpx
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.services.llm_scheduler import (
+    LLMOverloadedError, LLMScheduler, LLMUnavailableError, Priority, TokenBucket,
+)
+
+
+def api_error(status: int, retry_after: str | None = None) -> groq.APIStatusError:
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "http://groq.test"))
+    return groq.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+class ScriptedModel(BaseChatModel):
+    """
+    Stub chat model. Each call takes the next entry of `script`: an exception
+    to raise, or a reply. Calls record (question, start time) and, while
+    `gate` is set, wait on it before answering.
+    """
+    script: list = []
+    calls: list = []
+    gate: Any = None
+    chunks_before_error: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _next(self, messages):
+        self.calls.append((messages[-1].content, time.monotonic()))
+        if self.gate is not None:
+            await self.gate.wait()
+        outcome = self.script.pop(0) if self.script else "ok"
+        return outcome
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        outcome = await self._next(messages)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=outcome))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        outcome = await self._next(messages)
+        if isinstance(outcome, BaseException):
+            for i in range(self.chunks_before_error):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=f"part{i} "))
+            raise outcome
+        for word in outcome.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def make_scheduler(model, **kwargs) -> LLMScheduler:
+    options = dict(max_concurrency=4, max_retries=3, backoff_base=0.01, backoff_max=1.0, max_queue_wait=5.0)
+    options.update(kwargs)
+    return LLMScheduler(model, "test-model", **options)
+
+
+def ask(text: str) -> list:
+    return [HumanMessage(content=text)]
+
+
+# --- Token buckets ---
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)  # 1 per second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    # Larger than the bucket: waits for a full bucket instead of forever
+    assert bucket.wait_time(600, now + 60) == 0
+
+
+def test_token_bucket_zero_is_unlimited():
+    bucket = TokenBucket(per_minute=0)
+    bucket.take(10_000, time.monotonic())
+    assert bucket.wait_time(10_000, time.monotonic()) == 0
+
+
+def test_requests_per_minute_spaces_out_calls():
+    async def run():
+        model = ScriptedModel()
+        scheduler = make_scheduler(model, requests_per_minute=600)  # 10/s once the burst is spent
+        scheduler._requests.level = 1
+        await asyncio.gather(scheduler.ainvoke(ask("a"), Priority.ANSWER), scheduler.ainvoke(ask("b"), Priority.ANSWER))
+        return model.calls
+
+    (_, first), (_, second) = asyncio.run(run())
+    assert second - first >= 0.08
+
+
+# --- Priorities, concurrency and admission ---
+
+def test_waiting_calls_are_admitted_by_priority():
+    async def run():
+        model = ScriptedModel(gate=asyncio.Event())
+        scheduler = make_scheduler(model, max_concurrency=1)
+        blocker = asyncio.create_task(scheduler.ainvoke(ask("blocker"), Priority.ANSWER))
+        await asyncio.sleep(0.01)  # Holds the only slot
+        waiting = [
+            asyncio.create_task(scheduler.ainvoke(ask(name), priority))
+            for name, priority in [("summary", Priority.SUMMARY), ("rewrite", Priority.REWRITE), ("answer", Priority.ANSWER)]
+        ]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["queue_depth"] == 3
+        model.gate.set()
+        await asyncio.gather(blocker, *waiting)
+        return [question for question, _ in model.calls]
+
+    assert asyncio.run(run()) == ["blocker", "answer", "rewrite", "summary"]
+
+
+def test_queue_wait_limit_raises_overloaded():
+    async def run():
+        model = ScriptedModel(gate=asyncio.Event())
+        scheduler = make_scheduler(model, max_concurrency=1, max_queue_wait=0.05)
+        blocker = asyncio.create_task(scheduler.ainvoke(ask("blocker"), Priority.ANSWER))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.ainvoke(ask("late"), Priority.REWRITE)
+        assert scheduler.stats()["queue_depth"] == 0  # Its entry was removed
+        model.gate.set()
+        await blocker
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects_new_calls():
+    async def run():
+        model = ScriptedModel(gate=asyncio.Event())
+        scheduler = make_scheduler(model, max_concurrency=1, max_queue=1)
+        tasks = [asyncio.create_task(scheduler.ainvoke(ask(f"q{i}"), Priority.ANSWER)) for i in range(2)]
+        await asyncio.sleep(0.01)  # q0 running, q1 queued
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.ainvoke(ask("q2"), Priority.ANSWER)
+        model.gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+# --- Coalescing ---
+
+def test_identical_prompts_share_one_call():
+    async def run():
+        model = ScriptedModel(script=["same answer"], gate=asyncio.Event())
+        scheduler = make_scheduler(model)
+        tasks = [asyncio.create_task(scheduler.ainvoke(ask("same"), Priority.ANSWER)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        return await asyncio.gather(*tasks), model.calls, scheduler.stats()
+
+    answers, calls, stats = asyncio.run(run())
+    assert answers == ["same answer"] * 3
+    assert len(calls) == 1
+    assert stats["coalesced_total"] == 2
+
+
+def test_late_stream_subscriber_replays_from_the_start():
+    async def run():
+        model = ScriptedModel(script=["one two three"], gate=asyncio.Event())
+        scheduler = make_scheduler(model)
+
+        async def collect():
+            return "".join([chunk async for chunk in scheduler.astream(ask("q"), Priority.ANSWER)])
+
+        first = asyncio.create_task(collect())
+        await asyncio.sleep(0.01)
+        model.gate.set()
+        await asyncio.sleep(0)
+        second = asyncio.create_task(collect())
+        return await asyncio.gather(first, second), model.calls
+
+    (first, second), calls = asyncio.run(run())
+    assert first == second == "one two three "
+    assert len(calls) == 1
+
+
+def test_call_is_cancelled_when_every_subscriber_leaves():
+    async def run():
+        model = ScriptedModel(gate=asyncio.Event())
+        scheduler = make_scheduler(model)
+        task = asyncio.create_task(scheduler.ainvoke(ask("q"), Priority.ANSWER))
+        await asyncio.sleep(0.01)
+        flight = next(iter(scheduler._flights.values()))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return flight, scheduler
+
+    flight, scheduler = asyncio.run(run())
+    assert flight.task.cancelled()
+    assert not scheduler._flights
+    assert scheduler.stats()["active"] == 0
+
+
+# --- Retries, 429 cooldown and backoff ---
+
+def test_429_honours_retry_after_for_every_caller():
+    async def run():
+        model = ScriptedModel(script=[api_error(429, retry_after="0.3"), "ok", "ok"])
+        scheduler = make_scheduler(model, max_concurrency=1)
+        first = asyncio.create_task(scheduler.ainvoke(ask("a"), Priority.ANSWER))
+        await asyncio.sleep(0.05)  # "a" got its 429; the cooldown now applies to "b" too
+        second = asyncio.create_task(scheduler.ainvoke(ask("b"), Priority.ANSWER))
+        await asyncio.gather(first, second)
+        return model.calls, scheduler.stats()
+
+    calls, stats = asyncio.run(run())
+    started = calls[0][1]
+    assert [q for q, _ in calls[:1]] == ["a"]
+    assert all(t - started >= 0.3 for _, t in calls[1:])
+    assert stats["rate_limited_total"] == 1
+    assert stats["retries_total"] == 1
+
+
+def test_retryable_errors_give_up_after_max_retries():
+    async def run():
+        model = ScriptedModel(script=[api_error(503)] * 10)
+        scheduler = make_scheduler(model, max_retries=2)
+        with pytest.raises(LLMUnavailableError):
+            await scheduler.ainvoke(ask("q"), Priority.ANSWER)
+        return model.calls, scheduler.stats()
+
+    calls, stats = asyncio.run(run())
+    assert len(calls) == 3
+    assert stats["retries_total"] == 2
+    assert stats["active"] == 0
+
+
+def test_client_errors_are_not_retried():
+    async def run():
+        model = ScriptedModel(script=[api_error(400)])
+        scheduler = make_scheduler(model)
+        with pytest.raises(LLMUnavailableError):
+            await scheduler.ainvoke(ask("q"), Priority.ANSWER)
+        return model.calls
+
+    assert len(asyncio.run(run())) == 1
+
+
+def test_stream_is_not_retried_once_chunks_went_out():
+    async def run():
+        model = ScriptedModel(script=[api_error(503), "never"], chunks_before_error=1)
+        scheduler = make_scheduler(model)
+        received = []
+        with pytest.raises(LLMUnavailableError):
+            async for chunk in scheduler.astream(ask("q"), Priority.ANSWER):
+                received.append(chunk)
+        return received, model.calls
+
+    received, calls = asyncio.run(run())
+    assert received == ["part0 "]
+    assert len(calls) == 1
+
+
+def test_backoff_is_jittered_and_bounded():
+    scheduler = make_scheduler(ScriptedModel(), backoff_base=0.5, backoff_max=4.0)
+    for attempt in range(6):
+        delays = [scheduler._backoff(attempt, None) for _ in range(200)]
+        assert all(0 <= d <= min(4.0, 0.5 * 2 ** attempt) for d in delays)
+        assert len(set(delays)) > 1
+    # Retry-After wins (capped by backoff_max), plus a little jitter
+    assert 2.0 <= scheduler._backoff(0, 2.0) <= 2.5
+    assert scheduler._backoff(0, 60.0) <= 4.5
+
+
+# --- Against the fake Groq endpoint (real ChatGroq client over HTTP) ---
+
+def fake_groq_model(**fake_options):
+    from langchain_groq import ChatGroq
+    from benchmarks.fake_groq import create_app
+
+    app = create_app(latency_ms=0, tokens_per_second=10_000, answer_tokens=5, **fake_options)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    model = ChatGroq(model_name="test-model", groq_api_key="test", base_url="http://fake-groq",
+                     http_async_client=client, max_retries=0)
+    return model, app
+
+
+def test_fake_groq_answers_through_the_scheduler():
+    async def run():
+        model, _ = fake_groq_model()
+        scheduler = make_scheduler(model)
+        answer = await scheduler.ainvoke(ask("What is Section 22?"), Priority.ANSWER)
+        streamed = [chunk async for chunk in scheduler.astream(ask("What is Section 22?"), Priority.ANSWER)]
+        return answer, streamed
+
+    answer, streamed = asyncio.run(run())
+    assert len(answer.split()) == 5
+    assert "".join(streamed) == answer
+
+
+def test_fake_groq_errors_are_retried_then_reported():
+    async def run():
+        model, app = fake_groq_model(error_rate=1.0)
+        scheduler = make_scheduler(model, max_retries=2)
+        with pytest.raises(LLMUnavailableError):
+            await scheduler.ainvoke(ask("q"), Priority.ANSWER)
+        stats = await httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake-groq").get("/stats")
+        return stats.json()
+
+    stats = asyncio.run(run())
+    assert stats["requests"] == 3
+    assert stats["errors"] == 3
+
+
+def test_fake_groq_rate_limit_sets_the_cooldown():
+    async def run():
+        model, _ = fake_groq_model(rpm=1)
+        scheduler = make_scheduler(model, max_retries=0)
+        await scheduler.ainvoke(ask("first"), Priority.ANSWER)
+        with pytest.raises(LLMUnavailableError) as raised:
+            await scheduler.ainvoke(ask("second"), Priority.ANSWER)
+        return raised.value, scheduler
+
+    error, scheduler = asyncio.run(run())
+    assert error.retry_after and error.retry_after > 50  # Fake Groq's window is a minute
+    assert scheduler.stats()["rate_limited_total"] == 1
+    assert scheduler._cooldown_until > time.monotonic() + 50
@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from beanie import PydanticObjectId
+from fastapi import FastAPI
+
+from app.services.pagination import CURSOR_HEADER, decode_cursor, encode_cursor, seek_filter
+
+
+def test_cursor_round_trip():
+    value = datetime(2024, 5, 1, 12, 30, 45, 123000)
+    id = PydanticObjectId()
+    cursor = encode_cursor(value, id)
+    assert "=" not in cursor  # Safe in a query string as is
+    assert decode_cursor(cursor) == (value, id)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "Zm9v", encode_cursor(datetime(2024, 1, 1), PydanticObjectId())[:-3]])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    with pytest.raises(ValueError):
+        seek_filter("timestamp", cursor, "$lt")
+
+
+# --- Through the endpoints (in-memory Mongo) ---
+
+@pytest.fixture
+def api():
+    """Runs `test(client, chat, user)` against the chat router on an in-memory Mongo."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from beanie import init_beanie
+    from app.api import deps
+    from app.api.v1.endpoints import chat as chat_endpoints
+    from app.models.chat import Chat, Message
+    from app.models.user import User
+
+    def run(test):
+        async def main():
+            await init_beanie(database=mongomock_motor.AsyncMongoMockClient()["test"], document_models=[User, Chat, Message])
+            user = User(email="reader@example.com", hashed_password="x")
+            await user.insert()
+            chat = Chat(user_id=user.id)
+            await chat.insert()
+
+            app = FastAPI()
+            app.include_router(chat_endpoints.router, prefix="/chats")
+            app.dependency_overrides[deps.get_current_user] = lambda: user
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await test(client, chat, user)
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def add_messages(chat, timestamps: list[datetime]) -> list[str]:
+    from app.models.chat import Message
+    contents = [f"m{i}" for i in range(len(timestamps))]
+    for content, timestamp in zip(contents, timestamps):
+        await Message(chat_id=chat.id, role="user", content=content, timestamp=timestamp).insert()
+    return contents
+
+
+async def page_through(client, url: str, param: str, cursor: str | None = None) -> list[list[str]]:
+    pages = []
+    while True:
+        params = {"limit": 2, **({param: cursor} if cursor else {})}
+        response = await client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append([m["content"] for m in response.json()])
+        cursor = response.headers.get(CURSOR_HEADER)
+        if not cursor:
+            return pages
+
+
+def test_malformed_cursor_is_a_400(api):
+    async def test(client, chat, user):
+        for url in (f"/chats/{chat.id}/messages", "/chats/"):
+            for param in ("before", "after"):
+                response = await client.get(url, params={param: "garbage"})
+                assert response.status_code == 400, (url, param)
+
+    api(test)
+
+
+def test_history_pages_through_equal_timestamps(api):
+    async def test(client, chat, user):
+        # A question and its answer often share a timestamp; _id must break the tie
+        same = datetime(2024, 5, 1, 12, 0, 0)
+        contents = await add_messages(chat, [same - timedelta(seconds=1)] + [same] * 4)
+        url = f"/chats/{chat.id}/messages"
+
+        latest = await client.get(url, params={"limit": 2})
+        assert [m["content"] for m in latest.json()] == contents[-2:]
+
+        backwards = await page_through(client, url, "before", latest.headers[CURSOR_HEADER])
+        older = [content for page in reversed(backwards) for content in page]
+        assert older == contents[:-2]  # Each message exactly once, oldest -> newest
+
+    api(test)
+
+
+def test_history_pages_forwards_with_after(api):
+    async def test(client, chat, user):
+        same = datetime(2024, 5, 1, 12, 0, 0)
+        contents = await add_messages(chat, [same] * 5)
+        from app.models.chat import Message
+        oldest = await Message.find(Message.chat_id == chat.id).sort(+Message.timestamp, +Message.id).first_or_none()
+        cursor = encode_cursor(oldest.timestamp, oldest.id)
+
+        pages = await page_through(client, f"/chats/{chat.id}/messages", "after", cursor)
+        assert [content for page in pages for content in page] == contents[1:]
+
+    api(test)
+
+
+def test_chats_keep_accepting_skip(api):
+    async def test(client, chat, user):
+        from app.models.chat import Chat
+        for i in range(3):
+            await Chat(user_id=user.id, title=f"chat {i}", updated_at=datetime(2024, 1, 1 + i)).insert()
+
+        everything = [c["title"] for c in (await client.get("/chats/")).json()]
+        skipped = [c["title"] for c in (await client.get("/chats/", params={"skip": 1, "limit": 2})).json()]
+        assert skipped == everything[1:3]
+
+    api(test)
@@ -0,0 +1,21 @@
+from app.services.file_service import iter_pdf_pages, shutdown_page_pool
+from app.services.vector_service import split_pages
+from benchmarks.offline import document_pages, make_pdf
+
+
+def test_page_numbers_survive_a_blank_page(tmp_path):
+    first, third = document_pages(1, 2)
+    path = tmp_path / "act.pdf"
+    path.write_bytes(make_pdf([first, "", third]))  # Page 2 has no text (a scan, a divider)
+
+    try:
+        pages = list(iter_pdf_pages(str(path)))
+    finally:
+        shutdown_page_pool()
+    assert [number for number, _ in pages] == [1, 3]
+
+    chunks = list(split_pages(pages))
+    assert {page for _, page in chunks} == {1, 3}
+    # document_pages counts from 0: its "page 1" is the third page of the PDF
+    openings = {chunk.split(".")[0]: page for chunk, page in chunks if chunk.startswith("Document 1 page")}
+    assert openings == {"Document 1 page 0": 1, "Document 1 page 1": 3}
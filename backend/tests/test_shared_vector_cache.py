@@ -0,0 +1,30 @@
+import sqlite3
+import time
+
+from app.services.cache import SharedVectorCache
+
+
+def rows(cache: SharedVectorCache) -> list[str]:
+    return [key for (key,) in sqlite3.connect(cache.path).execute("SELECT key FROM vectors ORDER BY expires_at")]
+
+
+def test_writes_prune_expired_rows_and_keep_max_rows(tmp_path):
+    cache = SharedVectorCache(str(tmp_path / "cache.db"), ttl_seconds=3600, max_rows=3)
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("INSERT INTO vectors VALUES ('expired', x'', ?)", (time.time() - 1,))
+
+    for i in range(5):
+        cache.set(f"q{i}", [float(i)] * 4)
+    assert rows(cache) == ["q2", "q3", "q4"]  # The expired row and the oldest writes are gone
+    assert cache.get("q4") == [4.0] * 4
+
+
+def test_sqlite_errors_are_misses(tmp_path):
+    cache = SharedVectorCache(str(tmp_path / "cache.db"), ttl_seconds=3600, max_rows=10)
+    cache.set("q", [1.0])
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("DROP TABLE vectors")
+
+    cache.set("q", [1.0])  # Doesn't raise into the request
+    assert cache.get("q") is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "errors": 2}